@@ -0,0 +1,395 @@
+import io
+import struct
+import tarfile
+import zipfile
+import zlib
+
+
+# Compressed bytes read at a time
+CHUNK_SIZE = 1024 * 1024
+# Bytes detect() needs, a tar header has its magic at offset 257
+HEADER_SIZE = 512
+
+ZIP_SIGNATURES = (b'PK\x03\x04', b'PK\x05\x06')
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+TAR_MAGIC = b'ustar'
+TAR_MAGIC_OFFSET = 257
+# Records read when walking a zip front to back, see iter_zip_stream
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+LOCAL_SIGNATURE = b'PK\x03\x04'
+DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+CENTRAL_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')
+ZIP64_EXTRA = 0x0001
+
+
+class ArchiveError(ValueError):
+    """Raised for archives in an unknown format, or with members the installer cannot extract."""
+
+
+class NotStreamable(ArchiveError):
+    """Raised when a zip can only be read through its central directory, not as it arrives."""
+
+
+class StreamReader:
+    """Reads a stream of bytes, letting a decoder hand back what it read past the end of a member."""
+
+    def __init__(self, read):
+        self._read = read
+        self.pending = b''
+
+    def read(self, size):
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self._read(size)
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise zipfile.BadZipFile("The archive ended early.")
+            data += chunk
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+    def peek(self, size):
+        """:return: Up to size bytes from the front of the stream, which are still read afterwards."""
+        data = b''
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        self.unread(data)
+        return data
+
+
+class _ZipMember:
+    """
+    Data of one member of a zip read front to back, inflated as it is read. Once the
+    last byte was read its size and CRC-32 are checked against the local header, or
+    against the data descriptor following the data when the header left them out.
+    """
+
+    def __init__(self, reader, name, method, crc, compressed_size, file_size, descriptor, zip64):
+        self.reader = reader
+        self.name = name
+        self.crc = crc
+        self.file_size = file_size
+        self.descriptor = descriptor
+        self.zip64 = zip64
+        # What the local header says about the content before it was read
+        self.header_crc = None if descriptor else crc
+        self.decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        # Compressed bytes left, unknown when a data descriptor follows
+        self.remaining = None if descriptor else compressed_size
+        self.size = 0
+        self.running_crc = 0
+        self.started = False
+        self.finished = False
+
+    def _next(self, size):
+        self.started = True
+        if self.decompressor is None:
+            if not self.remaining:
+                return b''
+            data = self.reader.read(min(size, self.remaining))
+            if not data:
+                raise zipfile.BadZipFile("The archive ended early.")
+            self.remaining -= len(data)
+            return data
+        if self.decompressor.eof:
+            return b''
+        raw = self.decompressor.unconsumed_tail
+        if not raw:
+            raw = self.reader.read(CHUNK_SIZE if self.remaining is None else min(CHUNK_SIZE, self.remaining))
+            if not raw:
+                raise zipfile.BadZipFile(f"The data of {self.name} ended early.")
+            if self.remaining is not None:
+                self.remaining -= len(raw)
+        try:
+            data = self.decompressor.decompress(raw, size)
+        except zlib.error as e:
+            raise zipfile.BadZipFile(f"The data of {self.name} is damaged: {e}") from e
+        if self.decompressor.eof and self.decompressor.unused_data:
+            # Whatever follows the deflate stream is the next record
+            self.reader.unread(self.decompressor.unused_data)
+        return data
+
+    def read(self, size=CHUNK_SIZE):
+        """:return: Up to size bytes of the member's content, b'' once all of it was read."""
+        while not self.finished:
+            data = self._next(size)
+            if data:
+                self.size += len(data)
+                self.running_crc = zlib.crc32(data, self.running_crc)
+                return data
+            if self.decompressor is None or self.decompressor.eof:
+                self._finish()
+        return b''
+
+    def _finish(self):
+        self.finished = True
+        if self.descriptor:
+            field = self.reader.read_exact(4)
+            # The descriptor signature is optional
+            if field == DESCRIPTOR_SIGNATURE:
+                field = self.reader.read_exact(4)
+            self.crc = struct.unpack('<L', field)[0]
+            sizes = self.reader.read_exact(16 if self.zip64 else 8)
+            self.file_size = struct.unpack('<QQ' if self.zip64 else '<LL', sizes)[1]
+        if self.running_crc != self.crc or self.size != self.file_size:
+            raise zipfile.BadZipFile(f"Bad CRC-32 or size for {self.name}.")
+
+    def skip(self):
+        """Moves past the rest of the member; when its compressed size is known, without inflating it."""
+        if self.finished:
+            return
+        if not self.started and self.remaining is not None:
+            while self.remaining:
+                data = self.reader.read(min(CHUNK_SIZE, self.remaining))
+                if not data:
+                    raise zipfile.BadZipFile("The archive ended early.")
+                self.remaining -= len(data)
+            self.finished = True
+            return
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+def _zip64_sizes(extra, compressed_size, file_size):
+    position = 0
+    while position + 4 <= len(extra):
+        kind, length = struct.unpack('<HH', extra[position:position + 4])
+        if kind == ZIP64_EXTRA:
+            values = extra[position + 4:position + 4 + length]
+            # Only the fields the header left at 0xFFFFFFFF are present, uncompressed size first
+            if file_size == 0xFFFFFFFF:
+                file_size, values = struct.unpack('<Q', values[:8])[0], values[8:]
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = struct.unpack('<Q', values[:8])[0]
+            return compressed_size, file_size, True
+        position += 4 + length
+    return compressed_size, file_size, False
+
+
+def iter_zip_stream(read):
+    """
+    Walks a zip archive front to back through its local file headers, yielding
+    (name, member) while the bytes arrive; whatever the consumer leaves unread of a
+    member is skipped. Stops at the central directory without reading it.
+
+    :param read: Callable returning up to n bytes of the archive.
+    :raises NotStreamable: For members whose end cannot be found without the central
+                           directory, or that only zipfile can decode.
+    """
+    reader = StreamReader(read)
+    while True:
+        signature = reader.read_exact(4)
+        if signature in CENTRAL_SIGNATURES:
+            return
+        if signature != LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile("Unexpected record in the archive.")
+        _, _, flags, method, _, _, crc, compressed_size, file_size, name_length, extra_length = \
+            LOCAL_HEADER.unpack(signature + reader.read_exact(LOCAL_HEADER.size - 4))
+        name = reader.read_exact(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        compressed_size, file_size, zip64 = _zip64_sizes(reader.read_exact(extra_length), compressed_size,
+                                                         file_size)
+        descriptor = bool(flags & 0x08)
+        if flags & 0x01:
+            raise NotStreamable(f"{name} is encrypted.")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise NotStreamable(f"{name} uses compression method {method}.")
+        # Stored data has no end marker; only directory entries are known to be empty
+        if descriptor and method == zipfile.ZIP_STORED and not name.endswith('/'):
+            raise NotStreamable(f"{name} is stored without its size in the local header.")
+        member = _ZipMember(reader, name, method, crc, compressed_size, file_size, descriptor, zip64)
+        yield name, member
+        member.skip()
+
+
+class _Readable(io.RawIOBase):
+    """File object over a read(size) callable, for tarfile and zstandard."""
+
+    def __init__(self, read):
+        super().__init__()
+        self._read = read
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _TarMember:
+    """Data of a regular file in a tar stream; tar keeps no checksum of it, the CRC-32 is computed while reading."""
+
+    def __init__(self, file, info, errors):
+        self.file = file
+        self.errors = errors
+        self.file_size = info.size
+        self.header_crc = None
+        self.size = 0
+        self.crc = 0
+
+    def read(self, size=CHUNK_SIZE):
+        if self.file is None:
+            return b''
+        try:
+            data = self.file.read(size)
+        except self.errors as e:
+            raise ArchiveError(f"The archive is damaged: {e}") from e
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+
+class Backend:
+    """
+    An archive format builds can come in. Every backend walks an archive front to
+    back as it arrives; random_access ones can also be opened from a file and read
+    in any order, which extractor uses to inflate members in parallel.
+    """
+
+    name = None
+    # File name endings, to recognise an archive wrapped in another one
+    suffixes = ()
+    random_access = False
+    # Optional package the format needs, imported only when such an archive shows up
+    requires = None
+
+    def matches(self, header):
+        """Whether header, the first HEADER_SIZE bytes of a file, starts an archive of this format."""
+        raise NotImplementedError
+
+    def available(self):
+        return True
+
+    def iter_members(self, read):
+        """
+        Walks an archive front to back, yielding (name, member) while the bytes arrive;
+        directory names end with '/'. member.read(size) returns the content, b'' at the
+        end; member.file_size and member.header_crc are the size and CRC-32 known up front
+        or None, member.size and member.crc the actual ones once everything was read.
+
+        :param read: Callable returning up to n bytes of the archive, b'' at its end.
+        :raises ArchiveError: For members that cannot be extracted this way.
+        """
+        raise NotImplementedError
+
+
+class ZipBackend(Backend):
+    name = 'zip'
+    suffixes = ('.zip',)
+    random_access = True
+
+    def matches(self, header):
+        return header[:4] in ZIP_SIGNATURES
+
+    def iter_members(self, read):
+        return iter_zip_stream(read)
+
+
+class TarBackend(Backend):
+    name = 'tar'
+    suffixes = ('.tar',)
+    # Exceptions of the decompressor, reported as a damaged archive
+    errors = (tarfile.TarError, EOFError)
+
+    def matches(self, header):
+        return header[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + len(TAR_MAGIC)] == TAR_MAGIC
+
+    def _open(self, read):
+        return _Readable(read)
+
+    def iter_members(self, read):
+        try:
+            stream = self._open(read)
+            # Stream mode reads strictly forward, skipping whatever a member left unread
+            with tarfile.open(fileobj=stream, mode='r|', bufsize=CHUNK_SIZE) as archive:
+                for info in archive:
+                    if info.isdir():
+                        yield info.name.rstrip('/') + '/', _TarMember(None, info, self.errors)
+                    elif info.isfile():
+                        yield info.name, _TarMember(archive.extractfile(info), info, self.errors)
+                    else:
+                        raise ArchiveError(f"{info.name} is a link or special file.")
+            # tar has no checksums; a compressor checks its own at the end of the stream,
+            # past the end-of-archive blocks tarfile stops at
+            while stream.read(CHUNK_SIZE):
+                pass
+        except self.errors as e:
+            raise ArchiveError(f"The archive is damaged: {e}") from e
+
+
+def _zstandard():
+    import zstandard
+    return zstandard
+
+
+class TarZstBackend(TarBackend):
+    """tar compressed with Zstandard, decompressed as a stream while the archive arrives."""
+
+    name = 'tar.zst'
+    suffixes = ('.tar.zst', '.tzst')
+    requires = 'zstandard'
+
+    def matches(self, header):
+        return header[:4] == ZSTD_MAGIC
+
+    def available(self):
+        try:
+            _zstandard()
+        except ImportError:
+            return False
+        return True
+
+    @property
+    def errors(self):
+        return TarBackend.errors + (_zstandard().ZstdError,)
+
+    def _open(self, read):
+        return _zstandard().ZstdDecompressor().stream_reader(_Readable(read), read_size=CHUNK_SIZE)
+
+
+# Most preferred first, for choosing among the assets of a release. Zip leads: only its
+# headers carry a CRC-32 before the data, which lets unchanged and stored files be
+# linked instead of written, and only its central directory allows parallel inflation.
+BACKENDS = (ZipBackend(), TarZstBackend(), TarBackend())
+
+
+def detect(header):
+    """
+    :param header: The first HEADER_SIZE bytes of an archive, fewer if it is shorter.
+    :return: Backend reading the archive.
+    :raises ArchiveError: If no backend knows the format or the one that does is not installed.
+    """
+    for backend in BACKENDS:
+        if backend.matches(header):
+            if not backend.available():
+                raise ArchiveError(f"{backend.name} archives need the {backend.requires} package.")
+            return backend
+    names = [backend.name for backend in BACKENDS]
+    raise ArchiveError(f"Not a {', '.join(names[:-1])} or {names[-1]} archive.")
+
+
+def for_name(name):
+    """:return: The backend whose suffix name has, or None when it does not look like an archive."""
+    for backend in BACKENDS:
+        if name.lower().endswith(backend.suffixes):
+            return backend
+    return None
+
+
+def rank(name):
+    """Sort key preferring the asset whose format extracts fastest, among formats that are installed."""
+    backend = for_name(name)
+    if backend is None or not backend.available():
+        return len(BACKENDS)
+    return BACKENDS.index(backend)
@@ -0,0 +1,534 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import zipfile
+import tempfile
+import subprocess
+import contextlib
+import statistics
+
+import channels
+import engine
+import archives
+import extractor
+import manifest
+import progress
+import fake_github
+import tracing
+import uninstaller
+
+
+PHASES = ('resolve', 'download', 'extract', 'register', 'uninstall')
+DEFAULT_TOLERANCE = 0.25
+# Share of the synthetic uninstall tree that is user data rather than installed files
+USER_DATA_SHARE = 0.2
+FILES_PER_DIRECTORY = 500
+# Stream buffer limits for the streaming benchmark, in MiB, small enough to be exceeded by a careless change
+STREAM_MEMORY_CAP = 4
+STREAM_SCRATCH_CAP = 16
+# Zstandard level of the tar.zst build, the zstd command line tool's default
+ZSTD_LEVEL = 3
+# Seconds importing installer.py and building and showing its window may take
+STARTUP_BUDGET = 0.5
+# Extraction thread counts compared on the large build
+WORKER_COUNTS = (1, 2, 4, 8)
+WORKERS_SIZE_MB = 400
+# Run in a fresh interpreter so the imports are really measured
+STARTUP_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv[:1])
+loaded = time.perf_counter()
+import installer
+imported = time.perf_counter()
+window = installer.Installer()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({'qt': loaded - started, 'import': imported - loaded, 'window': shown - imported}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the install phases against a local fake GitHub.")
+    parser.add_argument('--size-mb', type=float, default=100, help="uncompressed size of the synthetic build")
+    parser.add_argument('--files', type=int, default=200, help="number of files in the synthetic build")
+    parser.add_argument('--channel', choices=channels.CHANNELS, action='append',
+                        help="channel to benchmark, may be repeated (default: both)")
+    parser.add_argument('--runs', type=int, default=3, help="runs per channel, the median is reported")
+    parser.add_argument('--rate-mbps', type=float, default=None, help="cap the fake server's rate per connection")
+    parser.add_argument('--mirror-rate-mbps', type=float, action='append', default=[],
+                        help="start a mirror capped at this rate per connection, may be repeated")
+    parser.add_argument('--multi-source', action='store_true', help="download from all mirrors at once")
+    parser.add_argument('--uninstall-files', type=int, default=100000,
+                        help="files in the synthetic tree for the uninstall benchmark, 0 to skip it")
+    parser.add_argument('--stream-memory-cap', type=float, default=STREAM_MEMORY_CAP,
+                        help="MiB of the download the streaming install may hold in memory (default: 4)")
+    parser.add_argument('--stream-scratch-cap', type=float, default=STREAM_SCRATCH_CAP,
+                        help="MiB of scratch space the streaming install may use (default: 16)")
+    parser.add_argument('--zstd-level', type=int, default=ZSTD_LEVEL,
+                        help="compression level of the tar.zst build in the archive format comparison (default: 3)")
+    parser.add_argument('--workers-size-mb', type=float, default=WORKERS_SIZE_MB,
+                        help="uncompressed size of the build the extraction thread counts are compared on, "
+                             "0 to skip it (default: 400)")
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET,
+                        help="fail when importing the installer and showing its window takes longer, in seconds "
+                             "(default: 0.5)")
+    parser.add_argument('--output', default='benchmark-results.json', help="where to write the results")
+    parser.add_argument('--trace', default=None, help="also write a Chrome trace of every run to this file")
+    parser.add_argument('--profile', action='store_true', help="with --trace, also capture cProfile statistics")
+    parser.add_argument('--baseline', default=None, help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline, as a fraction (default: 0.25)")
+    return parser.parse_args(argv)
+
+
+class Timer:
+    def __init__(self):
+        self.timings = {}
+
+    def time(self, phase, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.timings[phase] = time.perf_counter() - started
+        return result
+
+
+def run_once(channel, workdir):
+    """
+    Runs one full install and uninstall phase by phase, then one pipelined install,
+    returning the seconds spent in every phase and in the pipeline.
+    """
+    target = os.path.join(workdir, 'Lemonade')
+    # A fresh cache and metadata folder per run, so the download is really measured
+    os.environ['LEMONADE_CACHE_DIR'] = tempfile.mkdtemp(dir=workdir)
+    timer = Timer()
+    artifact = timer.time('resolve', engine.resolve, channel)
+    archive_path = timer.time('download', engine.download_artifact, artifact)
+    timer.time('extract', engine.extract_artifact, archive_path, target)
+    timer.time('register', lambda: (engine.download_uninstaller(target), engine.register(target)))
+    # Collecting the store's garbage also keeps the next run from linking instead of extracting
+    timer.time('uninstall', lambda: (uninstaller.remove_installation(target), uninstaller.collect_garbage(target)))
+    # The same installation again with the stages overlapping as the installer runs them
+    os.environ['LEMONADE_CACHE_DIR'] = tempfile.mkdtemp(dir=workdir)
+    timer.time('pipeline', engine.install, channel, target, False, False)
+    uninstaller.remove_installation(target)
+    uninstaller.collect_garbage(target)
+    return timer.timings
+
+
+def disk_usage(directory):
+    """Bytes used by the files under directory, counting hard linked files once."""
+    seen = set()
+    total = 0
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            status = os.stat(os.path.join(folder, name))
+            if (status.st_dev, status.st_ino) not in seen:
+                seen.add((status.st_dev, status.st_ino))
+                total += status.st_size
+    return total
+
+
+def run_side_by_side(workdir):
+    """Installs both channels next to each other, timing each and measuring the shared disk usage."""
+    root = tempfile.mkdtemp(dir=workdir)
+    os.environ['LEMONADE_CACHE_DIR'] = tempfile.mkdtemp(dir=workdir)
+    timer = Timer()
+    for channel in channels.CHANNELS:
+        timer.time(channel, engine.install, channel, os.path.join(root, channels.PRODUCT_NAMES[channel]), False, False)
+    installed = sum(disk_usage(os.path.join(root, name)) for name in channels.PRODUCT_NAMES.values())
+    timer.timings['installed_mib'] = installed / (1024 * 1024)
+    timer.timings['on_disk_mib'] = disk_usage(root) / (1024 * 1024)
+    shutil.rmtree(root)
+    return timer.timings
+
+
+def synthetic_install(directory, file_count):
+    """
+    Creates an installation of file_count small files spread over nested folders,
+    with an install manifest listing all but the user data share of them.
+    """
+    installed = {}
+    user_files = int(file_count * USER_DATA_SHARE)
+    folder = None
+    for index in range(file_count):
+        name = f"{'shader-cache' if index < user_files else 'plugins'}/{index // FILES_PER_DIRECTORY}/file{index}.bin"
+        path = os.path.join(directory, *name.split('/'))
+        if os.path.dirname(path) != folder:
+            folder = os.path.dirname(path)
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 64)
+        if index >= user_files:
+            installed[name] = {'size': 64, 'crc32': 0, 'sha256': ''}
+    manifest.save(directory, installed)
+
+
+def run_uninstall(file_count, workdir):
+    """Times removing a synthetic tree the old way and with the manifest-driven uninstaller."""
+    modes = {
+        'rmtree': shutil.rmtree,
+        'serial': lambda directory: uninstaller.remove_installation(directory, workers=1),
+        'parallel': uninstaller.remove_installation,
+        'keep_user_data': lambda directory: uninstaller.remove_installation(directory, keep_user_data=True),
+    }
+    timings = {}
+    for mode, remove in modes.items():
+        directory = os.path.join(workdir, 'uninstall-' + mode)
+        synthetic_install(directory, file_count)
+        started = time.perf_counter()
+        remove(directory)
+        timings[mode] = time.perf_counter() - started
+        shutil.rmtree(directory, ignore_errors=True)
+    return timings
+
+
+def run_streaming(fake, channel, workdir, memory_cap, scratch_cap):
+    """
+    Installs channel through cli.py in a fresh process, once downloading the archive
+    first and once extracting it while it streams in under the given caps (MiB), so
+    the peak RSS belongs to the installation alone and not to the fake server.
+
+    :return: Dict of mode ('downloaded' or 'streamed') to its seconds, peak RSS and
+             peak stream buffer and scratch usage in MiB.
+    """
+    environment = dict(os.environ, LEMONADE_RELEASES_API_URL=fake.releases_url,
+                       LEMONADE_NIGHTLY_URL=fake.nightly_url,
+                       LEMONADE_INSTALLER_RELEASES_API_URL=fake.installer_releases_url)
+    modes = {
+        'downloaded': [],
+        'streamed': ['--stream', '--memory-cap', str(memory_cap), '--scratch-cap', str(scratch_cap)],
+    }
+    results = {}
+    for mode, options in modes.items():
+        environment['LEMONADE_CACHE_DIR'] = tempfile.mkdtemp(dir=workdir)
+        target = os.path.join(workdir, 'Lemonade-' + mode)
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py'),
+                                    '--channel', channel, '--target', target, '--no-shortcuts', '--json-progress']
+                                   + options, env=environment, capture_output=True, text=True)
+        seconds = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"The {mode} {channel} install failed: {completed.stderr}")
+        usage = json.loads(completed.stdout.splitlines()[-1])['usage']
+        results[mode] = {'install': seconds}
+        results[mode].update({key + '_mib': (usage[key] or 0) / (1024 * 1024) for key in usage})
+        uninstaller.remove_installation(target)
+        uninstaller.collect_garbage(target)
+    return results
+
+
+def streaming_limits_exceeded(results, memory_cap, scratch_cap):
+    """
+    :return: List of (name, peak MiB, limit MiB) of the streamed installs that held
+             more than their caps; a single chunk may exceed the memory cap.
+    """
+    memory_limit = max(memory_cap, progress.MAX_CHUNK_SIZE / (1024 * 1024))
+    exceeded = []
+    for name, values in results['results'].items():
+        if not name.endswith('_streamed'):
+            continue
+        if values['peak_buffered_mib'] > memory_limit:
+            exceeded.append((name + ' peak_buffered', values['peak_buffered_mib'], memory_limit))
+        if values['peak_scratch_mib'] > scratch_cap:
+            exceeded.append((name + ' peak_scratch', values['peak_scratch_mib'], scratch_cap))
+    return exceeded
+
+
+def build_formats(size, file_count, zstd_level):
+    """
+    The synthetic build in every format archives can read, plus the zip in a zip
+    nightly.link serves. tar.zst is left out without the zstandard package.
+
+    :return: Dict of format name to archive bytes.
+    """
+    build = fake_github.synthetic_build(size, file_count)
+    formats = {'zip': build, 'nightly_zip': fake_github.nightly_artifact(build),
+               'tar': fake_github.synthetic_tar(size, file_count)}
+    if archives.TarZstBackend().available():
+        formats['tar_zst'] = fake_github.synthetic_tar(size, file_count, zstd_level=zstd_level)
+    else:
+        logging.warning("Skipping tar.zst in the format comparison, zstandard is not installed.")
+    return formats
+
+
+def decompress(path):
+    """Reads every member of the build front to back without writing it, returning the bytes inflated."""
+    total = 0
+    with open(path, 'rb') as file:
+        for _, member in extractor.iter_build_members(file.read):
+            for data in iter(lambda: member.read(extractor.CHUNK_SIZE), b''):
+                total += len(data)
+    return total
+
+
+def run_formats(size, file_count, zstd_level, runs, workdir):
+    """
+    Compares the archive formats on the same build: archive size, the throughput of
+    decompressing it front to back on one thread, and the time extract_artifact takes
+    to install it, which inflates zip members in parallel.
+
+    :return: Dict of 'format_<name>' to its archive MiB, decompression MiB/s and extract seconds.
+    """
+    results = {}
+    for name, data in build_formats(size, file_count, zstd_level).items():
+        path = os.path.join(workdir, 'build-' + name)
+        decompressed, extract_times = [], []
+        for _ in range(runs):
+            with open(path, 'wb') as file:
+                file.write(data)
+            started = time.perf_counter()
+            inflated = decompress(path)
+            decompressed.append(inflated / (time.perf_counter() - started) / (1024 * 1024))
+            target = tempfile.mkdtemp(dir=workdir)
+            started = time.perf_counter()
+            extractor.extract_artifact(path, target)
+            extract_times.append(time.perf_counter() - started)
+            shutil.rmtree(target)
+        os.remove(path)
+        results['format_' + name] = {'archive_mib': len(data) / (1024 * 1024),
+                                     'decompress_mibps': statistics.median(decompressed),
+                                     'extract': statistics.median(extract_times)}
+    return results
+
+
+def extractall_then_move(archive_path, extract_to):
+    """
+    The extraction the installer did before extractor.py: everything is extracted to a
+    temp folder, a nested zip is extracted again from there, and the files are then
+    moved or copied out of the lemonade-windows-msvc* folder.
+
+    :return: Number of bytes written to disk.
+    """
+    written = 0
+    temp_folder = tempfile.mkdtemp(dir=os.path.dirname(extract_to))
+    with zipfile.ZipFile(archive_path) as archive:
+        archive.extractall(temp_folder)
+        written += sum(info.file_size for info in archive.infolist())
+    nested_path = next((os.path.join(folder, name) for folder, _, names in os.walk(temp_folder)
+                        for name in names if name.endswith('.zip')), None)
+    os.makedirs(extract_to, exist_ok=True)
+    if nested_path:
+        with zipfile.ZipFile(nested_path) as nested:
+            nested.extractall(extract_to)
+            written += sum(info.file_size for info in nested.infolist())
+    else:
+        written += _move_or_copy(temp_folder, extract_to)
+    nested_dir = next((name for name in os.listdir(extract_to) if extractor.NESTED_DIR_MARKER in name and
+                       os.path.isdir(os.path.join(extract_to, name))), None)
+    if nested_dir:
+        written += _move_or_copy(os.path.join(extract_to, nested_dir), extract_to)
+        shutil.rmtree(os.path.join(extract_to, nested_dir))
+    shutil.rmtree(temp_folder)
+    return written
+
+
+def _move_or_copy(source, destination):
+    """Moves folders and copies files like the old installer, returning the bytes copied."""
+    copied = 0
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            shutil.move(path, os.path.join(destination, name))
+        else:
+            shutil.copy2(path, os.path.join(destination, name))
+            copied += os.path.getsize(path)
+    return copied
+
+
+def run_extraction(size, file_count, runs, workdir):
+    """
+    Compares extract_artifact with the old extractall-then-move extraction on the
+    release zip and the zip in a zip nightly.link serves.
+
+    :return: Dict of 'extraction_<name>' to the median seconds and the MiB written by both.
+    """
+    build = fake_github.synthetic_build(size, file_count)
+    results = {}
+    for name, data in (('zip', build), ('nightly_zip', fake_github.nightly_artifact(build))):
+        path = os.path.join(workdir, 'build-' + name)
+        timings = {'extractall': [], 'single_pass': []}
+        for _ in range(runs):
+            for mode, extract in (('extractall', extractall_then_move), ('single_pass', extractor.extract_artifact)):
+                with open(path, 'wb') as file:
+                    file.write(data)
+                target = tempfile.mkdtemp(dir=workdir)
+                started = time.perf_counter()
+                written = extract(path, target)
+                timings[mode].append(time.perf_counter() - started)
+                shutil.rmtree(target)
+                results.setdefault('extraction_' + name, {})[mode + '_written_mib'] = written / (1024 * 1024)
+        os.remove(path)
+        for mode, samples in timings.items():
+            results['extraction_' + name][mode] = statistics.median(samples)
+    return results
+
+
+def run_workers(size, file_count, runs, workdir, worker_counts=WORKER_COUNTS):
+    """
+    Extracts the same zip build with different numbers of extraction threads, to show
+    how the parallel extractor scales and whether its default is well chosen.
+
+    :return: Dict of 'workers_<count>' to the median extract seconds and MiB/s.
+    """
+    path = os.path.join(workdir, 'build-workers.zip')
+    with open(path, 'wb') as file:
+        file.write(fake_github.synthetic_build(size, file_count))
+    results = {}
+    for workers in worker_counts:
+        samples = []
+        for _ in range(runs):
+            target = tempfile.mkdtemp(dir=workdir)
+            started = time.perf_counter()
+            written = extractor.extract_artifact(path, target, workers=workers)
+            samples.append(time.perf_counter() - started)
+            shutil.rmtree(target)
+        seconds = statistics.median(samples)
+        results[f'workers_{workers}'] = {'extract': seconds, 'extract_mibps': written / seconds / (1024 * 1024)}
+    os.remove(path)
+    return results
+
+
+def run_startup(runs):
+    """
+    Times starting the installer window on Qt's offscreen platform: loading Qt,
+    importing installer.py, then building and showing the window.
+
+    :return: Median seconds of every step, or None when PyQt6 or the generated image_assets.py is missing.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.exists(os.path.join(directory, 'image_assets.py')):
+        logging.warning("Skipping the startup benchmark, run imagedata.py first.")
+        return None
+    environment = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=directory, env=environment,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            logging.warning(f"Skipping the startup benchmark, the installer did not start: {completed.stderr}")
+            return None
+        samples.append(json.loads(completed.stdout.splitlines()[-1]))
+    timings = {step: statistics.median(sample[step] for sample in samples) for step in samples[0]}
+    timings['window_total'] = timings['import'] + timings['window']
+    return timings
+
+
+def run(args):
+    size = int(args.size_mb * 1024 * 1024)
+    rate = int(args.rate_mbps * 1024 * 1024 / 8) if args.rate_mbps else None
+    build = fake_github.synthetic_build(size, args.files)
+    results = {}
+    with contextlib.ExitStack() as stack:
+        fake = stack.enter_context(fake_github.FakeGitHub(build, rate=rate))
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        # Mirrors serve the same files under the same paths, at their own speed
+        mirrors = [stack.enter_context(fake_github.FakeGitHub(build, rate=int(mbps * 1024 * 1024 / 8)))
+                   for mbps in args.mirror_rate_mbps]
+        engine.RELEASES_API_URL = fake.releases_url
+        engine.NIGHTLY_URL = fake.nightly_url
+        engine.INSTALLER_RELEASES_API_URL = fake.installer_releases_url
+        engine.MIRRORS = [mirror.base_url for mirror in mirrors]
+        engine.MULTI_SOURCE = args.multi_source
+        for channel in args.channel or channels.CHANNELS:
+            runs = [run_once(channel, workdir) for _ in range(args.runs)]
+            results[channel] = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+            results[channel]['total'] = sum(results[channel][phase] for phase in PHASES)
+            results[channel]['pipeline'] = statistics.median(run['pipeline'] for run in runs)
+        for channel in args.channel or channels.CHANNELS:
+            streamed = run_streaming(fake, channel, workdir, args.stream_memory_cap, args.stream_scratch_cap)
+            for mode, values in streamed.items():
+                results[f'{channel}_{mode}'] = values
+        results.update(run_extraction(size, args.files, args.runs, workdir))
+        results.update(run_formats(size, args.files, args.zstd_level, args.runs, workdir))
+        if args.workers_size_mb:
+            results.update(run_workers(int(args.workers_size_mb * 1024 * 1024), args.files, args.runs, workdir))
+        if not args.channel or len(set(args.channel)) == len(channels.CHANNELS):
+            results['side_by_side'] = run_side_by_side(workdir)
+        if args.uninstall_files:
+            results['uninstall_tree'] = run_uninstall(args.uninstall_files, workdir)
+    startup = run_startup(args.runs)
+    if startup is not None:
+        results['startup'] = startup
+    return {
+        'config': {
+            'size_mb': args.size_mb,
+            'files': args.files,
+            'archive_bytes': len(build),
+            'runs': args.runs,
+            'uninstall_files': args.uninstall_files,
+            'rate_mbps': args.rate_mbps,
+            'mirror_rates_mbps': args.mirror_rate_mbps,
+            'multi_source': args.multi_source,
+            'startup_budget': args.startup_budget,
+            'stream_memory_cap_mib': args.stream_memory_cap,
+            'stream_scratch_cap_mib': args.stream_scratch_cap,
+            'zstd_level': args.zstd_level,
+            'workers_size_mb': args.workers_size_mb,
+            'default_workers': extractor.DEFAULT_WORKERS,
+        },
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    :return: List of (channel, phase, baseline seconds, current seconds) slower than the tolerance allows.
+    """
+    regressions = []
+    for channel, phases in results['results'].items():
+        for phase, seconds in phases.items():
+            reference = baseline.get('results', {}).get(channel, {}).get(phase)
+            # Throughputs regress by going down, everything else by going up
+            if phase.endswith('_mibps'):
+                slower = reference and seconds < reference / (1 + tolerance)
+            else:
+                slower = reference and seconds > reference * (1 + tolerance)
+            if slower:
+                regressions.append((channel, phase, reference, seconds))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if args.trace:
+        tracing.enable(args.trace, args.profile)
+    results = run(args)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for channel, phases in results['results'].items():
+        print(channel + ': ' + ', '.join(f'{phase} {value:.1f} MiB' if phase.endswith('_mib') else
+                                         f'{phase} {value:.1f} MiB/s' if phase.endswith('_mibps') else
+                                         f'{phase} {value:.3f}s' for phase, value in phases.items()))
+
+    startup = results['results'].get('startup')
+    over_budget = startup is not None and startup['window_total'] > args.startup_budget
+    if over_budget:
+        print(f"OVER BUDGET startup: {startup['window_total']:.3f}s > {args.startup_budget:.3f}s")
+    exceeded = streaming_limits_exceeded(results, args.stream_memory_cap, args.stream_scratch_cap)
+    for name, peak, limit in exceeded:
+        print(f"OVER LIMIT {name}: {peak:.1f} MiB > {limit:.1f} MiB")
+    failed = over_budget or bool(exceeded)
+    if not args.baseline:
+        return 1 if failed else 0
+    with open(args.baseline, 'r') as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for channel, phase, reference, seconds in regressions:
+        print(f"REGRESSION {channel} {phase}: {reference:.3f}s -> {seconds:.3f}s")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
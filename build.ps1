@@ -20,19 +20,24 @@ try {
 $env:Path = [System.Environment]::GetEnvironmentVariable("Path","Machine") + ";" + [System.Environment]::GetEnvironmentVariable("Path","User")
 
 # Install required packages through pip
-pip install pyqt6 pyinstaller pywin32 requests
+pip install pyqt6 pyinstaller pywin32 requests zstandard
 
-# Run imagedata.py to generate image_base64.py
+# Run imagedata.py to generate the pre-scaled logo (image_assets.py) and the splash screen
 & "C:\Users\$env:USERNAME\AppData\Local\Programs\Python\Python312\python.exe" imagedata.py
 
-# Check if image_base64.py was generated successfully
-if (Test-Path "image_base64.py") {
-    Write-Host "image_base64.py generated successfully."
+# Check if image_assets.py was generated successfully
+if ((Test-Path "image_assets.py") -and (Test-Path "splash.png")) {
+    Write-Host "image_assets.py and splash.png generated successfully."
 } else {
-    Write-Error "Failed to generate image_base64.py. Please check imagedata.py for errors."
+    Write-Error "Failed to generate image_assets.py. Please check imagedata.py for errors."
     exit
 }
 
 # Run PyInstaller to build the applications
-pyinstaller --onefile --windowed --icon=lemonade.ico --add-data "lemonade.ico;." installer.py
+# The splash screen shows right away, while the bootloader unpacks Qt
+pyinstaller --onefile --windowed --splash splash.png --icon=lemonade.ico --add-data "lemonade.ico;." installer.py
 pyinstaller --onefile --noconsole --icon=lemonade.ico uninstaller.py
+# Headless installer for scripted rollouts, it never loads Qt
+pyinstaller --onefile --console --icon=lemonade.ico --exclude-module PyQt6 --name installer-cli cli.py
+# Background prefetcher, run it from a scheduled task so updates only need extracting
+pyinstaller --onefile --noconsole --icon=lemonade.ico --exclude-module PyQt6 --name lemonade-prefetch prefetch.py
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import contextlib
+
+
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+INDEX_NAME = 'index.json'
+LOCK_NAME = 'cache.lock'
+
+
+def default_cache_dir():
+    if 'LEMONADE_CACHE_DIR' in os.environ:
+        return os.environ['LEMONADE_CACHE_DIR']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    # Kept outside of the Lemonade folder so clearing the installation does not wipe it
+    return os.path.join(base, 'Lemonade-cache')
+
+
+def default_cache():
+    """Returns the cache used by the installer, honouring LEMONADE_CACHE_DIR and LEMONADE_CACHE_MAX_SIZE (MiB)."""
+    max_size = DEFAULT_MAX_SIZE
+    if 'LEMONADE_CACHE_MAX_SIZE' in os.environ:
+        max_size = int(os.environ['LEMONADE_CACHE_MAX_SIZE']) * 1024 * 1024
+    return ArtifactCache(default_cache_dir(), max_size)
+
+
+def make_key(url, validator):
+    """
+    Builds the cache key of an asset from its URL and whatever identifies its
+    content: an ETag, a size, a published digest or a combination of those.
+    """
+    return hashlib.sha256(f'{url}\n{validator}'.encode('utf-8')).hexdigest()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, dest):
+    """Hard links source to dest, copying instead when the two are on different volumes."""
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+class FileLock:
+    """Exclusive lock on a file, shared between processes and between threads of this one."""
+
+    # One thread lock per lock file, so holding one lock never blocks taking another
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        with self._thread_locks_guard:
+            self._thread_lock = self._thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    def acquire(self, blocking=True):
+        """
+        Takes the lock, waiting for it unless blocking is False.
+
+        :return: True if the lock was taken.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        self.file = None
+        try:
+            self.file = open(self.path, 'a+b')
+            if os.name == 'nt':
+                import msvcrt
+                self.file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        # LK_LOCK gives up after ten seconds, keep waiting
+                        continue
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException as e:
+            if self.file:
+                self.file.close()
+            self._thread_lock.release()
+            # Another process holds it
+            if not blocking and isinstance(e, OSError):
+                return False
+            raise
+        return True
+
+    def release(self):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class ArtifactCache:
+    """
+    Persistent, content-addressed store of downloaded artifacts.
+
+    Blobs live under objects/ named by their SHA-256; index.json maps asset keys
+    (see make_key) to a digest, a size and the last time the entry was used. The
+    least recently used entries are evicted once the total size exceeds max_size.
+    All index updates happen under a file lock so several installers can share the cache.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.objects_dir = os.path.join(directory, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _lock(self):
+        return FileLock(os.path.join(self.directory, LOCK_NAME))
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        path = os.path.join(self.directory, INDEX_NAME)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(index, file)
+        os.replace(temp_path, path)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    @contextlib.contextmanager
+    def _index(self):
+        with self._lock():
+            index = self._load_index()
+            yield index
+            self._save_index(index)
+
+    def lookup(self, key):
+        """
+        :return: Path of the cached blob for key, or None on a miss.
+        """
+        with self._index() as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+            path = self.object_path(entry['digest'])
+            try:
+                if os.path.getsize(path) != entry['size']:
+                    raise OSError("size mismatch")
+            except OSError as e:
+                logging.warning(f"Dropping broken cache entry {key}: {e}")
+                del index[key]
+                return None
+            entry['last_used'] = time.time()
+            return path
+
+    def fetch(self, key, dest):
+        """
+        Places the cached blob for key at dest.
+
+        :return: True on a hit, False on a miss.
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        link_or_copy(path, dest)
+        logging.info(f"Served {dest} from the artifact cache.")
+        return True
+
+    def evict(self, key):
+        """Drops the entry for key, and its blob unless another key still uses it."""
+        with self._index() as index:
+            entry = index.pop(key, None)
+            if entry is None or any(other['digest'] == entry['digest'] for other in index.values()):
+                return
+            try:
+                os.remove(self.object_path(entry['digest']))
+            except OSError as e:
+                logging.error(f"Failed to evict {entry['digest']} from the cache. Reason: {e}")
+                return
+        logging.info(f"Evicted {key} from the artifact cache.")
+
+    def store(self, key, path, digest=None):
+        """
+        Adds the file at path to the cache under key, then evicts the least recently used entries over the cap.
+
+        :param digest: SHA-256 of the file if already known, to avoid hashing it again.
+        :return: Path of the cached blob, or None if the file is larger than the whole cache.
+        """
+        size = os.path.getsize(path)
+        if size > self.max_size:
+            return None
+        digest = digest or file_digest(path)
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            temp_path = f'{object_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            link_or_copy(path, temp_path)
+            os.replace(temp_path, object_path)
+        with self._index() as index:
+            index[key] = {'digest': digest, 'size': size, 'last_used': time.time()}
+            self._evict(index)
+        return object_path
+
+    def _evict(self, index):
+        # Several keys can point at the same blob, count each blob once
+        sizes = {}
+        last_used = {}
+        for entry in index.values():
+            sizes[entry['digest']] = entry['size']
+            last_used[entry['digest']] = max(last_used.get(entry['digest'], 0), entry['last_used'])
+        total_size = sum(sizes.values())
+        for digest in sorted(last_used, key=last_used.get):
+            if total_size <= self.max_size:
+                break
+            for key in [key for key, entry in index.items() if entry['digest'] == digest]:
+                del index[key]
+            try:
+                os.remove(self.object_path(digest))
+            except OSError as e:
+                logging.error(f'Failed to evict {digest} from the cache. Reason: {e}')
+            total_size -= sizes[digest]
+            logging.info(f"Evicted {digest} from the artifact cache.")
@@ -0,0 +1,34 @@
+"""
+Names and locations of every channel, shared by the installer and the uninstaller.
+Kept free of dependencies, so the uninstaller does not bundle requests to read them.
+"""
+import os
+
+
+CHANNELS = ('release', 'nightly')
+# Every channel gets its own folder, shortcuts and programs list entry so both can be installed
+# side by side; release keeps the original names so existing installations are updated in place
+PRODUCT_NAMES = {'release': 'Lemonade', 'nightly': 'Lemonade Nightly'}
+UNINSTALL_KEY_ROOT = r"Software\Microsoft\Windows\CurrentVersion\Uninstall"
+
+
+def default_install_dir(channel='release'):
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, PRODUCT_NAMES[channel])
+
+
+def uninstall_key(channel='release'):
+    return UNINSTALL_KEY_ROOT + '\\' + PRODUCT_NAMES[channel]
+
+
+def shortcut_name(channel='release'):
+    return PRODUCT_NAMES[channel] + '.lnk'
+
+
+def desktop_shortcut_path(channel='release'):
+    return os.path.join(os.environ['USERPROFILE'], 'Desktop', shortcut_name(channel))
+
+
+def start_menu_shortcut_path(channel='release'):
+    return os.path.join(os.environ['APPDATA'], 'Microsoft', 'Windows', 'Start Menu', 'Programs',
+                        shortcut_name(channel))
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+
+import channels
+import engine
+import streaming
+import tracing
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Install or update Lemonade without the installer window.")
+    parser.add_argument('--channel', choices=channels.CHANNELS, default='release',
+                        help="build to install (default: release)")
+    parser.add_argument('--target', default=None,
+                        help="installation directory (default: %%LOCALAPPDATA%%\\Lemonade, "
+                             "or %%LOCALAPPDATA%%\\Lemonade Nightly for nightly)")
+    parser.add_argument('--no-shortcuts', action='store_true',
+                        help="do not create desktop and start menu shortcuts")
+    parser.add_argument('--keep-previous', action='store_true',
+                        help="keep the replaced version next to the installation as <target>.previous")
+    parser.add_argument('--mirror', action='append', default=[],
+                        help="additional host serving the build, may be repeated; the fastest one is used")
+    parser.add_argument('--multi-source', action='store_true',
+                        help="download from several mirrors at once")
+    parser.add_argument('--stream', action='store_true',
+                        help="extract the build while it downloads, for machines short on memory or disk")
+    parser.add_argument('--memory-cap', type=float, default=engine.MEMORY_CAP / 2 ** 20,
+                        help="with --stream, MiB of the download held in memory (also LEMONADE_MEMORY_CAP)")
+    parser.add_argument('--scratch-cap', type=float, default=engine.SCRATCH_CAP / 2 ** 20,
+                        help="with --stream, MiB of scratch disk space once memory is full (also LEMONADE_SCRATCH_CAP)")
+    parser.add_argument('--json-progress', action='store_true',
+                        help="print progress as one JSON object per line on stdout")
+    parser.add_argument('--trace', default=os.environ.get(tracing.TRACE_ENV),
+                        help="write a Chrome trace of every phase to this file (also LEMONADE_TRACE)")
+    parser.add_argument('--profile', action='store_true', default=os.environ.get(tracing.PROFILE_ENV) == '1',
+                        help="with --trace, also write cProfile statistics next to the trace (also LEMONADE_PROFILE=1)")
+    return parser.parse_args(argv)
+
+
+class JsonProgress:
+    """Prints every telemetry event as one JSON line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        # Stages run concurrently and report from their own threads
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        self.write(event.as_dict())
+
+    def write(self, data):
+        with self.lock:
+            self.stream.write(json.dumps(data) + '\n')
+            self.stream.flush()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.trace:
+        tracing.enable(args.trace, args.profile)
+    engine.MIRRORS = engine.MIRRORS + args.mirror
+    engine.MULTI_SOURCE = engine.MULTI_SOURCE or args.multi_source
+    engine.STREAMING = engine.STREAMING or args.stream
+    engine.MEMORY_CAP = int(args.memory_cap * 2 ** 20)
+    engine.SCRATCH_CAP = int(args.scratch_cap * 2 ** 20)
+    json_progress = JsonProgress(sys.stdout) if args.json_progress else None
+    try:
+        target = engine.install(args.channel, args.target, desktop_shortcut=not args.no_shortcuts,
+                                start_menu_shortcut=not args.no_shortcuts, progress_callback=json_progress,
+                                keep_previous=args.keep_previous)
+    except engine.InstallError as e:
+        logging.error(str(e))
+        if json_progress:
+            json_progress.write({'phase': 'error', 'message': str(e)})
+        return 1
+    logging.info(f"Lemonade installed to {target}")
+    if json_progress:
+        json_progress.write({'phase': 'done', 'target': target, 'usage': streaming.usage()})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
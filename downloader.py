@@ -0,0 +1,660 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+import cache
+import http_session
+import mirrors
+import progress as telemetry
+import tracing
+
+
+DEFAULT_CONNECTIONS = 4
+# Files smaller than this are not worth splitting into ranged requests
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+DEFAULT_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# How many bytes a segment may advance before the resume state is flushed again
+STATE_FLUSH_INTERVAL = 1024 * 1024
+# Seconds without data after which a segment moves to another mirror
+STALL_TIMEOUT = 10
+# Multi-source downloads only start segments on mirrors at least this fraction as fast as the fastest
+MULTI_SOURCE_MIN_SHARE = 0.25
+
+
+class ValidatorChanged(Exception):
+    """Raised when the remote file changed while a partial download was on disk."""
+
+
+class IntegrityError(Exception):
+    """Raised when a downloaded file does not match its published SHA-256."""
+
+
+def split_ranges(total_size, connections):
+    """
+    Splits a file of total_size bytes into inclusive (start, end) byte ranges.
+
+    :param total_size: Size of the file in bytes.
+    :param connections: Maximum number of ranges to produce.
+    """
+    count = max(1, min(connections, total_size // MIN_SEGMENT_SIZE))
+    segment_size = total_size // count
+    ranges = []
+    for index in range(count):
+        start = index * segment_size
+        end = total_size - 1 if index == count - 1 else start + segment_size - 1
+        ranges.append((start, end))
+    return ranges
+
+
+def supports_ranges(response):
+    return response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+
+def get_validator(response):
+    """
+    Returns the value usable in an If-Range header for this response, or None.
+    Weak ETags cannot be used with If-Range, so Last-Modified is used instead.
+    """
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def partial_path(url):
+    """
+    Returns a stable download path for url so an interrupted transfer can be resumed by the next run.
+    """
+    folder = os.path.join(tempfile.gettempdir(), 'Lemonade')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.part')
+
+
+def backoff_delay(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+
+
+class ResumeState:
+    """
+    Sidecar file stored next to a partial download recording the URL, the
+    validators and how far every segment got.
+    """
+
+    def __init__(self, path, url, total_size, etag=None, last_modified=None, segments=None):
+        self.path = path
+        self.url = url
+        self.total_size = total_size
+        self.etag = etag
+        self.last_modified = last_modified
+        # Each segment is [start, end, bytes_done]
+        self.segments = segments or []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def sidecar_path(dest):
+        return dest + '.resume'
+
+    @classmethod
+    def load(cls, dest):
+        path = cls.sidecar_path(dest)
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+            return cls(path, data['url'], data['total_size'], data.get('etag'),
+                       data.get('last_modified'), data['segments'])
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"No usable resume state for {dest}: {e}")
+            return None
+
+    @property
+    def validator(self):
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    @property
+    def downloaded(self):
+        return sum(done for _, _, done in self.segments)
+
+    def matches(self, url, total_size, validator):
+        return self.url == url and self.total_size == total_size and validator is not None \
+            and self.validator == validator
+
+    def save(self):
+        with self.lock:
+            data = {
+                'url': self.url,
+                'total_size': self.total_size,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'segments': [list(segment) for segment in self.segments],
+            }
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def discard_partial(dest):
+    for path in (dest, ResumeState.sidecar_path(dest)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class _Progress:
+    """Thread-safe byte counter shared by the segment workers, which also sizes their reads."""
+
+    def __init__(self, total_size, callback, downloaded=0):
+        self.total_size = total_size
+        self.callback = callback
+        self.downloaded = downloaded
+        self.lock = threading.Lock()
+        self.meter = telemetry.ThroughputMeter()
+        self.meter.sample_bytes = downloaded
+
+    def add(self, count):
+        with self.lock:
+            self.downloaded += count
+            downloaded = self.downloaded
+            self.meter.observe(downloaded)
+        tracing.add('downloaded bytes', count)
+        if self.callback:
+            self.callback(downloaded, self.total_size)
+
+    def chunk_size(self):
+        with self.lock:
+            return self.meter.chunk_size()
+
+
+def _iter_chunks(response, progress):
+    """
+    Like iter_content, but every read is sized from the measured throughput so
+    slow links get small reads and fast links are not throttled by tiny ones.
+    """
+    try:
+        while True:
+            data = response.raw.read(progress.chunk_size(), decode_content=True)
+            if not data:
+                break
+            yield data
+    except urllib3.exceptions.HTTPError as e:
+        raise requests.ConnectionError(e) from e
+
+
+class _StreamingHash:
+    """
+    SHA-256 of a segmented download computed while it arrives.
+
+    Bytes written at the hash frontier are hashed straight from memory. Only when
+    the frontier crosses into a region another segment already wrote is that region
+    read back, once, while it is still in the OS cache, so the digest is ready as
+    soon as the last byte lands instead of after a second pass over the file. The
+    read-back goes through one unbuffered handle kept open for the whole download
+    and happens outside the lock, so the other workers keep writing meanwhile.
+    """
+
+    def __init__(self, dest, segments):
+        self.segments = segments
+        self.digest = hashlib.sha256()
+        self.frontier = 0
+        # Index of the segment the frontier is in
+        self.current = 0
+        # Set while one thread reads back; it hashes whatever the counters cover before clearing it
+        self.reading = False
+        self.lock = threading.Lock()
+        self.file = open(dest, 'rb', buffering=0)
+        self._catch_up()
+
+    def _readable(self):
+        """:return: Bytes past the frontier other segments already wrote, called with the lock held."""
+        while self.current < len(self.segments) and self.frontier > self.segments[self.current][1]:
+            self.current += 1
+        if self.current == len(self.segments):
+            return 0
+        start, _, done = self.segments[self.current]
+        return start + done - self.frontier
+
+    def written(self, offset, data):
+        """Called by a worker after data is on disk at offset and its segment counter was advanced."""
+        with self.lock:
+            if offset != self.frontier or self.reading:
+                return
+            self.digest.update(data)
+            self.frontier += len(data)
+            if not self._readable():
+                return
+            self.reading = True
+        self._catch_up()
+
+    def _catch_up(self):
+        while True:
+            with self.lock:
+                count = self._readable()
+                if not count:
+                    self.reading = False
+                    return
+                self.reading = True
+                position = self.frontier
+            # Nothing else moves the frontier or touches the handle while reading is set
+            self.file.seek(position)
+            data = self.file.read(min(1024 * 1024, count))
+            if not data:
+                with self.lock:
+                    self.reading = False
+                return
+            with self.lock:
+                self.digest.update(data)
+                self.frontier += len(data)
+
+    def hexdigest(self):
+        self._catch_up()
+        self.close()
+        return self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+
+def _write_all(file, data):
+    view = memoryview(data)
+    while view:
+        view = view[file.write(view):]
+
+
+def _write_segment(response, dest, segment, state, progress, hasher):
+    start, end, done = segment
+    unsaved = 0
+    # Every worker gets its own unbuffered handle, so the seek + write pairs never
+    # interleave and the hasher can read back whatever the counters cover
+    with open(dest, 'r+b', buffering=0) as file:
+        file.seek(start + done)
+        for data in _iter_chunks(response, progress):
+            data = data[:end - start + 1 - segment[2]]
+            offset = start + segment[2]
+            _write_all(file, data)
+            segment[2] += len(data)
+            hasher.written(offset, data)
+            progress.add(len(data))
+            unsaved += len(data)
+            if state and unsaved >= STATE_FLUSH_INTERVAL:
+                state.save()
+                unsaved = 0
+
+
+class _SourcePool:
+    """
+    URLs a segment can be fetched from, fastest first. A source that fails or
+    stalls is skipped by every segment from then on, as long as another one is left.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.failed = set()
+        self.lock = threading.Lock()
+        # With somewhere to fail over to, a stalled read is given up on quickly
+        self.timeout = (http_session.TIMEOUT, STALL_TIMEOUT) if len(sources) > 1 else http_session.TIMEOUT
+
+    def spread(self):
+        """Number of leading sources fast enough to start segments on; slower ones only serve as failover."""
+        fastest = self.sources[0].throughput
+        return max(1, sum(1 for source in self.sources if source.throughput >= fastest * MULTI_SOURCE_MIN_SHARE))
+
+    def pick(self, preferred):
+        with self.lock:
+            for offset in range(len(self.sources)):
+                source = self.sources[(preferred + offset) % len(self.sources)]
+                if source.url not in self.failed:
+                    return source
+            return self.sources[preferred % len(self.sources)]
+
+    def fail(self, source):
+        """Marks source as failed; returns True if another source is still available."""
+        with self.lock:
+            self.failed.add(source.url)
+            return any(other.url not in self.failed for other in self.sources)
+
+
+def _fetch_segment(session, pool, preferred, dest, segment, state, progress, hasher, retries):
+    attempt = 0
+    while True:
+        start, end, done = segment
+        if start + done > end:
+            return
+        source = pool.pick(preferred)
+        headers = {'Range': f'bytes={start + done}-{end}'}
+        if source.validator:
+            headers['If-Range'] = source.validator
+        try:
+            with tracing.span('segment', 'download', url=source.url, start=start + done, end=end), \
+                    session.get(source.url, headers=headers, stream=True, timeout=pool.timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    if source.validator:
+                        raise ValidatorChanged(f"{source.url} changed since the partial download started")
+                    raise requests.RequestException(f"Server ignored range request for bytes {start + done}-{end}")
+                _write_segment(response, dest, segment, state, progress, hasher)
+            if start + segment[2] > end:
+                logging.debug(f"Segment {start}-{end} completed.")
+                return
+            raise requests.ConnectionError(f"Connection closed early in segment {start}-{end}")
+        except ValidatorChanged:
+            if not pool.fail(source):
+                raise
+            logging.warning(f"{source.url} changed, continuing segment {start}-{end} from another mirror.")
+        except requests.RequestException as e:
+            # Local errors such as a full disk are not the source's fault and are not retried
+            if state:
+                state.save()
+            if pool.fail(source):
+                logging.warning(f"Segment {start}-{end} failed on {source.url} ({e}), continuing from another mirror.")
+                continue
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.warning(f"Segment {start}-{end} failed ({e}), retrying in {delay:.0f}s.")
+            time.sleep(delay)
+
+
+def _download_stream(response, dest, progress):
+    digest = hashlib.sha256()
+    with open(dest, 'wb') as file:
+        for data in _iter_chunks(response, progress):
+            file.write(data)
+            digest.update(data)
+            progress.add(len(data))
+    return digest.hexdigest()
+
+
+def check_digest(dest, digest, expected_digest):
+    """Throws dest away and raises IntegrityError when digest differs from the expected SHA-256."""
+    if expected_digest and not hmac.compare_digest(digest, expected_digest.lower()):
+        discard_partial(dest)
+        raise IntegrityError(f"SHA-256 mismatch for {dest}: expected {expected_digest}, got {digest}")
+
+
+def _probe(session, url, retries):
+    attempt = 0
+    while True:
+        try:
+            response = session.get(url, stream=True)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.warning(f"Request to {url} failed ({e}), retrying in {delay:.0f}s.")
+            time.sleep(delay)
+
+
+def download(url, dest, progress_callback=None, connections=DEFAULT_CONNECTIONS, session=None,
+             resume=False, retries=DEFAULT_RETRIES, response=None, expected_digest=None, mirror_list=None,
+             multi_source=False):
+    """
+    Downloads url to dest, splitting the transfer into parallel ranged requests
+    when the server advertises Accept-Ranges and falling back to a single stream otherwise.
+
+    In resume mode the partial file and a sidecar recording the segment offsets and
+    the ETag/Last-Modified validator are kept on failure; the next call continues with
+    Range + If-Range and only throws the partial file away when the validator changed.
+    When the file changes while it downloads, the partial file is thrown away and the
+    download starts over once from the first byte with a fresh probe.
+
+    :param url: URL of the file to download.
+    :param dest: Path where the file will be written.
+    :param progress_callback: Optional callable receiving (downloaded_bytes, total_bytes).
+    :param connections: Maximum number of parallel connections.
+    :param session: Optional requests.Session, defaults to the shared pooled one.
+    :param resume: Keep partial state on disk and continue from it when possible.
+    :param retries: Number of retries with exponential backoff per request.
+    :param response: Already opened streaming GET of url to use as the probe instead of issuing a new one.
+    :param expected_digest: Published SHA-256 of the file; a mismatch raises IntegrityError right after the last byte.
+    :param mirror_list: Mirrors of url, see mirrors.configured_mirrors. They are probed and
+                        ranked together with url; segments come from the fastest and move
+                        down the ranking when it fails or stalls.
+    :param multi_source: Spread the segments over all ranked sources instead of starting them on the fastest.
+    :return: SHA-256 of the downloaded file, computed while it arrived.
+    """
+    session = session or http_session.get_session()
+    try:
+        return _download(url, dest, progress_callback, connections, session, resume, retries, response,
+                         expected_digest, mirror_list, multi_source)
+    except ValidatorChanged as e:
+        # The partial file is gone already, the probe of the old content is of no use
+        logging.warning(f"{e} Downloading it again from the start.")
+        return _download(url, dest, progress_callback, connections, session, resume, retries, None,
+                         expected_digest, mirror_list, multi_source)
+
+
+def _download(url, dest, progress_callback, connections, session, resume, retries, response, expected_digest,
+              mirror_list, multi_source):
+    sources = mirrors.rank(mirrors.candidates(url, mirror_list), session) if mirror_list else None
+    if sources and response is not None and sources[0].url not in (url, response.url):
+        # A mirror is faster than url, its probe replaces the one already open
+        response.close()
+        response = None
+    response = response or _probe(session, sources[0].url if sources else url, retries)
+    total_size = int(response.headers.get('content-length', 0))
+    validator = get_validator(response)
+    if response.status_code != 200 or not total_size or not supports_ranges(response):
+        logging.info(f"Downloading {url} over a single connection.")
+        discard_partial(dest)
+        progress = _Progress(total_size, progress_callback)
+        with response, tracing.span('stream', 'download', url=url):
+            digest = _download_stream(response, dest, progress)
+        check_digest(dest, digest, expected_digest)
+        return digest
+
+    state = ResumeState.load(dest) if resume and os.path.exists(dest) else None
+    if state and state.matches(url, total_size, validator) and os.path.getsize(dest) == total_size:
+        logging.info(f"Resuming {url} from {state.downloaded} of {total_size} bytes.")
+    else:
+        if state:
+            logging.info(f"{url} changed since the partial download, starting over.")
+        discard_partial(dest)
+        segments = [[start, end, 0] for start, end in split_ranges(total_size, connections)]
+        state = ResumeState(ResumeState.sidecar_path(dest), url, total_size,
+                            response.headers.get('ETag'), response.headers.get('Last-Modified'), segments)
+        # Preallocate the file so each segment can be written at its own offset
+        with open(dest, 'wb') as file:
+            file.truncate(total_size)
+        if resume:
+            state.save()
+
+    progress = _Progress(total_size, progress_callback, state.downloaded)
+    # The probe response is only needed for its headers; segments go straight to
+    # the final URL so every worker skips the redirect
+    fastest = sources[0] if sources else mirrors.Source(url)
+    pool = _SourcePool([mirrors.Source(response.url, validator, fastest.latency, fastest.throughput)] +
+                       [source for source in (sources or [])[1:] if source.ranges])
+    spread = pool.spread() if multi_source else 1
+    response.close()
+    logging.info(f"Downloading {url} in {len(state.segments)} segments from {len(pool.sources)} source(s).")
+
+    sidecar = state if resume else None
+    hasher = _StreamingHash(dest, state.segments)
+    try:
+        with ThreadPoolExecutor(max_workers=len(state.segments)) as executor:
+            futures = [executor.submit(_fetch_segment, session, pool, index % spread, dest,
+                                       segment, sidecar, progress, hasher, retries)
+                       for index, segment in enumerate(state.segments)]
+            for future in futures:
+                future.result()
+    except ValidatorChanged:
+        hasher.close()
+        discard_partial(dest)
+        raise
+    except Exception:
+        hasher.close()
+        if resume:
+            # Every worker has stopped, the offsets are final
+            state.save()
+        else:
+            discard_partial(dest)
+        raise
+
+    if resume:
+        state.remove()
+    with tracing.span('hash', 'download'):
+        digest = hasher.hexdigest()
+    check_digest(dest, digest, expected_digest)
+    return digest
+
+
+def stream(url, write, progress_callback=None, session=None, response=None, expected_digest=None,
+           retries=DEFAULT_RETRIES, restart=None):
+    """
+    Downloads url front to back into write() instead of a file, for consumers that
+    process the bytes as they arrive, such as a streaming.SpillBuffer feeding the
+    extraction. A dropped connection is picked up with Range + If-Range at the first
+    byte not written yet. When the file changed meanwhile, restart() is called so the
+    consumer drops what it got and the download starts over once from the first byte
+    with a fresh probe; without restart, ValidatorChanged is raised instead.
+
+    :param url: URL of the file to download.
+    :param write: Callable receiving the content chunk by chunk, in order.
+    :param progress_callback: Optional callable receiving (downloaded_bytes, total_bytes).
+    :param session: Optional requests.Session, defaults to the shared pooled one.
+    :param response: Already opened streaming GET of url to start from.
+    :param expected_digest: Published SHA-256 of the file; a mismatch raises IntegrityError after the last byte.
+    :param retries: Number of resumes with exponential backoff.
+    :param restart: Optional callable telling the consumer the content is sent again from the first byte.
+    :return: SHA-256 of the content.
+    """
+    session = session or http_session.get_session()
+    try:
+        digest = _stream(url, write, progress_callback, session, response, retries)
+    except ValidatorChanged as e:
+        if restart is None:
+            raise
+        logging.warning(f"{e} Downloading it again from the start.")
+        restart()
+        digest = _stream(url, write, progress_callback, session, None, retries)
+    if expected_digest and not hmac.compare_digest(digest, expected_digest.lower()):
+        raise IntegrityError(f"SHA-256 mismatch for {url}: expected {expected_digest}, got {digest}")
+    return digest
+
+
+def _stream(url, write, progress_callback, session, response, retries):
+    response = response or _probe(session, url, retries)
+    total_size = int(response.headers.get('content-length', 0))
+    validator = get_validator(response)
+    resumable = response.status_code == 200 and total_size and validator and supports_ranges(response)
+    final_url = response.url
+    progress = _Progress(total_size, progress_callback)
+    digest = hashlib.sha256()
+    attempt = 0
+    with tracing.span('stream', 'download', url=url):
+        while True:
+            try:
+                if response is None:
+                    response = session.get(final_url, stream=True, headers={
+                        'Range': f'bytes={progress.downloaded}-', 'If-Range': validator})
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        response.close()
+                        raise ValidatorChanged(f"{url} changed during the download.")
+                with response:
+                    for data in _iter_chunks(response, progress):
+                        write(data)
+                        digest.update(data)
+                        progress.add(len(data))
+                if total_size and progress.downloaded < total_size:
+                    raise requests.ConnectionError(f"The connection closed after {progress.downloaded} bytes.")
+                break
+            except requests.RequestException as e:
+                response = None
+                if not resumable or attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logging.warning(f"Download of {url} broke off at {progress.downloaded} bytes ({e}), "
+                                f"resuming in {delay:.0f}s.")
+                time.sleep(delay)
+    return digest.hexdigest()
+
+
+def remote_validator(url, session=None):
+    """
+    Asks the server what identifies the current content of url without downloading it.
+
+    :return: String combining ETag/Last-Modified and size, or None if the server offers neither.
+    """
+    session = session or http_session.get_session()
+    try:
+        response = session.head(url, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logging.debug(f"HEAD {url} failed: {e}")
+        return None
+    return content_validator(response)
+
+
+def content_validator(response):
+    """
+    :return: String combining the ETag/Last-Modified and size of response, or None if it has neither validator.
+    """
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    if not validator:
+        return None
+    return f"{validator}:{response.headers.get('content-length', '')}"
+
+
+def download_cached(url, dest, artifact_cache, validator=None, progress_callback=None, session=None,
+                    response=None, expected_digest=None, **kwargs):
+    """
+    Serves url from the artifact cache when possible and downloads it otherwise,
+    adding the result to the cache.
+
+    :param artifact_cache: cache.ArtifactCache to use.
+    :param validator: What identifies the asset's content, e.g. the release asset id, date and size.
+                      When omitted it is taken from response, or looked up with a HEAD request.
+    :param response: Already opened streaming GET of url, reused as the download probe.
+    :param expected_digest: Published SHA-256 of the file. Cached blobs are named by their
+                            digest, so a hit is checked without reading it.
+    :return: True if dest was served from the cache.
+    """
+    session = session or http_session.get_session()
+    if not validator:
+        validator = content_validator(response) if response is not None else remote_validator(url, session)
+    key = cache.make_key(url, validator) if validator else None
+    with tracing.span('cache lookup', 'download'):
+        cached_path = artifact_cache.lookup(key) if key else None
+    if cached_path and expected_digest and os.path.basename(cached_path) != expected_digest.lower():
+        logging.warning(f"Cached copy of {url} does not match the published digest, downloading again.")
+        cached_path = None
+    if cached_path:
+        # dest becomes a hard link to the cached blob, so it must never be resumed into afterwards
+        discard_partial(dest)
+        cache.link_or_copy(cached_path, dest)
+        logging.info(f"Served {dest} from the artifact cache.")
+        if response is not None:
+            response.close()
+        if progress_callback:
+            size = os.path.getsize(dest)
+            progress_callback(size, size)
+        return True
+
+    digest = download(url, dest, progress_callback, session=session, response=response,
+                      expected_digest=expected_digest, **kwargs)
+    if key:
+        with tracing.span('cache store', 'download'):
+            artifact_cache.store(key, dest, digest)
+    return False
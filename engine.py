@@ -0,0 +1,644 @@
+import os
+import re
+import shutil
+import logging
+import zipfile
+import tempfile
+
+import requests
+
+import archives
+import cache
+import channels
+import downloader
+import extractor
+import http_session
+import manifest
+import mirrors
+import scheduler
+import staging
+import store
+import streaming
+import tracing
+
+
+# Every endpoint can be pointed at a local stand-in through the environment
+RELEASES_API_URL = os.environ.get('LEMONADE_RELEASES_API_URL',
+                                  "https://api.github.com/repos/Lemonade-emu/Lemonade/releases")
+NIGHTLY_URL = os.environ.get('LEMONADE_NIGHTLY_URL',
+                             "https://nightly.link/Lemonade-emu/Lemonade/workflows/build/master/windows-msvc.zip")
+INSTALLER_RELEASES_API_URL = os.environ.get('LEMONADE_INSTALLER_RELEASES_API_URL',
+                                            "https://api.github.com/repos/Lemonade-emu/Lemonade-installer/releases")
+# Alternative hosts for the build, e.g. a LAN caching proxy; see mirrors.configured_mirrors
+MIRRORS = mirrors.configured_mirrors()
+# Fetch segments from several mirrors at once instead of only the fastest
+MULTI_SOURCE = os.environ.get('LEMONADE_MULTI_SOURCE') == '1'
+# Extract the build while it downloads, holding at most MEMORY_CAP bytes of it in
+# memory and SCRATCH_CAP on disk; for machines short on RAM or disk space
+STREAMING = os.environ.get('LEMONADE_STREAMING') == '1'
+MEMORY_CAP = int(float(os.environ.get('LEMONADE_MEMORY_CAP', streaming.DEFAULT_MEMORY_CAP / 2 ** 20)) * 2 ** 20)
+SCRATCH_CAP = int(float(os.environ.get('LEMONADE_SCRATCH_CAP', streaming.DEFAULT_SCRATCH_CAP / 2 ** 20)) * 2 ** 20)
+
+EXECUTABLE_NAME = 'lemonade-qt.exe'
+UNINSTALLER_NAME = 'uninstaller.exe'
+# Held while an installation runs and while the background prefetcher downloads, see prefetch.py
+INSTALL_LOCK_NAME = 'install.lock'
+PREFETCH_LOCK_NAME = 'prefetch.lock'
+
+
+class InstallError(Exception):
+    """Raised when a step of the installation cannot be completed; the message is meant for the user."""
+
+
+class Artifact:
+    """
+    A resolved build ready to be downloaded.
+
+    :param url: Download URL.
+    :param validator: What identifies the build's content, used as the artifact cache key.
+    :param response: Open streaming response of url left over from resolving, reused by the download.
+    :param digest: Expected SHA-256 of the download, or None when nothing was published.
+    """
+
+    def __init__(self, url, validator=None, response=None, digest=None):
+        self.url = url
+        self.validator = validator
+        self.response = response
+        # Published SHA-256 of the download, when the release provides one
+        self.digest = digest
+
+    @property
+    def cache_key(self):
+        """Key of the build in the artifact cache, or None when nothing identifies its content."""
+        return cache.make_key(self.url, self.validator) if self.validator else None
+
+
+def find_asset(releases, predicate):
+    """Returns the first asset of the newest release matching predicate(name), or None."""
+    for release in releases:
+        for asset in release.get('assets', []):
+            if predicate(asset['name']):
+                return asset
+    return None
+
+
+def parse_checksums(text, name):
+    """
+    Finds the SHA-256 for name in a checksum file, either a bare digest or
+    sha256sum-style '<digest>  <file name>' lines.
+    """
+    for line in text.splitlines():
+        match = re.match(r'^([0-9a-fA-F]{64})(?:\s+\*?(.+))?$', line.strip())
+        if match and (match.group(2) is None or match.group(2).strip() == name):
+            return match.group(1).lower()
+    return None
+
+
+def release_digest(release, asset):
+    """
+    Returns the published SHA-256 of asset: the digest GitHub reports for the asset,
+    or the matching line of a '<name>.sha256' or SHA256SUMS asset in the same release.
+    """
+    digest = asset.get('digest') or ''
+    if digest.startswith('sha256:'):
+        return digest[len('sha256:'):].lower()
+    for candidate in release.get('assets', []):
+        name = candidate['name']
+        if name == asset['name'] + '.sha256' or name.lower() in ('sha256sums', 'sha256sums.txt'):
+            try:
+                response = http_session.get_session().get(candidate['browser_download_url'])
+                response.raise_for_status()
+            except requests.RequestException as e:
+                logging.warning(f"Could not fetch checksum file {name}: {e}")
+                continue
+            checksum = parse_checksums(response.text, asset['name'])
+            if checksum:
+                return checksum
+    return None
+
+
+def resolve_release():
+    try:
+        releases = http_session.get_json(RELEASES_API_URL)
+    except requests.RequestException as e:
+        raise InstallError("Failed to fetch releases from GitHub.") from e
+    for release in releases:
+        assets = [asset for asset in release.get('assets', [])
+                  if "windows-msvc" in asset['name'] and not asset['name'].endswith('.sha256')]
+        if not assets:
+            continue
+        # A release may offer the build in several formats, the fastest one this installation can read wins
+        asset = min(assets, key=lambda asset: archives.rank(asset['name']))
+        # The asset id, date and size identify the build, so a cached copy is used without asking the server
+        validator = f"{asset['id']}:{asset.get('updated_at')}:{asset.get('size')}"
+        return Artifact(asset['browser_download_url'], validator, digest=release_digest(release, asset))
+    raise InstallError("No suitable release found.")
+
+
+def resolve_nightly():
+    try:
+        # The status probe is kept open and becomes the start of the download
+        response = http_session.get_session().get(NIGHTLY_URL, stream=True)
+    except requests.RequestException as e:
+        raise InstallError(f"Failed to download: {e}") from e
+    if response.status_code != 200:
+        response.close()
+        raise InstallError(f"Failed to download. HTTP status code: {response.status_code}.")
+    return Artifact(NIGHTLY_URL, downloader.content_validator(response), response=response)
+
+
+def resolve(channel):
+    """
+    Finds the build to install for channel ('release' or 'nightly').
+
+    :return: Artifact to pass to download_artifact.
+    """
+    if channel == 'release':
+        return resolve_release()
+    if channel == 'nightly':
+        return resolve_nightly()
+    raise InstallError(f"Unknown channel: {channel}")
+
+
+def check_for_update(channel):
+    """
+    Like resolve, but without starting the download: the release list is fetched
+    with a conditional request and the nightly build is identified by a HEAD
+    request, so a check costs a 304 or a few headers when nothing changed.
+
+    :return: Artifact without an open response.
+    """
+    if channel == 'nightly':
+        validator = downloader.remote_validator(NIGHTLY_URL)
+        if validator is None:
+            raise InstallError("Failed to check for a new nightly build.")
+        return Artifact(NIGHTLY_URL, validator)
+    return resolve(channel)
+
+
+def download_artifact(artifact, progress_callback=None):
+    """
+    Downloads artifact to a stable per-URL path, so an interrupted download is resumed on the next run.
+    With MIRRORS configured, the fastest of them and the original URL serves it.
+
+    :return: Path of the downloaded archive.
+    """
+    dest = downloader.partial_path(artifact.url)
+    downloader.download_cached(artifact.url, dest, cache.default_cache(), artifact.validator,
+                               progress_callback, response=artifact.response, resume=True,
+                               expected_digest=artifact.digest, mirror_list=MIRRORS,
+                               multi_source=MULTI_SOURCE)
+    logging.info(f"Download completed. File saved to {dest}")
+    return dest
+
+
+def clear_directory(directory):
+    """
+    Removes all files and directories in the specified directory.
+
+    :param directory: Path to the directory to clear.
+    """
+    for item in os.listdir(directory):
+        item_path = os.path.join(directory, item)
+        try:
+            if os.path.isfile(item_path) or os.path.islink(item_path):
+                os.unlink(item_path)
+            elif os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+        except Exception as e:
+            logging.error(f'Failed to delete {item_path}. Reason: {e}')
+
+
+def _install_in_place(source, target, progress_callback, file_store):
+    if os.path.exists(target) and manifest.load(target) is None:
+        clear_directory(target)
+    extractor.extract_source(source, target, progress_callback, incremental=True, store=file_store)
+
+
+def _install_staged(source, target, progress_callback, keep_previous, file_store):
+    installed = manifest.load(target) if os.path.isdir(target) else None
+    staging_dir = staging.prepare(target)
+    moved = []
+    try:
+        # Unchanged files are hard linked from the live installation instead of being inflated again
+        extractor.extract_source(source, staging_dir, progress_callback, incremental=True,
+                                 link_from=target if installed is not None else None, store=file_store)
+        # The uninstaller, user data and logs were not part of the old version, they move along before
+        # the swap so the replaced version never holds anything but files it can be rebuilt from
+        if installed is not None:
+            with tracing.span('carry over'):
+                staging.carry_over(target, staging_dir, installed, moved)
+        with tracing.span('swap'):
+            previous = staging.swap(staging_dir, target)
+    except OSError as e:
+        _abandon_staging(staging_dir, target, moved)
+        raise InstallError(f"Could not replace {target}, make sure Lemonade is not running: {e}") from e
+    except Exception:
+        # Cancelled or failed half way, the live installation was not touched
+        _abandon_staging(staging_dir, target, moved)
+        raise
+    if previous is not None and not keep_previous:
+        with tracing.span('remove previous'):
+            staging.remove_tree(previous)
+        # Files only the replaced version used have no links left now
+        with tracing.span('store gc'):
+            file_store.gc()
+
+
+def _abandon_staging(staging_dir, target, moved):
+    if staging.put_back(staging_dir, target, moved):
+        staging.remove_tree(staging_dir)
+    else:
+        logging.error(f"Kept {staging_dir}, it still holds files carried over from {target}.")
+
+
+def _discard_download(archive_path, cache_key, source=None):
+    """
+    Removes a download that cannot be installed, and its cache entry so the next attempt fetches it again.
+
+    :param source: Opened source of the archive, closed first as Windows cannot remove a file still open.
+    """
+    if source is not None:
+        source.cleanup()
+    # Evicted first, a download that cannot be removed must not be served again either
+    if cache_key:
+        cache.default_cache().evict(cache_key)
+    try:
+        os.remove(archive_path)
+    except OSError as e:
+        logging.warning(f"Could not remove {archive_path}: {e}")
+
+
+def extract_artifact(archive_path, target, progress_callback=None, staged=True, keep_previous=False, cache_key=None):
+    """
+    Installs the downloaded archive into target and removes the download.
+    The archive is validated before any existing file is touched.
+
+    By default the new version is extracted into a sibling staging directory and
+    swapped in with two renames, so the installation stays usable during extraction.
+    Otherwise installations with a manifest are updated in place and anything else is cleared first.
+
+    Installed files are hard links into a store.FileStore shared by the installations
+    next to target, so content another channel or version already has is linked
+    instead of extracted and takes no extra space.
+
+    :param staged: Extract into a staging directory and swap it in.
+    :param keep_previous: Keep the replaced version as '<target>.previous'.
+    :param cache_key: Artifact cache key the archive was downloaded under (Artifact.cache_key).
+                      A damaged or unusable archive is evicted, so it is not served again.
+    """
+    try:
+        source = extractor.open_artifact(archive_path)
+    except archives.ArchiveError as e:
+        _discard_download(archive_path, cache_key)
+        raise InstallError(f"The downloaded build cannot be installed: {e}") from e
+    except (zipfile.BadZipFile, OSError) as e:
+        _discard_download(archive_path, cache_key)
+        raise InstallError(f"The downloaded archive is damaged: {e}") from e
+    try:
+        try:
+            with tracing.span('validate'):
+                extractor.validate_source(source)
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            _discard_download(archive_path, cache_key, source)
+            raise InstallError(f"The downloaded archive is damaged: {e}") from e
+        with store.FileStore(store.store_dir(target)) as file_store:
+            try:
+                if staged:
+                    _install_staged(source, target, progress_callback, keep_previous, file_store)
+                else:
+                    _install_in_place(source, target, progress_callback, file_store)
+            except archives.ArchiveError as e:
+                _discard_download(archive_path, cache_key, source)
+                raise InstallError(f"The downloaded build cannot be installed: {e}") from e
+            except (zipfile.BadZipFile, ValueError) as e:
+                # Formats without a central directory are only checked while they are extracted
+                _discard_download(archive_path, cache_key, source)
+                raise InstallError(f"The downloaded archive is damaged: {e}") from e
+    finally:
+        source.cleanup()
+    os.remove(archive_path)
+
+
+def extract_stream(buffer, target, progress_callback=None, keep_previous=False):
+    """
+    Installs the build arriving through buffer while it downloads, see build_pipeline.
+    Unlike extract_artifact nothing can be validated up front: every member is
+    checked as it is inflated, the new version goes into a staging directory as
+    usual and is only swapped in once the whole download was verified.
+
+    :param buffer: streaming.SpillBuffer the download stage writes the archive into.
+    """
+    try:
+        with store.FileStore(store.store_dir(target)) as file_store:
+            while True:
+                try:
+                    _install_staged(extractor.StreamSource(buffer), target, progress_callback, keep_previous,
+                                    file_store)
+                    break
+                except streaming.Restarted:
+                    # The build changed during the download, the staging directory is gone already
+                    logging.info("The download started over, extracting the new build from the start.")
+    except archives.NotStreamable as e:
+        raise InstallError(f"This build cannot be installed while it downloads, install it without streaming: "
+                           f"{e}") from e
+    except archives.ArchiveError as e:
+        raise InstallError(f"The downloaded build cannot be installed: {e}") from e
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise InstallError(f"The downloaded archive is damaged: {e}") from e
+    finally:
+        # Lets a download still writing into it stop
+        buffer.discard()
+
+
+def download_file(url, dest_path):
+    with http_session.get_session().get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(dest_path, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                f.write(chunk)
+
+
+def fetch_uninstaller():
+    """
+    Downloads the uninstaller of the newest installer release to a temporary file,
+    so it can be fetched before the installation directory exists.
+
+    :return: Path of the downloaded uninstaller, or None if it could not be downloaded.
+    """
+    try:
+        logging.info("Starting to download uninstaller.")
+        releases = http_session.get_json(INSTALLER_RELEASES_API_URL)
+        asset = find_asset(releases, lambda name: name == UNINSTALLER_NAME)
+        if asset is None:
+            logging.error("Uninstaller not found in any release.")
+            return None
+        fd, path = tempfile.mkstemp(suffix='-' + UNINSTALLER_NAME)
+        os.close(fd)
+        try:
+            download_file(asset['browser_download_url'], path)
+        except Exception:
+            os.remove(path)
+            raise
+        logging.info("Uninstaller downloaded successfully.")
+        return path
+    except (requests.RequestException, OSError) as e:
+        logging.error(f"Error downloading uninstaller: {e}")
+        return None
+
+
+def place_uninstaller(path, target):
+    """Moves an uninstaller from fetch_uninstaller into target."""
+    destination = os.path.join(target, UNINSTALLER_NAME)
+    try:
+        os.replace(path, destination)
+    except OSError:
+        # The temporary folder is on another volume
+        shutil.copyfile(path, destination)
+        os.remove(path)
+
+
+def download_uninstaller(target):
+    """
+    Downloads the uninstaller of the newest installer release into target.
+
+    :return: True if the uninstaller was downloaded.
+    """
+    path = fetch_uninstaller()
+    if path is None:
+        return False
+    place_uninstaller(path, target)
+    return True
+
+
+def register(target, channel='release'):
+    """
+    Add the application to the Windows Program list with the uninstall option.
+
+    :param target: Installation directory.
+    :param channel: Channel installed in target, each one gets its own entry.
+    """
+    if os.name != 'nt':
+        logging.info("Not on Windows, skipping the programs list entry.")
+        return
+    import winreg as reg
+
+    logging.info("Adding to programs list...")
+    executable_path = os.path.join(target, EXECUTABLE_NAME)
+    uninstaller_path = os.path.join(target, UNINSTALLER_NAME)
+    logging.info(f"Uninstaller path: {uninstaller_path}")
+    uninstall_command = f'"{uninstaller_path}" --channel {channel} --target "{target}"'
+    key_path = channels.uninstall_key(channel)
+
+    # Attempt to open the key, create if it does not exist
+    try:
+        key = reg.OpenKey(reg.HKEY_CURRENT_USER, key_path, 0, reg.KEY_WRITE)
+        logging.info("Registry key exists, opened successfully.")
+    except FileNotFoundError:
+        key = reg.CreateKey(reg.HKEY_CURRENT_USER, key_path)
+        logging.info("Registry key does not exist, created successfully.")
+
+    # Set values within the key
+    with key, tracing.span('registry'):
+        reg.SetValueEx(key, "DisplayName", 0, reg.REG_SZ, channels.PRODUCT_NAMES[channel])
+        reg.SetValueEx(key, "UninstallString", 0, reg.REG_SZ, uninstall_command)
+        reg.SetValueEx(key, "DisplayIcon", 0, reg.REG_SZ, executable_path)
+        reg.SetValueEx(key, "Publisher", 0, reg.REG_SZ, "Lemonade-Emu")
+        reg.SetValueEx(key, "URLInfoAbout", 0, reg.REG_SZ, "https://lemonade-emu.github.io/")
+        logging.info("Registry values set successfully.")
+
+    logging.info("Added to programs list successfully.")
+
+
+def create_shortcut(target, shortcut_path, description="", arguments="", hotkey=""):
+    """
+    Creates a shortcut at the specified path pointing to the target file.
+
+    :param target: Path to the target file the shortcut will point to.
+    :param shortcut_path: Path where the shortcut will be created.
+    :param description: Description of the shortcut.
+    :param arguments: Additional arguments to pass to the target when executed.
+    :param hotkey: Hotkey associated with the shortcut.
+    """
+    # Verify the target exists
+    if not os.path.exists(target):
+        logging.error(f"Shortcut target does not exist: {target}")
+        return
+
+    try:
+        import win32com.client
+        shell = win32com.client.Dispatch("WScript.Shell")
+        shortcut = shell.CreateShortCut(shortcut_path)
+        shortcut.TargetPath = target
+        shortcut.WorkingDirectory = os.path.dirname(target)
+        shortcut.Description = description
+        shortcut.Arguments = arguments
+        if hotkey:
+            shortcut.Hotkey = hotkey
+        shortcut.IconLocation = target  # You can customize this if needed
+        shortcut.save()
+        logging.info(f"Shortcut created successfully at {shortcut_path}")
+    except Exception as e:
+        logging.error(f"Failed to create shortcut: {e}")
+
+
+def create_shortcuts(target, desktop=True, start_menu=True, channel='release'):
+    if os.name != 'nt':
+        logging.info("Not on Windows, skipping shortcuts.")
+        return
+    if not (desktop or start_menu):
+        return
+    import pythoncom
+
+    # Shortcuts are created from a pipeline worker thread, which has to join COM itself
+    pythoncom.CoInitialize()
+    try:
+        executable_path = os.path.join(target, EXECUTABLE_NAME)
+        if desktop:
+            with tracing.span('COM shortcut', path=channels.desktop_shortcut_path(channel)):
+                create_shortcut(executable_path, channels.desktop_shortcut_path(channel))
+        if start_menu:
+            with tracing.span('COM shortcut', path=channels.start_menu_shortcut_path(channel)):
+                create_shortcut(executable_path, channels.start_menu_shortcut_path(channel))
+    finally:
+        pythoncom.CoUninitialize()
+
+
+def _download_stage(artifact, progress_callback):
+    try:
+        return download_artifact(artifact, progress_callback)
+    except (requests.RequestException, OSError, downloader.ValidatorChanged, downloader.IntegrityError) as e:
+        raise InstallError(f"Error doing download: {e}") from e
+
+
+def _stream_download_stage(artifact, buffer, progress_callback):
+    def report(done, total):
+        # The extraction measures its progress against the same total
+        buffer.total = total
+        progress_callback(done, total)
+
+    try:
+        cached = cache.default_cache().lookup(artifact.cache_key) if artifact.cache_key else None
+        if cached and (not artifact.digest or os.path.basename(cached) == artifact.digest.lower()):
+            # Prefetched already, the cached archive is streamed instead
+            if artifact.response is not None:
+                artifact.response.close()
+            size = os.path.getsize(cached)
+            with open(cached, 'rb') as file:
+                for data in iter(lambda: file.read(extractor.CHUNK_SIZE), b''):
+                    buffer.write(data)
+                    report(file.tell(), size)
+        else:
+            downloader.stream(artifact.url, buffer.write, report, response=artifact.response,
+                              expected_digest=artifact.digest, restart=buffer.restart)
+    except streaming.Discarded as e:
+        # The extraction failed and reports why
+        raise scheduler.Cancelled() from e
+    except (requests.RequestException, OSError, downloader.ValidatorChanged, downloader.IntegrityError) as e:
+        raise InstallError(f"Error doing download: {e}") from e
+    # Only now the extraction sees the end of the archive and swaps the new version in
+    buffer.close()
+
+
+def _register_stage(target, uninstaller_path, channel):
+    if uninstaller_path:
+        place_uninstaller(uninstaller_path, target)
+    register(target, channel)
+
+
+def build_pipeline(channel, target, desktop_shortcut=True, start_menu_shortcut=True, keep_previous=False):
+    """
+    Describes a complete installation as a graph of stages:
+
+        metadata -> download -> extract -> register
+                                        -> shortcuts
+        uninstaller ----------------------> register
+
+    The uninstaller is fetched while the build downloads, and registry entries and
+    shortcuts are written side by side. With STREAMING, download and extract run at
+    the same time, connected by a streaming.SpillBuffer. Run it with run_pipeline;
+    cancel() may be called from any thread.
+
+    :param channel: 'release' or 'nightly'.
+    :param target: Installation directory.
+    :return: scheduler.Scheduler whose stages report progress under their own names.
+    """
+    pipeline = scheduler.Scheduler()
+    pipeline.add('metadata', lambda stage: resolve(channel))
+    pipeline.add('uninstaller', lambda stage: fetch_uninstaller())
+    if STREAMING:
+        buffer = streaming.SpillBuffer(MEMORY_CAP, SCRATCH_CAP, check=pipeline.token.raise_if_cancelled)
+        pipeline.add('download', lambda stage: _stream_download_stage(stage.inputs['metadata'], buffer,
+                                                                      stage.progress),
+                     depends=('metadata',))
+        pipeline.add('extract', lambda stage: extract_stream(buffer, target, stage.progress, keep_previous),
+                     depends=('metadata',))
+    else:
+        pipeline.add('download', lambda stage: _download_stage(stage.inputs['metadata'], stage.progress),
+                     depends=('metadata',))
+        pipeline.add('extract', lambda stage: extract_artifact(stage.inputs['download'], target, stage.progress,
+                                                               keep_previous=keep_previous,
+                                                               cache_key=stage.inputs['metadata'].cache_key),
+                     depends=('metadata', 'download'))
+    pipeline.add('register', lambda stage: _register_stage(target, stage.inputs['uninstaller'], channel),
+                 depends=('extract', 'uninstaller'))
+    pipeline.add('shortcuts', lambda stage: create_shortcuts(target, desktop_shortcut, start_menu_shortcut,
+                                                             channel),
+                 depends=('extract',))
+    return pipeline
+
+
+def _lock(name):
+    directory = cache.default_cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    return cache.FileLock(os.path.join(directory, name))
+
+
+def install_lock():
+    """Lock held for the whole of an installation, so installs never run into each other or a prefetch."""
+    return _lock(INSTALL_LOCK_NAME)
+
+
+def prefetch_lock():
+    """Lock held by a background prefetch while it downloads."""
+    return _lock(PREFETCH_LOCK_NAME)
+
+
+def run_pipeline(pipeline):
+    """
+    Runs a pipeline from build_pipeline on the calling thread until every stage finished.
+
+    :raises InstallError: If the pipeline was cancelled or a stage failed.
+    """
+    try:
+        with install_lock():
+            # A running prefetch sees the install lock and stops within a moment; its
+            # partial download is resumed by this installation
+            with prefetch_lock(), tracing.span('install', 'pipeline'):
+                pipeline.run()
+    except scheduler.Cancelled as e:
+        raise InstallError("The installation was cancelled.") from e
+    finally:
+        # A fetched uninstaller that never got placed
+        leftover = pipeline.results.get('uninstaller')
+        if leftover and os.path.exists(leftover):
+            os.remove(leftover)
+
+
+def install(channel, target=None, desktop_shortcut=True, start_menu_shortcut=True, progress_callback=None,
+            keep_previous=False):
+    """
+    Runs a complete installation: resolve, download, extract, register and shortcuts.
+
+    :param channel: 'release' or 'nightly'.
+    :param target: Installation directory, defaults to %LOCALAPPDATA%\\Lemonade or %LOCALAPPDATA%\\Lemonade Nightly.
+    :param progress_callback: Optional callable receiving a progress.ProgressEvent per stage update, from any thread.
+    :param keep_previous: Keep the replaced version as '<target>.previous'.
+    :return: The installation directory.
+    """
+    target = target or channels.default_install_dir(channel)
+    pipeline = build_pipeline(channel, target, desktop_shortcut, start_menu_shortcut, keep_previous)
+    if progress_callback:
+        pipeline.subscribe(progress_callback)
+    run_pipeline(pipeline)
+    return target
@@ -0,0 +1,724 @@
+import os
+import io
+import zlib
+import bisect
+import hashlib
+import struct
+import logging
+import zipfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+import archives
+import cache
+import manifest
+import streaming
+import tracing
+
+
+CHUNK_SIZE = 1024 * 1024
+# Release and nightly archives wrap everything in a folder named like this
+NESTED_DIR_MARKER = 'lemonade-windows-msvc'
+# Compressed nested archives up to this size are inflated into memory, larger ones are read on demand
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+# Bytes at the end of a compressed nested zip kept in memory, where its central directory is read from
+NESTED_TAIL_SIZE = 1024 * 1024
+# Output bytes between two copies of the decompressor kept for a compressed nested zip, see _index_deflated
+CHECKPOINT_INTERVAL = 8 * 1024 * 1024
+# Compressed bytes fed to zlib at once while reading a compressed nested zip
+INFLATE_INPUT_SIZE = 64 * 1024
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Seconds between progress reports while the workers are busy
+PROGRESS_INTERVAL = 0.1
+
+
+class _FileSlice(io.RawIOBase):
+    """Read-only, seekable view of a region of an open file."""
+
+    def __init__(self, file, offset, size):
+        super().__init__()
+        self.file = file
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = max(0, min(position, self.size))
+        return self.position
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self.position)
+        if count <= 0:
+            return 0
+        self.file.seek(self.offset + self.position)
+        data = self.file.read(count)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class _DeflatedMember:
+    """
+    A deflated zip member indexed by _index_deflated: where its compressed data is,
+    a copy of the decompressor every CHECKPOINT_INTERVAL bytes of output as
+    (output position, compressed position, zlib decompressor), and its last bytes.
+    """
+
+    def __init__(self, path, offset, compress_size, size, checkpoints, tail):
+        self.path = path
+        self.offset = offset
+        self.compress_size = compress_size
+        self.size = size
+        self.checkpoints = checkpoints
+        self.starts = [checkpoint[0] for checkpoint in checkpoints]
+        self.tail = tail
+
+
+def _index_deflated(zip_path, file, info):
+    """
+    Inflates a deflated member once, front to back, without keeping its output, and
+    checks its CRC-32 on the way. Returns a _DeflatedMember from which reading can
+    start again at any checkpoint instead of the first byte.
+    """
+    offset = _member_data_offset(file, info)
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    checkpoints = [(0, 0, decompressor.copy())]
+    tail_offset = max(0, info.file_size - NESTED_TAIL_SIZE)
+    tail = bytearray()
+    crc = position = consumed = 0
+    file.seek(offset)
+    while consumed < info.compress_size:
+        data = file.read(min(INFLATE_INPUT_SIZE, info.compress_size - consumed))
+        if not data:
+            raise zipfile.BadZipFile(f"{info.filename} is truncated")
+        consumed += len(data)
+        try:
+            output = decompressor.decompress(data)
+        except zlib.error as e:
+            raise zipfile.BadZipFile(f"{info.filename} is damaged: {e}") from e
+        crc = zlib.crc32(output, crc)
+        if position + len(output) > tail_offset:
+            tail += output[max(0, tail_offset - position):]
+        position += len(output)
+        # Every input chunk was taken in whole, so the decompressor state matches both positions
+        if position - checkpoints[-1][0] >= CHECKPOINT_INTERVAL and position < tail_offset:
+            checkpoints.append((position, consumed, decompressor.copy()))
+    output = decompressor.flush()
+    crc = zlib.crc32(output, crc)
+    tail += output
+    position += len(output)
+    if position != info.file_size or crc != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename}")
+    return _DeflatedMember(zip_path, offset, info.compress_size, info.file_size, checkpoints, bytes(tail))
+
+
+class _InflatingView(io.RawIOBase):
+    """
+    Read-only, seekable view of a deflated zip member that is inflated on demand
+    instead of being written out. Reading forward inflates and drops whatever is
+    skipped; reading anywhere else starts inflating again from the closest
+    checkpoint before it, so a worker starting in the middle of the member only
+    inflates its own stretch. The tail holding the central directory is served
+    from memory.
+    """
+
+    def __init__(self, member):
+        super().__init__()
+        self.member = member
+        self.size = member.size
+        self.tail_offset = self.size - len(member.tail)
+        self.position = 0
+        self.file = None
+        self.decompressor = None
+        # Compressed bytes fed to the decompressor, and the output position pending starts at
+        self.consumed = 0
+        self.output_position = 0
+        self.pending = bytearray()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = max(0, min(position, self.size))
+        return self.position
+
+    def _restart(self):
+        index = bisect.bisect_right(self.member.starts, self.position) - 1
+        self.output_position, self.consumed, decompressor = self.member.checkpoints[index]
+        # The checkpoint stays usable for the next restart
+        self.decompressor = decompressor.copy()
+        self.pending.clear()
+
+    def _inflate_more(self):
+        data = self.decompressor.unconsumed_tail
+        if not data:
+            remaining = self.member.compress_size - self.consumed
+            if remaining <= 0:
+                output = self.decompressor.flush()
+                self.pending += output
+                return bool(output)
+            self.file.seek(self.member.offset + self.consumed)
+            data = self.file.read(min(INFLATE_INPUT_SIZE, remaining))
+            if not data:
+                raise zipfile.BadZipFile("The nested archive is truncated")
+            self.consumed += len(data)
+        self.pending += self.decompressor.decompress(data, CHUNK_SIZE)
+        return True
+
+    def _read_inflated(self, count):
+        if self.file is None:
+            self.file = open(self.member.path, 'rb')
+        checkpoint = self.member.starts[bisect.bisect_right(self.member.starts, self.position) - 1]
+        if self.decompressor is None or self.position < self.output_position or checkpoint > self.output_position:
+            self._restart()
+        while self.position - self.output_position >= len(self.pending):
+            self.output_position += len(self.pending)
+            self.pending.clear()
+            if not self._inflate_more():
+                return b''
+        start = self.position - self.output_position
+        data = bytes(self.pending[start:start + min(count, self.tail_offset - self.position)])
+        del self.pending[:start + len(data)]
+        self.output_position += start + len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self.position)
+        filled = 0
+        while filled < count:
+            if self.position >= self.tail_offset:
+                start = self.position - self.tail_offset
+                data = self.member.tail[start:start + count - filled]
+            else:
+                data = self._read_inflated(count - filled)
+                if not data:
+                    break
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self.position += len(data)
+        return filled
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        super().close()
+
+
+def _member_data_offset(file, info):
+    """Returns the absolute offset of a member's data, past its local file header."""
+    file.seek(info.header_offset)
+    header = file.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return info.header_offset + zipfile.sizeFileHeader + name_length + extra_length
+
+
+def find_nested_archive(archive):
+    """Returns the first member of the zip that is an archive itself, by its name, or None."""
+    for info in archive.infolist():
+        if not info.is_dir() and archives.for_name(info.filename):
+            return info
+    return None
+
+
+class ArchiveSource:
+    """
+    Knows how to open a fresh ZipFile over the same archive, so every extraction
+    worker can read through its own handle instead of contending on one.
+    """
+
+    # Archives are read in place or from memory, nothing is written to scratch storage
+    scratch_size = 0
+
+    def __init__(self, path=None, data=None, offset=0, size=None, inflate=None):
+        self.path = path
+        self.data = data
+        self.offset = offset
+        self.size = size
+        # _DeflatedMember holding the archive, read through an _InflatingView
+        self.inflate = inflate
+
+    @property
+    def sequential(self):
+        """True when members are cheap to read only in the order they are stored, on a single handle."""
+        return self.inflate is not None
+
+    @contextlib.contextmanager
+    def open(self):
+        if self.data is not None:
+            with zipfile.ZipFile(io.BytesIO(self.data)) as archive:
+                yield archive
+            return
+        if self.inflate is not None:
+            with contextlib.closing(_InflatingView(self.inflate)) as view, \
+                    zipfile.ZipFile(view) as archive:
+                yield archive
+            return
+        with open(self.path, 'rb') as file:
+            view = file if self.size is None else _FileSlice(file, self.offset, self.size)
+            with zipfile.ZipFile(view) as archive:
+                yield archive
+
+    def cleanup(self):
+        # Every handle is closed together with its ZipFile
+        pass
+
+
+def nested_zip_source(zip_path, outer_file, outer, info):
+    """
+    Returns an ArchiveSource for a zip stored inside another zip without extracting it first.
+
+    Stored (uncompressed) members are read in place through a view of the outer
+    file. Small compressed members are inflated into memory. Larger deflated ones
+    are inflated once up front, which checks their CRC-32 and keeps the tail with
+    the central directory and a decompressor checkpoint every CHECKPOINT_INTERVAL
+    bytes; every worker then extracts a contiguous stretch of members in stored
+    order through an _InflatingView, starting from the checkpoint before it. Nothing
+    is written to scratch storage.
+    """
+    if info.compress_type == zipfile.ZIP_STORED:
+        offset = _member_data_offset(outer_file, info)
+        return ArchiveSource(zip_path, offset=offset, size=info.file_size)
+    if info.file_size <= SPOOL_MAX_SIZE or info.compress_type != zipfile.ZIP_DEFLATED:
+        # Only zlib decompressors can be copied; nightly.link deflates, anything else is held in memory
+        with outer.open(info) as source:
+            return ArchiveSource(data=source.read())
+    with tracing.span('index nested archive', 'extract', size=info.file_size):
+        return ArchiveSource(zip_path, inflate=_index_deflated(zip_path, outer_file, info))
+
+
+def strip_prefix(names):
+    """
+    Returns the top-level directory prefix to strip from every member, if all
+    members live inside a single lemonade-windows-msvc* folder.
+    """
+    top_levels = {name.split('/', 1)[0] for name in names}
+    if len(top_levels) != 1:
+        return ''
+    top_level = top_levels.pop()
+    if NESTED_DIR_MARKER not in top_level or not all('/' in name for name in names):
+        return ''
+    return top_level + '/'
+
+
+def target_path(extract_to, name):
+    """Maps an archive member name to its path under extract_to, rejecting paths that escape it."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0]:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return os.path.join(extract_to, *parts)
+
+
+class _ExtractProgress:
+    """Byte counter updated by the workers and reported from the calling thread."""
+
+    def __init__(self, total_size):
+        self.total_size = total_size
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.written += count
+        tracing.add('extracted bytes', count)
+
+
+def _reuse(name, path, size, crc, previous, installed_dir, link_from, store):
+    """
+    Puts a member at path without inflating it when the installation or the store
+    already has its content, going by size and CRC-32 and, for the store, an object
+    whose content is confirmed (see store.FileStore.lookup); otherwise makes room for it.
+
+    :return: (manifest entry or None when the member has to be extracted, whether it came from the store)
+    """
+    entry = previous.get(name)
+    if crc is not None and manifest.is_unchanged(installed_dir, name, entry, size, crc):
+        if link_from:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cache.link_or_copy(os.path.join(link_from, *name.split('/')), path)
+        return entry, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    found = store.lookup(size, crc) if store and crc is not None else None
+    if found:
+        cache.link_or_copy(found[0], path)
+        return {'size': size, 'crc32': crc, 'sha256': found[1]}, True
+    if os.path.lexists(path):
+        # Possibly a hard link shared with the store, never write through it
+        os.remove(path)
+    return None, False
+
+
+def _split_runs(pending, count):
+    """Splits members sorted by offset into up to count contiguous runs of about the same compressed size."""
+    share = sum(info.compress_size for info, _, _ in pending) / max(1, count)
+    runs, run, size = [], [], 0
+    for item in pending:
+        run.append(item)
+        size += item[0].compress_size
+        if size >= share * (len(runs) + 1) and len(runs) < count - 1:
+            runs.append(run)
+            run = []
+    return runs + [run] if run else runs
+
+
+def _extract_run(source, handles, local, run, progress):
+    """
+    Extracts a run of members, returning their manifest entries. A sequential source
+    gets a handle per run, so it only ever moves forward; otherwise the thread's own
+    handle is reused across runs.
+    """
+    if source.sequential:
+        with source.open() as archive:
+            return {name: _extract_member(archive, info, path, progress) for info, name, path in run}
+    archive = getattr(local, 'archive', None)
+    if archive is None:
+        with progress.lock:
+            archive = local.archive = handles.enter_context(source.open())
+    return {name: _extract_member(archive, info, path, progress) for info, name, path in run}
+
+
+def _extract_member(archive, info, path, progress):
+    digest = hashlib.sha256()
+    with tracing.span('inflate', 'extract', member=info.filename, size=info.file_size), \
+            archive.open(info) as member, open(path, 'wb') as target:
+        while True:
+            data = member.read(CHUNK_SIZE)
+            if not data:
+                break
+            target.write(data)
+            digest.update(data)
+            progress.add(len(data))
+    return {'size': info.file_size, 'crc32': info.CRC, 'sha256': digest.hexdigest()}
+
+
+def extract_members(source, extract_to, progress_callback=None, previous=None, workers=DEFAULT_WORKERS,
+                    link_from=None, store=None):
+    """
+    Writes every member of the archive to its final path under extract_to exactly once,
+    stripping the lemonade-windows-msvc* top-level folder on the way.
+
+    Members are inflated in parallel on a bounded thread pool, largest first, each
+    worker reading through its own ZipFile handle. zlib releases the GIL, so the
+    big DLLs and the main executable decompress concurrently.
+
+    When the manifest of the previous installation is given, members whose size and
+    CRC32 in the central directory match what is already installed are skipped. If
+    that installation lives elsewhere (link_from), unchanged files are hard linked
+    from it instead of being inflated again. Members whose content a store.FileStore
+    already holds, for example from the other channel, are hard linked from it.
+
+    :param source: ArchiveSource of the archive to extract.
+    :param extract_to: Destination directory.
+    :param progress_callback: Optional callable receiving (written_bytes, total_bytes), called from this thread.
+    :param previous: Optional manifest files dict of the existing installation.
+    :param workers: Maximum number of extraction threads.
+    :param link_from: Directory of the installation described by previous, when it is not extract_to.
+    :param store: Optional opened store.FileStore to link known content from.
+    :return: Tuple of (bytes written, manifest files dict of the new installation).
+    """
+    previous = previous or {}
+    stored = 0
+    installed_dir = link_from or extract_to
+    with source.open() as archive:
+        infos = archive.infolist()
+    prefix = strip_prefix([info.filename for info in infos])
+    files = {}
+    pending = []
+    for info in infos:
+        name = info.filename[len(prefix):].rstrip('/')
+        if not name:
+            continue
+        path = target_path(extract_to, name)
+        if info.is_dir():
+            os.makedirs(path, exist_ok=True)
+            continue
+        name = os.path.relpath(path, extract_to).replace(os.sep, '/')
+        entry, from_store = _reuse(name, path, info.file_size, info.CRC, previous, installed_dir, link_from, store)
+        if entry is not None:
+            files[name] = entry
+            stored += from_store
+            continue
+        pending.append((info, name, path))
+    if source.sequential:
+        # Each worker reads one stretch of the archive front to back, so none has to seek backwards
+        pending.sort(key=lambda item: item[0].header_offset)
+        runs = _split_runs(pending, workers)
+    else:
+        # Largest first so a big DLL picked up last does not leave the other workers idle
+        pending.sort(key=lambda item: item[0].file_size, reverse=True)
+        runs = [[item] for item in pending]
+
+    progress = _ExtractProgress(sum(info.file_size for info, _, _ in pending))
+    local = threading.local()
+    with contextlib.ExitStack() as handles, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        remaining = {executor.submit(_extract_run, source, handles, local, run, progress) for run in runs}
+        try:
+            while remaining:
+                done, remaining = wait(remaining, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    files.update(future.result())
+                if progress_callback:
+                    progress_callback(progress.written, progress.total_size)
+        except BaseException:
+            # A failed member or a cancelling progress callback: drop the members not started yet
+            for future in remaining:
+                future.cancel()
+            raise
+
+    if previous:
+        logging.info(f"{len(pending)} of {len(files)} files changed.")
+    if stored:
+        logging.info(f"{stored} files linked from the store.")
+    return progress.written, files
+
+
+def iter_build_members(read):
+    """
+    Members of the build in any format archives.detect knows; when the first file is
+    itself an archive, as nightly.link wraps builds in a zip, the members inside it.
+    """
+    reader = archives.StreamReader(read)
+    members = archives.detect(reader.peek(archives.HEADER_SIZE)).iter_members(reader.read)
+    for name, member in members:
+        if not name.endswith('/') and archives.for_name(name):
+            inner = archives.StreamReader(member.read)
+            yield from archives.detect(inner.peek(archives.HEADER_SIZE)).iter_members(inner.read)
+            return
+        yield name, member
+        if not name.endswith('/'):
+            yield from members
+            return
+
+
+class StreamSource:
+    """
+    An archive that is extracted as it arrives, see extract_stream.
+
+    :param stream: Object with read(size) returning b'' at the end, consumed and total
+                   byte counts for progress and discard(), such as a streaming.SpillBuffer
+                   or streaming.FileStream.
+    """
+
+    # Nothing is spooled, only the stream's own buffer may touch the disk
+    scratch_size = 0
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size):
+        return self.stream.read(size)
+
+    def drain(self):
+        while self.stream.read(CHUNK_SIZE):
+            pass
+
+    def cleanup(self):
+        self.stream.discard()
+
+
+def _stream_prefix(name):
+    """The lemonade-windows-msvc* folder to strip, judged by the first member alone."""
+    top_level = name.split('/', 1)[0]
+    return top_level + '/' if NESTED_DIR_MARKER in top_level and '/' in name else ''
+
+
+def extract_stream(source, extract_to, progress_callback=None, previous=None, link_from=None, store=None):
+    """
+    Extracts a StreamSource front to back while it is still arriving, one member at a
+    time, so neither the archive nor a nested build archive is ever held in full.
+    Files are compared with the previous installation and the store like in
+    extract_members when their CRC-32 is known up front, as zip local headers have it.
+
+    The lemonade-windows-msvc* folder is recognised from the first member; a later
+    member outside of it cannot be placed without the central directory.
+
+    :raises archives.NotStreamable: If the archive cannot be extracted in a single pass.
+    :return: Tuple of (bytes written, manifest files dict of the new installation).
+    """
+    previous = previous or {}
+    installed_dir = link_from or extract_to
+    stream = source.stream
+    prefix = None
+    files = {}
+    written = stored = extracted = 0
+    for raw_name, member in iter_build_members(source.read):
+        if prefix is None:
+            prefix = _stream_prefix(raw_name)
+        if not raw_name.startswith(prefix):
+            raise archives.NotStreamable(f"{raw_name} is outside of {prefix}.")
+        name = raw_name[len(prefix):].rstrip('/')
+        if not name:
+            continue
+        path = target_path(extract_to, name)
+        if raw_name.endswith('/'):
+            os.makedirs(path, exist_ok=True)
+            continue
+        name = os.path.relpath(path, extract_to).replace(os.sep, '/')
+        entry, from_store = _reuse(name, path, member.file_size, member.header_crc, previous, installed_dir,
+                                   link_from, store)
+        if entry is not None:
+            files[name] = entry
+            stored += from_store
+            continue
+        digest = hashlib.sha256()
+        with tracing.span('inflate', 'extract', member=name), open(path, 'wb') as target:
+            while True:
+                data = member.read(CHUNK_SIZE)
+                if not data:
+                    break
+                target.write(data)
+                digest.update(data)
+                written += len(data)
+                tracing.add('extracted bytes', len(data))
+                if progress_callback:
+                    progress_callback(stream.consumed, stream.total or 0)
+        files[name] = {'size': member.size, 'crc32': member.crc, 'sha256': digest.hexdigest()}
+        extracted += 1
+    if not files:
+        raise zipfile.BadZipFile("The archive is empty.")
+    # The rest is the central directory, read so the download can finish
+    source.drain()
+    if previous:
+        logging.info(f"{extracted} of {len(files)} files changed.")
+    if stored:
+        logging.info(f"{stored} files linked from the store.")
+    return written, files
+
+
+def _extract_archive(source, extract_to, progress_callback, incremental, workers, link_from, store):
+    previous = manifest.load(link_from or extract_to) if incremental else None
+    if isinstance(source, StreamSource):
+        written, files = extract_stream(source, extract_to, progress_callback, previous, link_from, store)
+    else:
+        written, files = extract_members(source, extract_to, progress_callback, previous, workers, link_from,
+                                         store)
+    if previous and not link_from:
+        manifest.remove_stale(extract_to, previous, files)
+    if store:
+        with tracing.span('store intern', 'extract'):
+            store.intern(extract_to, files)
+    with tracing.span('manifest', 'extract'):
+        manifest.save(extract_to, files)
+    return written
+
+
+def nested_stream_source(zip_path, info):
+    """Returns a StreamSource reading an archive stored inside a zip front to back, without extracting it first."""
+    outer = zipfile.ZipFile(zip_path)
+    # The member keeps the file open after the ZipFile is closed
+    member = outer.open(info)
+    outer.close()
+    return StreamSource(streaming.FileStream(member, info.file_size))
+
+
+def open_artifact(path):
+    """
+    Opens a downloaded Lemonade artifact in any format archives.detect knows, locating
+    the nested build archive if there is one. Zip builds are opened through their
+    central directory; others can only be read front to back and become a StreamSource.
+    Raises zipfile.BadZipFile when the outer central directory is damaged, and
+    archives.ArchiveError when the format is unknown.
+
+    :return: ArchiveSource or StreamSource of the build; call cleanup() on it when done.
+    """
+    with open(path, 'rb') as file:
+        backend = archives.detect(file.read(archives.HEADER_SIZE))
+    if not backend.random_access:
+        return StreamSource(streaming.FileStream(open(path, 'rb'), os.path.getsize(path)))
+    with open(path, 'rb') as outer_file, zipfile.ZipFile(outer_file) as outer:
+        nested_info = find_nested_archive(outer)
+        if nested_info is None:
+            return ArchiveSource(path)
+        if archives.for_name(nested_info.filename).random_access:
+            return nested_zip_source(path, outer_file, outer, nested_info)
+    return nested_stream_source(path, nested_info)
+
+
+def validate_source(source):
+    """
+    Checks that the build's central directory can be read and that every member
+    maps to a safe path, without inflating anything. Meant to run before any
+    existing file is touched.
+
+    :raises zipfile.BadZipFile: If the archive is damaged.
+    :raises ValueError: If a member would be written outside the installation directory.
+    """
+    if isinstance(source, StreamSource):
+        # Only readable front to back; every member is checked as it is extracted into staging
+        return
+    with source.open() as archive:
+        infos = archive.infolist()
+    if not infos:
+        raise zipfile.BadZipFile("The archive is empty.")
+    prefix = strip_prefix([info.filename for info in infos])
+    for info in infos:
+        name = info.filename[len(prefix):]
+        if name:
+            target_path('.', name)
+
+
+def extract_source(source, extract_to, progress_callback=None, incremental=False, workers=DEFAULT_WORKERS,
+                   link_from=None, store=None):
+    """
+    Extracts an opened artifact, see extract_artifact.
+
+    :param link_from: Existing installation to compare against and hard link unchanged files from,
+                      when extracting into a separate staging directory.
+    :param store: Optional opened store.FileStore shared with other installations; known
+                  content is linked from it and every extracted file is added to it.
+
+    :return: Number of bytes written to disk, including any scratch spooling.
+    """
+    os.makedirs(extract_to, exist_ok=True)
+    written = _extract_archive(source, extract_to, progress_callback, incremental, workers, link_from, store)
+    logging.info(f"Extraction completed to {extract_to}.")
+    return written + source.scratch_size
+
+
+def extract_artifact(archive_path, extract_to, progress_callback=None, incremental=False, workers=DEFAULT_WORKERS):
+    """
+    Extracts a downloaded Lemonade artifact in a single pass. When the archive
+    wraps another one (as nightly.link artifacts do) the inner archive is read
+    straight out of the outer one instead of being extracted to a temp folder.
+    Zip builds are inflated in parallel, tar and tar.zst builds front to back.
+
+    An install manifest is written next to the files. In incremental mode the
+    existing manifest is compared with the archive so only changed or new files
+    are written and files dropped from the new version are deleted.
+
+    :param archive_path: Path to the downloaded archive.
+    :param extract_to: Destination directory.
+    :param progress_callback: Optional callable receiving (written_bytes, total_bytes).
+    :param incremental: Update an existing installation in place using its manifest.
+    :param workers: Maximum number of extraction threads.
+    :return: Number of bytes written to disk, including any scratch spooling.
+    """
+    source = open_artifact(archive_path)
+    try:
+        return extract_source(source, extract_to, progress_callback, incremental, workers)
+    finally:
+        source.cleanup()
@@ -0,0 +1,261 @@
+import io
+import re
+import json
+import time
+import random
+import hashlib
+import tarfile
+import zipfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+ARTIFACT_NAME = 'lemonade-windows-msvc-benchmark.zip'
+LEMONADE_RELEASES_PATH = '/repos/Lemonade-emu/Lemonade/releases'
+INSTALLER_RELEASES_PATH = '/repos/Lemonade-emu/Lemonade-installer/releases'
+NIGHTLY_PATH = '/nightly/windows-msvc.zip'
+DOWNLOAD_PREFIX = '/download/'
+# Last-Modified of the API responses
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+def synthetic_files(size, file_count, seed=0):
+    """
+    Files shaped like a windows-msvc emulator build: one large executable, a few big
+    Qt/ANGLE-like DLLs and many small plugins and translations. Roughly half of every
+    file is random so they compress like real binaries.
+
+    :param size: Approximate total uncompressed size in bytes.
+    :param file_count: Number of files in the build.
+    :return: List of (name, content) with every name under a lemonade-windows-msvc* folder.
+    """
+    rng = random.Random(seed)
+    prefix = ARTIFACT_NAME[:-len('.zip')] + '/'
+    names = ['lemonade-qt.exe'] + [f'Qt6Module{index}.dll' for index in range(min(6, file_count - 1))]
+    names += [f'plugins/plugin{index}.dll' for index in range(file_count - len(names))]
+    # The executable and the first DLLs take most of the space, like the real build
+    weights = [40] + [8] * min(6, file_count - 1) + [1] * (file_count - 1 - min(6, file_count - 1))
+    scale = size / sum(weights)
+    files = []
+    for name, weight in zip(names, weights):
+        file_size = max(1, int(weight * scale))
+        random_part = rng.randbytes(file_size // 2)
+        files.append((prefix + name, random_part + bytes(file_size - len(random_part))))
+    return files
+
+
+def synthetic_build(size, file_count, seed=0):
+    """
+    Zips synthetic_files the way the build is published.
+
+    :return: Zip bytes with every file under a lemonade-windows-msvc* folder.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in synthetic_files(size, file_count, seed):
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def synthetic_tar(size, file_count, seed=0, zstd_level=None):
+    """
+    The same build as a tar, compressed with Zstandard at zstd_level unless that is None.
+    Compressing needs the optional zstandard package.
+
+    :return: tar or tar.zst bytes.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.PAX_FORMAT) as archive:
+        for name, data in synthetic_files(size, file_count, seed):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1704067200
+            archive.addfile(info, io.BytesIO(data))
+    if zstd_level is None:
+        return buffer.getvalue()
+    import zstandard
+    # With a content checksum, as the zstd command line tool writes by default
+    return zstandard.ZstdCompressor(level=zstd_level, write_checksum=True).compress(buffer.getvalue())
+
+
+def nightly_artifact(build, name=ARTIFACT_NAME):
+    """Wraps a build the way nightly.link does: a zip holding the build archive."""
+    buffer = io.BytesIO()
+    # A fixed timestamp keeps the wrapper byte-identical across servers, like a real mirror
+    info = zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0))
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(info, build, compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+class FakeGitHub:
+    """
+    Local HTTP stand-in for the GitHub releases API, the release download URLs and nightly.link.
+
+    Serves ETag/If-None-Match, HEAD, Range and If-Range like the real hosts, and can
+    cap its transfer rate to imitate a slow link.
+
+    :param build: Archive bytes of the emulator build.
+    :param artifact_name: Name the build is published under, its suffix tells the format.
+    :param uninstaller: Bytes served as uninstaller.exe.
+    :param rate: Optional bytes per second per connection.
+    :param stall_after: Optional number of bytes after which every download stops
+                        sending without closing, like a hanging mirror.
+    :param ranges: Advertise Accept-Ranges and honour Range; off, every download is a single stream.
+
+    Set api_status to an error code such as 403 to have the releases API refuse every
+    request, like GitHub does once the rate limit is used up.
+    """
+
+    def __init__(self, build, uninstaller=b'MZ' + bytes(64 * 1024), rate=None, stall_after=None,
+                 artifact_name=ARTIFACT_NAME, ranges=True):
+        self.artifact_name = artifact_name
+        self.ranges = ranges
+        self.files = {
+            DOWNLOAD_PREFIX + artifact_name: build,
+            DOWNLOAD_PREFIX + 'uninstaller.exe': uninstaller,
+            NIGHTLY_PATH: nightly_artifact(build, artifact_name),
+        }
+        self.etags = {path: '"' + hashlib.sha1(data).hexdigest() + '"' for path, data in self.files.items()}
+        self.rate = rate
+        self.stall_after = stall_after
+        self.api_status = None
+        self.stopped = threading.Event()
+        # (method, path, headers dict) of every request and (path, status) of every response
+        self.requests = []
+        self.responses = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def releases_url(self):
+        return self.base_url + LEMONADE_RELEASES_PATH
+
+    @property
+    def installer_releases_url(self):
+        return self.base_url + INSTALLER_RELEASES_PATH
+
+    @property
+    def nightly_url(self):
+        return self.base_url + NIGHTLY_PATH
+
+    def releases(self, name):
+        path = DOWNLOAD_PREFIX + name
+        return [{
+            'tag_name': 'benchmark',
+            'assets': [{
+                'id': int(self.etags[path][1:9], 16),
+                'name': name,
+                'size': len(self.files[path]),
+                'digest': 'sha256:' + hashlib.sha256(self.files[path]).hexdigest(),
+                'updated_at': '2024-01-01T00:00:00Z',
+                'browser_download_url': self.base_url + path,
+            }],
+        }]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_response(self, code, message=None):
+                fake.responses.append((self.path, code))
+                super().send_response(code, message)
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                fake.requests.append((self.command, self.path, dict(self.headers)))
+                if self.path == LEMONADE_RELEASES_PATH:
+                    return self.send_json(fake.releases(fake.artifact_name))
+                if self.path == INSTALLER_RELEASES_PATH:
+                    return self.send_json(fake.releases('uninstaller.exe'))
+                if self.path not in fake.files:
+                    self.send_error(404)
+                    return
+                self.send_file(fake.files[self.path], fake.etags[self.path], head)
+
+            def send_json(self, data):
+                if fake.api_status:
+                    self.send_error(fake.api_status)
+                    return
+                body = json.dumps(data).encode('utf-8')
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', LAST_MODIFIED)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self, data, etag, head):
+                start, end = 0, len(data) - 1
+                match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+                if_range = self.headers.get('If-Range')
+                if fake.ranges and match and (if_range is None or if_range == etag):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    self.send_response(200)
+                if fake.ranges:
+                    self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                if not head:
+                    self.write_throttled(memoryview(data)[start:end + 1])
+
+            def write_throttled(self, body):
+                step = 64 * 1024
+                started = time.monotonic()
+                try:
+                    for offset in range(0, len(body), step):
+                        if fake.stall_after is not None and offset >= fake.stall_after:
+                            fake.stopped.wait()
+                            return
+                        self.wfile.write(body[offset:offset + step])
+                        if fake.rate:
+                            delay = (offset + step) / fake.rate - (time.monotonic() - started)
+                            if delay > 0:
+                                time.sleep(delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
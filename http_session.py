@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cache
+import tracing
+
+
+USER_AGENT = 'Lemonade-installer'
+POOL_SIZE = 16
+TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class _TimeoutSession(requests.Session):
+    """Session that applies a default timeout so a dead connection cannot hang the installer."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', TIMEOUT)
+        # Ends once the headers arrived: connecting, TLS and time to first byte, not the body of a stream
+        with tracing.span(method, 'http', url=url) as span:
+            response = super().request(method, url, **kwargs)
+            span.set(status=response.status_code)
+        return response
+
+
+def get_session():
+    """
+    Returns the process-wide HTTP session. Connections are kept alive and pooled,
+    so the API lookups, the probe and the download segments reuse TCP/TLS handshakes.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = _TimeoutSession()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            _session = session
+        return _session
+
+
+def metadata_dir():
+    return os.path.join(cache.default_cache_dir(), 'metadata')
+
+
+def _metadata_path(url):
+    return os.path.join(metadata_dir(), hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def _load_metadata(url):
+    try:
+        with open(_metadata_path(url), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_metadata(url, response):
+    path = _metadata_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'body': response.json(),
+    }
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(entry, file)
+    os.replace(temp_path, path)
+    return entry['body']
+
+
+def get_json(url, session=None):
+    """
+    Fetches a JSON document with a conditional request. The last response is kept
+    on disk and revalidated with If-None-Match/If-Modified-Since, so an unchanged
+    release list comes back as a 304, which GitHub does not count against the rate limit.
+    When the server refuses the request because of rate limiting, the cached copy is used.
+
+    :param url: URL of the JSON document.
+    :param session: Optional requests.Session, defaults to the shared one.
+    :return: The decoded JSON body.
+    """
+    session = session or get_session()
+    cached = _load_metadata(url)
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    response = session.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        logging.info(f"{url} not modified, using the cached copy.")
+        return cached['body']
+    if response.status_code in (403, 429) and cached:
+        logging.warning(f"{url} refused with HTTP {response.status_code}, using the cached copy.")
+        return cached['body']
+    response.raise_for_status()
+    return _save_metadata(url, response)
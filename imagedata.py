@@ -1,7 +1,68 @@
-import base64
+"""
+Build step turning Lemonade.png into what the installer shows at startup, run by build.ps1.
 
-with open("Lemonade.png", "rb") as image_file:
-    encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+The logo is decoded and scaled here once instead of every time the installer starts:
+image_assets.py holds it as zlib-compressed premultiplied RGBA pixels for every size
+in SIZES, ready to wrap in a QImage without PNG decoding or smooth scaling, and
+splash.png is the logo the PyInstaller bootloader shows while it unpacks Qt.
+The scaling is Qt's own, the same smooth transform the installer used to run at startup.
+"""
+import sys
+import zlib
 
-with open("image_base64.py", "w") as text_file:
-    text_file.write(f"image_data = '{encoded_string}'")
\ No newline at end of file
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage
+
+SOURCE = 'Lemonade.png'
+OUTPUT = 'image_assets.py'
+SPLASH = 'splash.png'
+# Logo size on the installer pages, and twice that for 200% display scaling
+LOGO_SIZE = 128
+SIZES = (LOGO_SIZE, LOGO_SIZE * 2)
+SPLASH_SIZE = 256
+
+
+def load(path):
+    image = QImage()
+    if not image.load(path):
+        raise ValueError(f"Could not read {path}")
+    # Premultiplied, so smooth scaling does not bleed the colour of transparent pixels
+    return image.convertToFormat(QImage.Format.Format_RGBA8888_Premultiplied)
+
+
+def scale(image, size):
+    """Smoothly scales image to fit in size x size, keeping its aspect ratio."""
+    return image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+def pixels(image):
+    """The rows of an RGBA8888 image without the padding Qt may add to each of them."""
+    data = image.constBits().asstring(image.sizeInBytes())
+    stride, row = image.bytesPerLine(), image.width() * 4
+    return b''.join(data[offset:offset + row] for offset in range(0, stride * image.height(), stride))
+
+
+def main(source=SOURCE, output=OUTPUT, splash=SPLASH):
+    image = load(source)
+    logos = {}
+    for size in SIZES:
+        logo = scale(image, size)
+        logos[size] = (logo.width(), logo.height(), zlib.compress(pixels(logo), 9))
+
+    with open(output, 'w') as file:
+        file.write(f"# Generated by imagedata.py from {source}, do not edit\n")
+        file.write(f"LOGO_SIZE = {LOGO_SIZE}\n")
+        file.write("# Size: (width, height, zlib-compressed premultiplied RGBA8888 pixels)\n")
+        file.write("LOGOS = {\n")
+        for size, (logo_width, logo_height, data) in logos.items():
+            file.write(f"    {size}: ({logo_width}, {logo_height}, {data!r}),\n")
+        file.write("}\n")
+
+    if not scale(image, SPLASH_SIZE).convertToFormat(QImage.Format.Format_RGBA8888).save(splash):
+        raise OSError(f"Could not write {splash}")
+    print(f"Wrote {output} ({', '.join(f'{size}px {len(data[2])} bytes' for size, data in logos.items())}) "
+          f"and {splash}.")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,45 +1,64 @@
-import os
-import requests
 from PyQt6.QtWidgets import QApplication, QLabel, QPushButton, QVBoxLayout, QWidget, QCheckBox, QStackedLayout, QHBoxLayout, QGroupBox, QComboBox, QProgressBar, QMessageBox
 from PyQt6.QtGui import QPixmap, QIcon, QImage
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QByteArray
-import zipfile
-import shutil
-import tempfile
-import win32com.client
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
 import logging
-import re
-import winreg as reg
-import base64
-from image_base64 import image_data
+import zlib
+import channels
+import image_assets
+import tracing
 
 
-class DownloadThread(QThread):
-    progress = pyqtSignal(int)
+_logo = None
 
-    def __init__(self, url, dest):
+
+def logo_pixmap():
+    """
+    The logo shown on every page, built once from the pixels imagedata.py scaled at
+    build time, so starting needs no PNG decoding or smooth scaling. QPixmap is
+    implicitly shared, every label uses this one.
+    """
+    global _logo
+    if _logo is None:
+        screen = QApplication.primaryScreen()
+        needed = image_assets.LOGO_SIZE * (screen.devicePixelRatio() if screen else 1.0)
+        size = min((size for size in image_assets.LOGOS if size >= needed), default=max(image_assets.LOGOS))
+        width, height, data = image_assets.LOGOS[size]
+        pixels = zlib.decompress(data)
+        # The QImage only borrows pixels, fromImage copies them
+        image = QImage(pixels, width, height, width * 4, QImage.Format.Format_RGBA8888_Premultiplied)
+        _logo = QPixmap.fromImage(image)
+        _logo.setDevicePixelRatio(size / image_assets.LOGO_SIZE)
+    return _logo
+
+
+class PipelineThread(QThread):
+    """Runs the whole installation pipeline, so nothing but progress updates reaches the GUI thread."""
+    stageProgress = pyqtSignal(str, int)
+
+    def __init__(self, pipeline):
         super().__init__()
-        self.url = url
-        self.dest = dest
+        self.pipeline = pipeline
+        self.error = None
+        # Stage events are already coalesced by the scheduler's telemetry
+        self.pipeline.subscribe(self.report_progress)
 
     def run(self):
+        import engine
+
         try:
-            response = requests.get(self.url, stream=True)
-            total_size = int(response.headers.get('content-length', 0))
-            if total_size == 0:
-                QMessageBox.critical(self, "Error", "The content-length of the response is zero.")
-                return
-
-            downloaded_size = 0
-            with open(self.dest, 'wb') as file:
-                for data in response.iter_content(1024):
-                    downloaded_size += len(data)
-                    file.write(data)
-                    progress_percentage = (downloaded_size / total_size) * 100
-                    self.progress.emit(int(progress_percentage))
-            print(f"Download completed. File saved to {self.dest}")
+            engine.run_pipeline(self.pipeline)
+        except engine.InstallError as e:
+            self.error = str(e)
         except Exception as e:
-            QMessageBox.critical(self, "Error", "Error doing downlaod.")
+            self.error = f"An error occurred: {e}"
+            logging.error(f"Installation failed: {e}")
+
+    def cancel(self):
+        self.pipeline.cancel()
+
+    def report_progress(self, event):
+        if event.percent is not None:
+            self.stageProgress.emit(event.phase, int(event.percent))
 
 class Installer(QWidget):
     def __init__(self):
@@ -53,12 +72,7 @@ class Installer(QWidget):
             headerLayout = QHBoxLayout()
             headerLayout.addStretch(1)
             iconLabel = QLabel()
-            image_bytes = base64.b64decode(image_data)
-            image = QImage.fromData(QByteArray(image_bytes))
-            pixmap = QPixmap.fromImage(image)
-            # Scale the pixmap to a new size while maintaining the aspect ratio
-            scaledPixmap = pixmap.scaled(128, 128, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            iconLabel.setPixmap(scaledPixmap)
+            iconLabel.setPixmap(logo_pixmap())
             headerLayout.addWidget(iconLabel)
             headerLayout.addStretch(1)
             return headerLayout
@@ -121,11 +135,7 @@ class Installer(QWidget):
 
         # Add the icon to the progress bar page
         iconLabel = QLabel()
-        image_bytes = base64.b64decode(image_data)
-        image = QImage.fromData(QByteArray(image_bytes))
-        pixmap = QPixmap.fromImage(image)
-        scaledPixmap = pixmap.scaled(128, 128, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        iconLabel.setPixmap(scaledPixmap)
+        iconLabel.setPixmap(logo_pixmap())
         progressBarLayout.addWidget(iconLabel, alignment=Qt.AlignmentFlag.AlignCenter)  # Add the icon and center it
 
         self.downloadProgressBar = QProgressBar()
@@ -144,11 +154,7 @@ class Installer(QWidget):
 
         # Add the icon to the finish page
         iconLabel = QLabel()
-        image_bytes = base64.b64decode(image_data)
-        image = QImage.fromData(QByteArray(image_bytes))
-        pixmap = QPixmap.fromImage(image)
-        scaledPixmap = pixmap.scaled(128, 128, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        iconLabel.setPixmap(scaledPixmap)
+        iconLabel.setPixmap(logo_pixmap())
 
         self.finishPage = QWidget()
         finishLayout = QVBoxLayout()
@@ -162,6 +168,7 @@ class Installer(QWidget):
         self.finishPage.setLayout(finishLayout)
 
         self.layout.addWidget(self.finishPage)
+        self.pipeline_thread = None
 
 
     def showInstallPage(self):
@@ -178,251 +185,46 @@ class Installer(QWidget):
 
 
     def install(self):
+        # requests and the rest of the engine load on the first install instead of delaying the window
+        import engine
+
         selection = self.installationSourceComboBox.currentText()
-        if selection == "Latest Nightly":
-            url = "https://nightly.link/Lemonade-emu/Lemonade/workflows/build/master/windows-msvc.zip"
-            response = requests.get(url, stream=True)
-            if response.status_code == 200:
-                print("Download successful, proceeding with installation.")
-            else:
-                QMessageBox.critical(self, "Error", "Failed to download. HTTP status code: {response.status_code}.")
-                return
-        elif selection == "Latest Release":
-            url = self.get_latest_release_url()
-            if not url:
-                QMessageBox.critical(self, "Error", "Repo URL was not found.")
-                return
-        temp_file = tempfile.NamedTemporaryFile(delete=False).name
-        self.download_thread = DownloadThread(url, temp_file)
-        self.download_thread.progress.connect(self.downloadProgressBar.setValue)
-        self.download_thread.finished.connect(lambda: self.extract_zip(temp_file, os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade')))
-        self.download_thread.start()
-
-    def get_latest_release_url(self):
-        try:
-            api_url = "https://api.github.com/repos/Lemonade-emu/Lemonade/releases"
-            response = requests.get(api_url)
-            if response.status_code != 200:
-                QMessageBox.critical(self, "Error", "Failed to fetch releases from GitHub.")
-                return None
-
-            releases = response.json()
-            for release in releases:
-                assets = release.get('assets', [])
-                for asset in assets:
-                    if "windows-msvc" in asset['name']:
-                        return asset['browser_download_url']
-            QMessageBox.critical(self, "Error", "No suitable release found.")
-            return None
-        except Exception as e:
-            QMessageBox.critical(self, "Exception", f"An error occurred: {e}")
-            return None
-
-    def clear_directory(self, directory):
-        """
-        Removes all files and directories in the specified directory.
-
-        :param directory: Path to the directory to clear.
-        """
-        for item in os.listdir(directory):
-            item_path = os.path.join(directory, item)
-            try:
-                if os.path.isfile(item_path) or os.path.islink(item_path):
-                    os.unlink(item_path)
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-            except Exception as e:
-                logging.error(f'Failed to delete {item_path}. Reason: {e}')
-
-    def extract_zip(self, temp_file, extract_to):
-        try:
-            # Clear the target directory before extracting new files
-            if os.path.exists(extract_to):
-                self.clear_directory(extract_to)
-
-            # Rename the temporary file to have a .zip extension
-            zip_file_path = temp_file + '.zip'
-            os.rename(temp_file, zip_file_path)
-
-            # Temporary extraction folder
-            temp_extract_folder = tempfile.mkdtemp()
-
-            # Extract the main zip file to a temporary folder
-            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_extract_folder)
-                logging.info(f"Main zip extraction completed to temporary folder.")
-
-            # Find the nested zip file or the main directory
-            nested_zip_path = None
-            for root, dirs, files in os.walk(temp_extract_folder):
-                for file in files:
-                    if file.endswith('.zip'):
-                        nested_zip_path = os.path.join(root, file)
-                        break
-                if nested_zip_path:  # Stop searching if the nested zip is found
-                    break
-
-            if nested_zip_path:
-                with zipfile.ZipFile(nested_zip_path, 'r') as nested_zip_ref:
-                    nested_zip_ref.extractall(extract_to)
-                    logging.info(f"Nested zip extraction completed to {extract_to}.")
-            else:
-                # If no nested zip, move the contents from the temp folder to the desired location
-                for item in os.listdir(temp_extract_folder):
-                    s = os.path.join(temp_extract_folder, item)
-                    d = os.path.join(extract_to, item)
-                    if os.path.isdir(s):
-                        shutil.move(s, d)
-                    else:
-                        shutil.copy2(s, d)
-                logging.info("Moved extracted files to the desired location.")
-
-            # After extracting all files
-            nested_dir_name = None
-            for item in os.listdir(extract_to):
-                if os.path.isdir(os.path.join(extract_to, item)) and 'lemonade-windows-msvc' in item:
-                    nested_dir_name = item
-                    break
-
-            if nested_dir_name:
-                nested_dir_path = os.path.join(extract_to, nested_dir_name)
-                for item in os.listdir(nested_dir_path):
-                    s = os.path.join(nested_dir_path, item)
-                    d = os.path.join(extract_to, item)
-                    if os.path.isdir(s):
-                        shutil.move(s, d)
-                    else:
-                        shutil.copy2(s, d)
-                # Remove the now-empty nested directory
-                shutil.rmtree(nested_dir_path)
-
-            # Github info
-            release_api_url = "https://api.github.com/repos/Lemonade-emu/Lemonade-installer/releases"
-            dest_path = os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade', 'uninstaller.exe')
-
-            # Set the progress bar to 100% and call installation_complete
-            self.extractionProgressBar.setValue(100)
-            executable_path = os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade', 'lemonade-qt.exe')
-            self.download_uninstaller(release_api_url, dest_path)
-            self.add_to_programs_list(executable_path)
-            self.installation_complete()
-        except Exception as e:
-            logging.error(f"Failed to extract zip file: {e}. File: {item}")
+        channel = 'nightly' if selection == "Latest Nightly" else 'release'
+        # Release and nightly install side by side, each into its own folder
+        pipeline = engine.build_pipeline(channel, channels.default_install_dir(channel),
+                                         self.desktopShortcutCheckbox.isChecked(),
+                                         self.startMenuShortcutCheckbox.isChecked())
+        self.pipeline_thread = PipelineThread(pipeline)
+        self.pipeline_thread.stageProgress.connect(self.report_stage_progress)
+        self.pipeline_thread.finished.connect(self.pipelineFinished)
+        self.pipeline_thread.start()
+
+    def report_stage_progress(self, stage, percent):
+        if stage == 'download':
+            self.downloadProgressBar.setValue(percent)
+        elif stage == 'extract':
+            self.extractionProgressBar.setValue(percent)
+
+    def pipelineFinished(self):
+        if self.pipeline_thread.error is not None:
+            QMessageBox.critical(self, "Error", self.pipeline_thread.error)
+            return
+        self.installation_complete()
 
     def installation_complete(self):
-        executable_path = os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade', 'lemonade-qt.exe')
-        if self.desktopShortcutCheckbox.isChecked():
-            self.create_desktop_shortcut(executable_path)
-        if self.startMenuShortcutCheckbox.isChecked():
-            self.create_start_menu_shortcut(executable_path)
+        self.downloadProgressBar.setValue(100)
+        self.extractionProgressBar.setValue(100)
         self.layout.setCurrentIndex(self.layout.indexOf(self.finishPage))  # Switch to finish page
 
-    def download_uninstaller(self, release_api_url, dest_path):
-        try:
-            logging.info("Starting to download uninstaller.")
-            response = requests.get(release_api_url)
-            response.raise_for_status()  # This will raise an exception for HTTP errors
-            releases = response.json()
-            found = False
-            for release in releases:
-                for asset in release.get('assets', []):
-                    if asset['name'] == "uninstaller.exe":
-                        uninstaller_url = asset['browser_download_url']
-                        self.download_file(uninstaller_url, dest_path)
-                        found = True
-                        logging.info("Uninstaller downloaded successfully.")
-                        break
-                if found:
-                    break
-            if not found:
-                logging.error("Uninstaller not found in any release.")
-        except requests.RequestException as e:
-            logging.error(f"Error downloading uninstaller: {e}")
-
-    def download_file(self, url, dest_path):
-        try:
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                with open(dest_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-        except requests.RequestException as e:
-            print(f"Error saving the uninstaller: {e}")
-
-    def add_to_programs_list(self, executable_path):
-        """
-        Add the application to the Windows Program list with the uninstall option.
-
-        :param executable_path: Path to the executable file of the application.
-        """
-        print("Adding to programs list...")
-        # Path to the uninstall key
-        key_path = r"Software\Microsoft\Windows\CurrentVersion\Uninstall\Lemonade"
-        # Uninstaller path
-        uninstaller_path = os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade', 'uninstaller.exe')
-        print(f"Uninstaller path: {uninstaller_path}")
-
-        # Attempt to open the key, create if it does not exist
-        try:
-            key = reg.OpenKey(reg.HKEY_CURRENT_USER, key_path, 0, reg.KEY_WRITE)
-            print("Registry key exists, opened successfully.")
-        except FileNotFoundError:
-            key = reg.CreateKey(reg.HKEY_CURRENT_USER, key_path)
-            print("Registry key does not exist, created successfully.")
-
-        # Set values within the key
-        with key:
-            reg.SetValueEx(key, "DisplayName", 0, reg.REG_SZ, "Lemonade")
-            reg.SetValueEx(key, "UninstallString", 0, reg.REG_SZ, uninstaller_path)
-            reg.SetValueEx(key, "DisplayIcon", 0, reg.REG_SZ, executable_path)
-            reg.SetValueEx(key, "Publisher", 0, reg.REG_SZ, "Lemonade-Emu")
-            reg.SetValueEx(key, "URLInfoAbout", 0, reg.REG_SZ, "https://lemonade-emu.github.io/")
-            print("Registry values set successfully.")
-
-        print("Added to programs list successfully.")
-
-    def create_desktop_shortcut(self, target):
-        desktop_path = os.path.join(os.environ['USERPROFILE'], 'Desktop')
-        shortcut_path = os.path.join(desktop_path, 'Lemonade.lnk')
-        self.create_shortcut(target, shortcut_path)
-
-    def create_start_menu_shortcut(self, target):
-        start_menu_path = os.path.join(os.environ['APPDATA'], 'Microsoft', 'Windows', 'Start Menu', 'Programs')
-        shortcut_path = os.path.join(start_menu_path, 'Lemonade.lnk')
-        self.create_shortcut(target, shortcut_path)
-
-
-    def create_shortcut(self, target, shortcut_path, description="", arguments="", hotkey=""):
-        """
-        Creates a shortcut at the specified path pointing to the target file.
-
-        :param target: Path to the target file the shortcut will point to.
-        :param shortcut_path: Path where the shortcut will be created.
-        :param description: Description of the shortcut.
-        :param arguments: Additional arguments to pass to the target when executed.
-        :param hotkey: Hotkey associated with the shortcut.
-        """
-        # Verify the target exists
-        if not os.path.exists(target):
-            logging.error(f"Shortcut target does not exist: {target}")
-            return
-
-        try:
-            shell = win32com.client.Dispatch("WScript.Shell")
-            shortcut = shell.CreateShortCut(shortcut_path)
-            shortcut.TargetPath = target
-            shortcut.WorkingDirectory = os.path.dirname(target)
-            shortcut.Description = description
-            shortcut.Arguments = arguments
-            if hotkey:
-                shortcut.Hotkey = hotkey
-            shortcut.IconLocation = target  # You can customize this if needed
-            shortcut.save()
-            logging.info(f"Shortcut created successfully at {shortcut_path}")
-        except Exception as e:
-            logging.error(f"Failed to create shortcut: {e}")
+    def closeEvent(self, event):
+        # Stop a running installation at its next progress report; the live installation stays untouched
+        if self.pipeline_thread is not None and self.pipeline_thread.isRunning():
+            self.pipeline_thread.cancel()
+            self.pipeline_thread.wait()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
+    tracing.enable_from_environment()
     app = QApplication([])
 
     # Define the dark stylesheet
@@ -460,4 +262,10 @@ if __name__ == '__main__':
 
     installer = Installer()
     installer.show()
+    # The bundled installer shows splash.png while it unpacks, until the window is up
+    try:
+        import pyi_splash
+        pyi_splash.close()
+    except ImportError:
+        pass
     app.exec()
@@ -0,0 +1,84 @@
+import os
+import json
+import logging
+
+
+MANIFEST_NAME = 'install-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST_NAME)
+
+
+def load(directory):
+    """
+    Reads the manifest of an existing installation.
+
+    :param directory: Installation directory.
+    :return: Dict mapping relative paths to {'size', 'crc32', 'sha256'}, or None if there is no usable manifest.
+    """
+    try:
+        with open(manifest_path(directory), 'r') as file:
+            data = json.load(file)
+        if data.get('version') != MANIFEST_VERSION:
+            return None
+        return data['files']
+    except (OSError, ValueError, KeyError) as e:
+        logging.debug(f"No usable install manifest in {directory}: {e}")
+        return None
+
+
+def save(directory, files):
+    """
+    Writes the manifest atomically so an interrupted update never leaves a truncated one behind.
+
+    :param directory: Installation directory.
+    :param files: Dict mapping relative paths to {'size', 'crc32', 'sha256'}.
+    """
+    path = manifest_path(directory)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def is_unchanged(directory, name, entry, size, crc32):
+    """
+    Returns True if the installed copy of name matches the archive member with the given size and CRC32.
+    """
+    if entry is None or entry['size'] != size or entry['crc32'] != crc32:
+        return False
+    path = os.path.join(directory, *name.split('/'))
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
+
+
+def remove_stale(directory, old_files, new_files):
+    """
+    Deletes files that were installed previously but are no longer part of the new version,
+    along with any directories that become empty.
+
+    :return: Number of files removed.
+    """
+    directory = os.path.normpath(directory)
+    removed = 0
+    for name in old_files:
+        if name in new_files:
+            continue
+        path = os.path.join(directory, *name.split('/'))
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f'Failed to delete {path}. Reason: {e}')
+            continue
+        parent = os.path.dirname(path)
+        while parent != directory and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    return removed
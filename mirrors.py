@@ -0,0 +1,149 @@
+import os
+import re
+import time
+import logging
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import http_session
+import tracing
+
+
+# Bytes fetched from every candidate to measure it; also compared to catch mirrors serving another build
+PROBE_BYTES = 256 * 1024
+PROBE_TIMEOUT = 5
+
+
+class Source:
+    """
+    One URL serving an artifact, with what probing it measured.
+
+    :param url: URL to fetch from, after redirects.
+    :param validator: Value usable in If-Range for this URL, or None.
+    :param latency: Seconds until the response headers arrived.
+    :param throughput: Bytes/second while reading the probe.
+    :param size: Total size the URL reported.
+    :param ranges: Whether the URL answered the probe's Range request.
+    """
+
+    def __init__(self, url, validator=None, latency=0.0, throughput=0.0, size=None, ranges=True):
+        self.url = url
+        self.validator = validator
+        self.latency = latency
+        self.throughput = throughput
+        self.size = size
+        self.ranges = ranges
+
+    def estimate(self, size):
+        """Seconds this source should need for size bytes."""
+        if not self.throughput:
+            return float('inf')
+        return self.latency + size / self.throughput
+
+
+def configured_mirrors():
+    """
+    Mirrors from LEMONADE_MIRRORS, separated by commas or whitespace. Each entry is
+    either a base URL the original path is appended to, such as a LAN caching proxy,
+    or a template using {url} (quoted), {path} or {name}.
+    """
+    return [mirror for mirror in re.split(r'[\s,]+', os.environ.get('LEMONADE_MIRRORS', '')) if mirror]
+
+
+def mirror_url(mirror, url):
+    """Maps url onto mirror, see configured_mirrors."""
+    parts = urllib.parse.urlsplit(url)
+    if '{' in mirror:
+        return mirror.format(url=urllib.parse.quote(url, safe=''), path=parts.path,
+                             name=os.path.basename(parts.path))
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    return mirror.rstrip('/') + path
+
+
+def candidates(url, mirrors):
+    """The original url followed by its location on every mirror, without duplicates."""
+    urls = [url]
+    for mirror in mirrors:
+        candidate = mirror_url(mirror, url)
+        if candidate not in urls:
+            urls.append(candidate)
+    return urls
+
+
+def _total_size(response):
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and not content_range.endswith('/*'):
+        return int(content_range.rsplit('/', 1)[1])
+    if response.status_code == 200 and response.headers.get('content-length'):
+        return int(response.headers['content-length'])
+    return None
+
+
+def probe(url, session=None, probe_bytes=PROBE_BYTES):
+    """
+    Fetches the first probe_bytes of url to measure its latency and throughput.
+
+    :return: (Source, probed bytes), or None when url cannot be fetched.
+    """
+    session = session or http_session.get_session()
+    started = time.perf_counter()
+    try:
+        with session.get(url, headers={'Range': f'bytes=0-{probe_bytes - 1}'}, stream=True,
+                         timeout=PROBE_TIMEOUT) as response:
+            response.raise_for_status()
+            latency = time.perf_counter() - started
+            data = b''
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                data += chunk
+                if len(data) >= probe_bytes:
+                    break
+            elapsed = time.perf_counter() - started - latency
+            accepts_ranges = response.status_code == 206
+            validator = response.headers.get('ETag')
+            if not validator or validator.startswith('W/'):
+                validator = response.headers.get('Last-Modified')
+            source = Source(response.url, validator if accepts_ranges else None, latency,
+                            len(data) / elapsed if elapsed > 0 else float(len(data)), _total_size(response),
+                            accepts_ranges)
+            return source, data[:probe_bytes]
+    except requests.RequestException as e:
+        logging.warning(f"Mirror {url} is unreachable: {e}")
+        return None
+
+
+def rank(urls, session=None, probe_bytes=PROBE_BYTES):
+    """
+    Probes every URL in parallel and orders them fastest first by the estimated
+    time to fetch the whole file. URLs reporting another size or serving other
+    leading bytes than the first one (or, if that one is down, the first reachable
+    one) are dropped, since segments from them cannot be combined, and so are URLs
+    ignoring Range requests when others honour them.
+
+    :param urls: The original URL first, then its mirrors.
+    :return: List of Source, empty when none could be reached.
+    """
+    if len(urls) == 1:
+        return [Source(urls[0])]
+    with tracing.span('rank mirrors', 'download', count=len(urls)):
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            results = list(executor.map(lambda url: probe(url, session, probe_bytes), urls))
+    reachable = [result for result in results if result is not None]
+    if not reachable:
+        return []
+    reference, reference_data = reachable[0]
+    sources = []
+    for source, data in reachable:
+        if source.size != reference.size or data != reference_data[:len(data)]:
+            logging.warning(f"Mirror {source.url} does not serve the same file as {reference.url}, ignoring it.")
+            continue
+        sources.append(source)
+    # Segments cannot be fetched from a URL ignoring ranges, keep it only as a last resort
+    if any(source.ranges for source in sources):
+        sources = [source for source in sources if source.ranges]
+    size = reference.size or probe_bytes
+    sources.sort(key=lambda source: source.estimate(size))
+    for source in sources:
+        logging.info(f"Mirror {source.url}: {source.latency * 1000:.0f} ms, {source.throughput / 1024:.0f} KiB/s.")
+    return sources
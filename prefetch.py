@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+
+import requests
+
+import cache
+import channels
+import downloader
+import engine
+import tracing
+
+
+# Seconds between two checks for a new build
+DEFAULT_INTERVAL = 6 * 60 * 60
+# Bytes/second a background download may use, low enough not to get in the way of games or calls
+DEFAULT_RATE = 1024 * 1024
+# Seconds between looks at the install lock while downloading
+YIELD_CHECK_INTERVAL = 0.5
+
+# Outcomes of Prefetcher.prefetch
+CACHED = 'cached'
+PREFETCHED = 'prefetched'
+BUSY = 'busy'
+INTERRUPTED = 'interrupted'
+FAILED = 'failed'
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by any number of threads. Tokens (bytes) refill
+    at rate per second up to capacity; consume() takes its tokens right away, possibly
+    going into debt, and sleeps until the debt is paid back, so the long-run rate
+    never exceeds rate while short bursts up to capacity pass unthrottled.
+
+    :param rate: Tokens per second.
+    :param capacity: Largest burst, defaults to one second worth of tokens.
+    :param clock: Monotonic time source in seconds, replaceable in tests.
+    :param sleep: Function sleeping for the given seconds, replaceable in tests.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        """
+        Takes count tokens, sleeping as long as the rate requires.
+
+        :return: Seconds slept.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            self.sleep(delay)
+        return delay
+
+
+class Interrupted(Exception):
+    """Raised inside a prefetch download when an installation wants to start."""
+
+
+class _Throttle:
+    """Progress callback pacing a download through a TokenBucket and stopping it once should_stop() is true."""
+
+    def __init__(self, bucket, should_stop, clock):
+        self.bucket = bucket
+        self.should_stop = should_stop
+        self.clock = clock
+        self.done = None
+        self.next_check = clock()
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def __call__(self, done, total):
+        with self.lock:
+            # A resumed download reports what it already had first, that is not charged
+            count = max(0, done - self.done) if self.done is not None else 0
+            self.done = max(done, self.done or 0)
+            check = not self.stopped and self.clock() >= self.next_check
+            if check:
+                self.next_check = self.clock() + YIELD_CHECK_INTERVAL
+        if check and self.should_stop():
+            self.stopped = True
+        if self.stopped:
+            # Every segment worker ends up here on its next chunk
+            raise Interrupted()
+        if count:
+            self.bucket.consume(count)
+
+
+def is_prefetched(artifact, artifact_cache=None):
+    """Whether artifact is in the artifact cache, so installing it needs no download."""
+    if not artifact.validator:
+        return False
+    artifact_cache = artifact_cache or cache.default_cache()
+    path = artifact_cache.lookup(cache.make_key(artifact.url, artifact.validator))
+    if path is None:
+        return False
+    return not artifact.digest or os.path.basename(path) == artifact.digest.lower()
+
+
+def install_running():
+    """Whether an installation holds the install lock right now."""
+    lock = engine.install_lock()
+    if not lock.acquire(blocking=False):
+        return True
+    lock.release()
+    return False
+
+
+class Prefetcher:
+    """
+    Keeps the newest build of every channel in the artifact cache, so updating only
+    has to extract it. Each check is a conditional request; a new build is downloaded
+    at a capped rate into the same resumable partial file an installation would use.
+    An installation starting meanwhile makes the download stop within
+    YIELD_CHECK_INTERVAL and picks up where it left off.
+
+    :param channels: Channels to keep current.
+    :param interval: Seconds between checks in run().
+    :param rate: Download cap in bytes/second.
+    :param clock: Monotonic time source in seconds, replaceable in tests.
+    :param sleep: Function sleeping for the given seconds, replaceable in tests.
+    """
+
+    def __init__(self, channels=('release',), interval=DEFAULT_INTERVAL, rate=DEFAULT_RATE, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.channels = channels
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = TokenBucket(rate, clock=clock, sleep=sleep)
+
+    def prefetch(self, channel):
+        """
+        Checks channel once and downloads its build unless it is cached already.
+
+        :return: CACHED, PREFETCHED, BUSY (an installation or another prefetch is running),
+                 INTERRUPTED (an installation started meanwhile) or FAILED.
+        """
+        lock = engine.prefetch_lock()
+        if not lock.acquire(blocking=False):
+            logging.info("Another prefetch is running.")
+            return BUSY
+        try:
+            with tracing.span('prefetch', 'prefetch', channel=channel):
+                return self._prefetch(channel)
+        finally:
+            lock.release()
+
+    def _prefetch(self, channel):
+        if install_running():
+            logging.info("An installation is running, not prefetching.")
+            return BUSY
+        try:
+            artifact = engine.check_for_update(channel)
+        except engine.InstallError as e:
+            logging.warning(f"Checking the {channel} channel failed: {e}")
+            return FAILED
+        if is_prefetched(artifact):
+            logging.info(f"The latest {channel} build is already downloaded.")
+            return CACHED
+        logging.info(f"Prefetching the latest {channel} build at {self.bucket.rate // 1024} KiB/s.")
+        try:
+            dest = engine.download_artifact(artifact, _Throttle(self.bucket, install_running, self.clock))
+        except Interrupted:
+            logging.info("An installation started, the prefetch is left for it to finish.")
+            return INTERRUPTED
+        except (requests.RequestException, OSError, downloader.ValidatorChanged, downloader.IntegrityError) as e:
+            logging.warning(f"Prefetching the {channel} build failed: {e}")
+            return FAILED
+        # The cache holds the build now, the installation links it from there
+        os.remove(dest)
+        return PREFETCHED
+
+    def run_once(self):
+        """:return: Dict of channel to the outcome of prefetching it."""
+        return {channel: self.prefetch(channel) for channel in self.channels}
+
+    def run(self, cycles=None):
+        """Checks every interval seconds, forever or for the given number of cycles."""
+        cycle = 0
+        while True:
+            self.run_once()
+            cycle += 1
+            if cycles is not None and cycle >= cycles:
+                return
+            self.sleep(self.interval)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download new Lemonade builds in the background.")
+    parser.add_argument('--channel', action='append', choices=channels.CHANNELS,
+                        help="channel to keep current, may be repeated (default: release)")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between checks")
+    parser.add_argument('--rate-limit', type=float, default=DEFAULT_RATE / 1024,
+                        help="download cap in KiB/s")
+    parser.add_argument('--once', action='store_true',
+                        help="check once and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    tracing.enable_from_environment()
+    prefetcher = Prefetcher(tuple(args.channel or ('release',)), args.interval, int(args.rate_limit * 1024))
+    prefetcher.run(cycles=1 if args.once else None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
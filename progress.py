@@ -0,0 +1,150 @@
+import time
+import threading
+
+
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+# Aim for one read per this many seconds of transfer at the measured throughput
+CHUNK_DURATION = 0.05
+
+
+class ThroughputMeter:
+    """
+    Exponentially smoothed bytes/second estimate fed with a running byte count.
+    Not thread-safe on its own; callers serialise access.
+    """
+
+    def __init__(self, clock=time.monotonic, smoothing=0.3, sample_interval=0.05):
+        self.clock = clock
+        self.smoothing = smoothing
+        self.sample_interval = sample_interval
+        self.rate = 0.0
+        self.sample_time = clock()
+        self.sample_bytes = 0
+
+    def observe(self, done):
+        now = self.clock()
+        elapsed = now - self.sample_time
+        if elapsed < self.sample_interval:
+            return
+        instant = (done - self.sample_bytes) / elapsed
+        self.rate = instant if not self.rate else self.smoothing * instant + (1 - self.smoothing) * self.rate
+        self.sample_time = now
+        self.sample_bytes = done
+
+    def reset(self):
+        self.rate = 0.0
+        self.sample_time = self.clock()
+        self.sample_bytes = 0
+
+    def chunk_size(self):
+        """Read size that keeps each read around CHUNK_DURATION long at the current rate."""
+        if not self.rate:
+            return MIN_CHUNK_SIZE * 4
+        size = int(self.rate * CHUNK_DURATION)
+        return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, size))
+
+
+class ProgressEvent:
+    """Snapshot of an install phase handed to subscribers."""
+
+    __slots__ = ('phase', 'done', 'total', 'percent', 'rate', 'eta')
+
+    def __init__(self, phase, done, total, percent, rate, eta):
+        self.phase = phase
+        self.done = done
+        self.total = total
+        self.percent = percent
+        self.rate = rate
+        self.eta = eta
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Telemetry:
+    """
+    Coalesces raw progress updates from any thread into a bounded stream of
+    ProgressEvents for the GUI and headless consumers alike.
+
+    An event is published when the phase changes, when the phase completes, when
+    at least min_interval seconds passed and the percentage moved by min_delta,
+    or at the latest every max_interval seconds so throughput and ETA stay fresh.
+
+    :param phase: Initial phase name.
+    :param min_interval: Minimum seconds between two events of the same phase.
+    :param min_delta: Minimum percentage change between two events.
+    :param max_interval: Seconds after which an event is published even without progress.
+    :param clock: Monotonic clock, replaceable for tests.
+    """
+
+    def __init__(self, phase='', min_interval=0.1, min_delta=1.0, max_interval=1.0, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.max_interval = max_interval
+        self.clock = clock
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.meter = ThroughputMeter(clock)
+        self.events = 0
+        self._start_phase(phase)
+
+    def _start_phase(self, phase):
+        self.phase = phase
+        self.done = 0
+        self.total = 0
+        self.meter.reset()
+        self.started = self.clock()
+        self.last_emit = None
+        self.last_percent = None
+
+    def subscribe(self, callback):
+        """Registers callback(event); it is called on whichever thread reported the progress."""
+        self.subscribers.append(callback)
+
+    def set_phase(self, phase):
+        with self.lock:
+            self._start_phase(phase)
+            self.events += 1
+            event = self._event()
+        self._publish(event)
+
+    def update(self, done, total):
+        """Progress callback with the (done, total) signature used by the downloader and extractor."""
+        with self.lock:
+            self.done = done
+            self.total = total
+            self.meter.observe(done)
+            now = self.clock()
+            percent = self._percent()
+            finished = total and done >= total
+            if self.last_emit is not None and not finished:
+                elapsed = now - self.last_emit
+                if elapsed < self.min_interval:
+                    return
+                moved = percent is None or self.last_percent is None or percent - self.last_percent >= self.min_delta
+                if not moved and elapsed < self.max_interval:
+                    return
+            if finished and self.last_percent == 100:
+                return
+            self.last_emit = now
+            self.last_percent = percent
+            self.events += 1
+            event = self._event()
+        self._publish(event)
+
+    def _percent(self):
+        if not self.total:
+            return None
+        return min(100.0, self.done * 100.0 / self.total)
+
+    def _event(self):
+        # Until the meter has a sample, fall back to the average over the phase
+        elapsed = self.clock() - self.started
+        rate = self.meter.rate or (self.done / elapsed if elapsed > 0 else 0.0)
+        eta = (self.total - self.done) / rate if rate and self.total else None
+        return ProgressEvent(self.phase, self.done, self.total, self._percent(), rate, eta)
+
+    def _publish(self, event):
+        for callback in self.subscribers:
+            callback(event)
@@ -0,0 +1,145 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import progress
+import tracing
+
+
+DEFAULT_WORKERS = 4
+
+
+class Cancelled(Exception):
+    """Raised inside a stage once the pipeline was cancelled."""
+
+
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise Cancelled()
+
+
+class StageContext:
+    """
+    What a stage function receives: the results of the stages it depends on, a
+    progress callback with the usual (done, total) signature and the cancel token.
+    """
+
+    def __init__(self, name, inputs, token, telemetry):
+        self.name = name
+        self.inputs = inputs
+        self.token = token
+        self.telemetry = telemetry
+
+    def progress(self, done, total):
+        # Long running stages report progress often, which makes this the cancellation point
+        self.token.raise_if_cancelled()
+        self.telemetry.update(done, total)
+
+
+class Stage:
+    def __init__(self, name, function, depends):
+        self.name = name
+        self.function = function
+        self.depends = tuple(depends)
+
+
+class Scheduler:
+    """
+    Runs a graph of dependent stages on a thread pool. A stage starts as soon as
+    every stage it depends on has finished, so independent work overlaps. The
+    first failure cancels the rest of the pipeline. Nothing here depends on Qt.
+
+    :param workers: Maximum number of stages running at once.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.stages = {}
+        self.token = CancelToken()
+        self.subscribers = []
+        self.results = {}
+
+    def add(self, name, function, depends=()):
+        """
+        Adds a stage.
+
+        :param function: Callable receiving a StageContext and returning the stage result.
+        :param depends: Names of the stages whose results this one needs.
+        """
+        self.stages[name] = Stage(name, function, depends)
+
+    def subscribe(self, callback):
+        """Registers callback(progress.ProgressEvent) for every stage; event.phase is the stage name."""
+        self.subscribers.append(callback)
+
+    def cancel(self):
+        self.token.cancel()
+
+    def _telemetry(self, name):
+        telemetry = progress.Telemetry()
+        for callback in self.subscribers:
+            telemetry.subscribe(callback)
+        telemetry.set_phase(name)
+        return telemetry
+
+    def _run_stage(self, stage):
+        self.token.raise_if_cancelled()
+        telemetry = self._telemetry(stage.name)
+        inputs = {name: self.results[name] for name in stage.depends}
+        with tracing.span(stage.name, 'stage'):
+            result = stage.function(StageContext(stage.name, inputs, self.token, telemetry))
+        telemetry.update(1, 1)
+        return result
+
+    def run(self):
+        """
+        Runs every stage and waits for them.
+
+        :return: Dict mapping stage names to their results.
+        :raises Cancelled: If the pipeline was cancelled.
+        :raises Exception: The first error raised by a stage.
+        """
+        for stage in self.stages.values():
+            for name in stage.depends:
+                if name not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {name}")
+        pending = dict(self.stages)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if error is None and not self.token.cancelled:
+                    for name, stage in list(pending.items()):
+                        if all(dependency in self.results for dependency in stage.depends):
+                            running[executor.submit(self._run_stage, stage)] = name
+                            del pending[name]
+                if not running:
+                    if pending and error is None and not self.token.cancelled:
+                        raise ValueError(f"Stages {', '.join(pending)} have circular dependencies")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                        logging.debug(f"Stage {name} finished.")
+                    except Exception as e:
+                        if error is None and not isinstance(e, Cancelled):
+                            error = e
+                            logging.error(f"Stage {name} failed: {e}")
+                        self.token.cancel()
+        if error is not None:
+            raise error
+        self.token.raise_if_cancelled()
+        return self.results
@@ -0,0 +1,110 @@
+import os
+import shutil
+import logging
+
+
+STAGING_SUFFIX = '.staging'
+PREVIOUS_SUFFIX = '.previous'
+
+
+def staging_path(target):
+    """Sibling of target, so it sits on the same volume and can be swapped in with a rename."""
+    return os.path.normpath(target) + STAGING_SUFFIX
+
+
+def previous_path(target):
+    return os.path.normpath(target) + PREVIOUS_SUFFIX
+
+
+def remove_tree(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def prepare(target):
+    """
+    Creates an empty staging directory for target, removing whatever an interrupted run left behind.
+
+    :return: Path of the staging directory.
+    """
+    staging = staging_path(target)
+    remove_tree(staging)
+    os.makedirs(staging)
+    return staging
+
+
+def _has_installed_files(relative_dir, installed_files):
+    prefix = relative_dir + '/'
+    return any(name.startswith(prefix) for name in installed_files)
+
+
+def carry_over(live, staging, installed_files, moved=None, relative_dir=''):
+    """
+    Moves everything in the live installation that was not installed by us (the
+    uninstaller, user data, caches, logs) into the staging directory, so it is part
+    of the new version before that is swapped in. Directories holding no installed
+    file move as a whole. Undo it with put_back.
+
+    :param live: The installation about to be replaced.
+    :param staging: The new installation.
+    :param installed_files: Manifest files dict of the live installation.
+    :param moved: List the relative names of the moved entries are appended to as they
+                  move, so they are known even when a later one fails.
+    :return: moved.
+    """
+    moved = [] if moved is None else moved
+    with os.scandir(os.path.join(live, *relative_dir.split('/')) if relative_dir else live) as entries:
+        for entry in entries:
+            name = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+            destination = os.path.join(staging, *name.split('/'))
+            if entry.is_dir(follow_symlinks=False) and _has_installed_files(name, installed_files):
+                carry_over(live, staging, installed_files, moved, name)
+                continue
+            if name in installed_files or os.path.lexists(destination):
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.rename(entry.path, destination)
+            moved.append(name)
+    return moved
+
+
+def put_back(staging, live, moved):
+    """
+    Moves the entries carry_over moved back into the live installation, after the swap failed.
+
+    :return: True if every entry is back.
+    """
+    complete = True
+    for name in reversed(moved):
+        path = os.path.join(live, *name.split('/'))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.rename(os.path.join(staging, *name.split('/')), path)
+        except OSError as e:
+            logging.error(f"Could not move {name} back into {live}: {e}")
+            complete = False
+    return complete
+
+
+def swap(staging, target):
+    """
+    Replaces target with staging using directory renames on the same volume, so
+    the installation is only unavailable between two renames. When the second
+    rename fails the previous version is put back.
+
+    :return: Path the replaced version was moved to ('<target>.previous'), or None if there was none.
+    """
+    target = os.path.normpath(target)
+    previous = previous_path(target)
+    remove_tree(previous)
+    had_previous = os.path.exists(target)
+    if had_previous:
+        os.rename(target, previous)
+    try:
+        os.rename(staging, target)
+    except OSError:
+        if had_previous:
+            os.rename(previous, target)
+        raise
+    logging.info(f"Swapped the new version into {target}.")
+    return previous if had_previous else None
@@ -0,0 +1,200 @@
+import os
+import json
+import logging
+
+import cache
+
+
+STORE_NAME = 'Lemonade-store'
+OBJECTS_DIR = 'objects'
+INDEX_NAME = 'index.json'
+LOCK_NAME = 'store.lock'
+INDEX_VERSION = 1
+
+
+def store_dir(target):
+    """
+    The store shared by every installation next to target. It lives in the same
+    parent folder, so it is on the same volume and files can be hard linked.
+    """
+    return os.path.join(os.path.dirname(os.path.normpath(target)), STORE_NAME)
+
+
+def _same_file(first, second):
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+
+class FileStore:
+    """
+    Content-addressed store of installed files. Every installed file is a hard link
+    to objects/<sha256[:2]>/<sha256>, so a file identical across channels or versions
+    takes disk space once. An index from size and CRC32, which archives record for
+    every member, to SHA-256 lets extraction link a member instead of inflating it.
+
+    Objects share their data with the installed files, which a program may rewrite
+    in place. The modification time of every object is recorded when its content
+    was last confirmed; an object whose time changed is hashed again before it is
+    linked anywhere, and dropped when it no longer matches its name.
+
+    Objects with a single link are no longer part of any installation and are
+    removed by gc(). Use it as a context manager; it holds a lock shared with other
+    installer and uninstaller processes meanwhile.
+
+    :param directory: Store directory, see store_dir.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = {}
+        # sha256 -> st_mtime_ns of the object when its content last matched its name
+        self.verified = {}
+        self.lock = None
+
+    def __enter__(self):
+        os.makedirs(os.path.join(self.directory, OBJECTS_DIR), exist_ok=True)
+        self.lock = cache.FileLock(os.path.join(self.directory, LOCK_NAME))
+        self.lock.__enter__()
+        self.index, self.verified = self._load_index()
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self._save_index()
+        finally:
+            self.lock.__exit__(*args)
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r') as file:
+                data = json.load(file)
+            if data.get('version') == INDEX_VERSION:
+                # Indexes written before times were recorded get every object hashed once
+                return data['objects'], data.get('verified', {})
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"No usable store index in {self.directory}: {e}")
+        return {}, {}
+
+    def _save_index(self):
+        temp_path = self._index_path() + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'objects': self.index, 'verified': self.verified}, file)
+        os.replace(temp_path, self._index_path())
+
+    def object_path(self, sha256):
+        return os.path.join(self.directory, OBJECTS_DIR, sha256[:2], sha256)
+
+    def _confirm(self, path, sha256):
+        """
+        Returns True if the object at path still holds the content it is named after.
+        An object that changed since it was last confirmed is hashed again and
+        removed from the store when it no longer matches.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if self.verified.get(sha256) == mtime:
+            return True
+        if cache.file_digest(path) == sha256:
+            self.verified[sha256] = mtime
+            return True
+        logging.warning(f"{path} was modified through an installed file, dropping it from the store.")
+        self.verified.pop(sha256, None)
+        self.index = {key: value for key, value in self.index.items() if value != sha256}
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.error(f'Failed to delete {path}. Reason: {e}')
+        return False
+
+    def lookup(self, size, crc32):
+        """
+        Finds a stored file with the given size and CRC32 whose content is confirmed, see _confirm.
+
+        :return: (object path, sha256), or None.
+        """
+        sha256 = self.index.get(f'{size}:{crc32}')
+        if sha256 is None:
+            return None
+        path = self.object_path(sha256)
+        try:
+            if os.path.getsize(path) != size:
+                return None
+        except OSError:
+            return None
+        return (path, sha256) if self._confirm(path, sha256) else None
+
+    def intern(self, directory, files):
+        """
+        Makes every file of an installation a hard link into the store: files whose
+        content is stored already are replaced by a link to it, new content is
+        linked into the store.
+
+        :param directory: Installation directory.
+        :param files: Manifest files dict of the installation.
+        :return: Number of files that were replaced by an existing object.
+        """
+        deduplicated = 0
+        for name, entry in files.items():
+            if not entry.get('sha256'):
+                continue
+            path = os.path.join(directory, *name.split('/'))
+            stored = self.object_path(entry['sha256'])
+            try:
+                if os.path.exists(stored) and not _same_file(path, stored) \
+                        and not self._confirm(stored, entry['sha256']) and os.path.exists(stored):
+                    # Modified through an installed file and still in use, the installation keeps its own copy
+                    continue
+                if not os.path.exists(stored):
+                    os.makedirs(os.path.dirname(stored), exist_ok=True)
+                    os.link(path, stored)
+                    self.verified[entry['sha256']] = os.stat(stored).st_mtime_ns
+                elif not _same_file(path, stored):
+                    cache.link_or_copy(stored, path)
+                    deduplicated += 1
+            except OSError as e:
+                # Another volume or a file system without hard links, the installation keeps its own copy
+                logging.debug(f"Could not link {path} with the store: {e}")
+                continue
+            self.index[f"{entry['size']}:{entry['crc32']}"] = entry['sha256']
+        if deduplicated:
+            logging.info(f"{deduplicated} files were already in the store and are shared.")
+        return deduplicated
+
+    def is_empty(self):
+        objects = os.path.join(self.directory, OBJECTS_DIR)
+        return not any(os.listdir(folder.path) for folder in os.scandir(objects) if folder.is_dir())
+
+    def gc(self):
+        """
+        Removes objects no installation links to anymore, along with their index entries.
+
+        :return: Number of bytes freed.
+        """
+        freed = 0
+        objects = os.path.join(self.directory, OBJECTS_DIR)
+        for folder in os.scandir(objects):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                # scandir does not report link counts on Windows, os.stat does
+                status = os.stat(entry.path)
+                if status.st_nlink > 1:
+                    continue
+                try:
+                    os.remove(entry.path)
+                    freed += status.st_size
+                except OSError as e:
+                    logging.error(f'Failed to delete {entry.path}. Reason: {e}')
+        self.index = {key: sha256 for key, sha256 in self.index.items()
+                      if os.path.exists(self.object_path(sha256))}
+        self.verified = {sha256: mtime for sha256, mtime in self.verified.items()
+                         if os.path.exists(self.object_path(sha256))}
+        logging.info(f"Store garbage collection freed {freed // (1024 * 1024)} MiB.")
+        return freed
@@ -0,0 +1,243 @@
+import os
+import sys
+import tempfile
+import threading
+import collections
+
+
+# Bytes of the download waiting for extraction that may stay in memory, and on disk past that
+DEFAULT_MEMORY_CAP = 16 * 1024 * 1024
+DEFAULT_SCRATCH_CAP = 256 * 1024 * 1024
+# Seconds between cancellation checks while a reader or writer waits
+WAIT_INTERVAL = 0.1
+
+_usage_lock = threading.Lock()
+_usage = {'buffered': 0, 'peak_buffered': 0, 'scratch': 0, 'peak_scratch': 0}
+
+
+class Discarded(Exception):
+    """Raised to the writer of a SpillBuffer whose reader gave up on it."""
+
+
+class Restarted(Exception):
+    """Raised to the reader of a SpillBuffer whose writer starts the data over from the first byte."""
+
+
+def _track(kind, delta):
+    with _usage_lock:
+        _usage[kind] += delta
+        _usage['peak_' + kind] = max(_usage['peak_' + kind], _usage[kind])
+
+
+def track_scratch(delta):
+    """Records delta bytes of scratch files created (or, when negative, removed) by this process."""
+    _track('scratch', delta)
+
+
+def peak_rss():
+    """Largest resident set size of this process so far in bytes, or None where it cannot be read."""
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                       [(name, ctypes.c_size_t) for name in (
+                           'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                           'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage',
+                           'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess
+        process.restype = wintypes.HANDLE
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    try:
+        # Unlike ru_maxrss this starts over at exec, instead of counting the parent's memory from before the fork
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def usage():
+    """
+    :return: Dict with the peak RSS of this process and the peak bytes held in stream
+             buffers ('peak_buffered') and scratch files ('peak_scratch').
+    """
+    with _usage_lock:
+        return {'peak_rss': peak_rss(), 'peak_buffered': _usage['peak_buffered'],
+                'peak_scratch': _usage['peak_scratch']}
+
+
+class SpillBuffer:
+    """
+    Bounded pipe between a writer thread (the download) and a reader thread (the
+    extraction). Up to memory_cap bytes wait in memory; past that data spills to a
+    scratch file of at most scratch_cap bytes, and once that is full the writer
+    waits, which slows the download down instead of using more memory or disk.
+    A single chunk is always accepted into an empty buffer, so memory_cap may be
+    exceeded by at most one chunk.
+
+    :param memory_cap: Bytes kept in memory.
+    :param scratch_cap: Size limit of the scratch file, 0 to never touch the disk.
+    :param directory: Where the scratch file goes, defaults to the temp directory.
+    :param check: Called while waiting; raising from it (e.g. a cancel check) abandons the transfer.
+    """
+
+    def __init__(self, memory_cap=DEFAULT_MEMORY_CAP, scratch_cap=DEFAULT_SCRATCH_CAP, directory=None, check=None):
+        self.memory_cap = memory_cap
+        self.scratch_cap = scratch_cap
+        self.directory = directory
+        self.check = check
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.spill = None
+        self.spill_read = 0
+        self.spill_write = 0
+        self.closed = False
+        self.discarded = False
+        self.restarted = False
+        # Bytes handed to the reader, and the expected total once the writer knows it
+        self.consumed = 0
+        self.total = None
+        self.condition = threading.Condition()
+
+    def _wait(self):
+        self.condition.wait(WAIT_INTERVAL)
+        if self.check:
+            self.check()
+
+    def _spill(self, data):
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(dir=self.directory)
+        self.spill.seek(self.spill_write)
+        self.spill.write(data)
+        self.spill_write += len(data)
+        track_scratch(len(data))
+
+    def _drop(self):
+        _track('buffered', -self.buffered)
+        self.chunks.clear()
+        self.buffered = 0
+        if self.spill is not None:
+            track_scratch(-self.spill_write)
+            self.spill.close()
+            self.spill = None
+            self.spill_read = self.spill_write = 0
+
+    def _reset_spill(self):
+        # Everything spilled was read, the file starts over instead of growing
+        self.spill.seek(0)
+        self.spill.truncate()
+        track_scratch(-self.spill_write)
+        self.spill_read = self.spill_write = 0
+
+    def write(self, data):
+        with self.condition:
+            while True:
+                if self.discarded:
+                    raise Discarded()
+                if self.closed:
+                    raise ValueError("write to a closed SpillBuffer")
+                # Once spilling, everything goes to the file until it is drained, to keep the order
+                spilling = self.spill_write > 0
+                if not spilling and (self.buffered + len(data) <= self.memory_cap or not self.buffered):
+                    self.chunks.append(data)
+                    self.buffered += len(data)
+                    _track('buffered', len(data))
+                    break
+                if self.spill_write + len(data) <= self.scratch_cap:
+                    self._spill(data)
+                    break
+                self._wait()
+            self.condition.notify_all()
+
+    def close(self):
+        """Marks the end of the data; the reader gets b'' once it read everything."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def read(self, size):
+        """:return: Up to size bytes, b'' once the writer closed the buffer and everything was read."""
+        with self.condition:
+            while True:
+                if self.restarted:
+                    self.restarted = False
+                    raise Restarted()
+                if self.chunks:
+                    data = self.chunks.popleft()
+                    if len(data) > size:
+                        self.chunks.appendleft(data[size:])
+                        data = data[:size]
+                    self.buffered -= len(data)
+                    _track('buffered', -len(data))
+                    break
+                if self.spill_read < self.spill_write:
+                    self.spill.seek(self.spill_read)
+                    data = self.spill.read(min(size, self.spill_write - self.spill_read))
+                    self.spill_read += len(data)
+                    if self.spill_read == self.spill_write:
+                        self._reset_spill()
+                    break
+                if self.closed:
+                    return b''
+                self._wait()
+            self.consumed += len(data)
+            self.condition.notify_all()
+            return data
+
+    def restart(self):
+        """
+        Called by the writer before it sends the data again from the first byte. What
+        is still buffered is dropped and the reader's next read raises Restarted.
+        """
+        with self.condition:
+            if self.discarded:
+                raise Discarded()
+            self._drop()
+            self.consumed = 0
+            self.restarted = True
+            self.condition.notify_all()
+
+    def discard(self):
+        """Drops whatever is still buffered and removes the scratch file; further writes raise Discarded."""
+        with self.condition:
+            self._drop()
+            self.closed = self.discarded = True
+            self.condition.notify_all()
+
+
+class FileStream:
+    """
+    An open file read front to back with the progress attributes of a SpillBuffer, so
+    an archive already on disk is extracted the same way as one still arriving.
+
+    :param file: Binary file object, closed by discard().
+    :param total: Bytes the file holds.
+    """
+
+    def __init__(self, file, total):
+        self.file = file
+        self.consumed = 0
+        self.total = total
+
+    def read(self, size):
+        data = self.file.read(size)
+        self.consumed += len(data)
+        return data
+
+    def discard(self):
+        self.file.close()
@@ -0,0 +1,8 @@
+import archives
+
+
+def test_release_assets_prefer_zip():
+    names = ['lemonade-windows-msvc.tar', 'lemonade-windows-msvc.tar.zst', 'lemonade-windows-msvc.zip']
+
+    assert min(names, key=archives.rank) == 'lemonade-windows-msvc.zip'
+    assert archives.rank('lemonade-windows-msvc.7z') == len(archives.BACKENDS)
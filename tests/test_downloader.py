@@ -0,0 +1,129 @@
+import os
+import time
+import hashlib
+
+import pytest
+import requests
+
+import downloader
+import fake_github
+
+
+BUILD_SIZE = 8 * 1024 * 1024
+# Bytes/second per connection, slow enough for the parallel segments to matter
+RATE = 4 * 1024 * 1024
+
+
+def _timed_download(fake, dest):
+    started = time.perf_counter()
+    digest = downloader.download(fake.base_url + fake_github.DOWNLOAD_PREFIX + fake_github.ARTIFACT_NAME, dest)
+    return digest, time.perf_counter() - started
+
+
+def test_segmented_download_matches_single_stream_and_is_faster(tmp_path, monkeypatch):
+    # Four 2 MiB segments instead of four 4 MiB ones keeps the test short
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 2 * 1024 * 1024)
+    build = fake_github.synthetic_build(BUILD_SIZE * 2, 20)
+    with fake_github.FakeGitHub(build, rate=RATE, ranges=False) as fake:
+        single_digest, single_time = _timed_download(fake, str(tmp_path / 'single.zip'))
+    with fake_github.FakeGitHub(build, rate=RATE) as fake:
+        segmented_digest, segmented_time = _timed_download(fake, str(tmp_path / 'segmented.zip'))
+        ranged = [headers['Range'] for _, _, headers in fake.requests if 'Range' in headers]
+
+    expected = hashlib.sha256(build).hexdigest()
+    assert single_digest == segmented_digest == expected
+    assert (tmp_path / 'single.zip').read_bytes() == (tmp_path / 'segmented.zip').read_bytes() == build
+    assert len(ranged) == downloader.DEFAULT_CONNECTIONS
+    assert segmented_time < single_time / 2
+
+
+def test_download_starts_over_when_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 256 * 1024)
+    old_build = fake_github.synthetic_build(4 * 1024 * 1024, 20)
+    new_build = fake_github.synthetic_build(4 * 1024 * 1024, 20, seed=1)
+    path = fake_github.DOWNLOAD_PREFIX + fake_github.ARTIFACT_NAME
+    with fake_github.FakeGitHub(old_build) as fake:
+        url = fake.base_url + path
+        probe = downloader.http_session.get_session().get(url, stream=True)
+        # Published again after the probe, so every segment's If-Range misses
+        fake.files[path] = new_build
+        fake.etags[path] = '"' + hashlib.sha1(new_build).hexdigest() + '"'
+        digest = downloader.download(url, str(tmp_path / 'build.zip'), response=probe)
+        probes = [headers for method, _, headers in fake.requests if method == 'GET' and 'Range' not in headers]
+
+    assert digest == hashlib.sha256(new_build).hexdigest()
+    assert (tmp_path / 'build.zip').read_bytes() == new_build
+    assert len(probes) == 2
+
+
+def test_interrupted_download_resumes_the_missing_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 512 * 1024)
+    # A hanging connection is given up on after half a second instead of half a minute
+    monkeypatch.setattr(downloader.http_session, 'TIMEOUT', (5, 0.5))
+    build = fake_github.synthetic_build(4 * 1024 * 1024, 20)
+    dest = str(tmp_path / 'build.zip')
+    with fake_github.FakeGitHub(build, stall_after=256 * 1024) as fake:
+        url = fake.base_url + fake_github.DOWNLOAD_PREFIX + fake_github.ARTIFACT_NAME
+        with pytest.raises(requests.RequestException):
+            downloader.download(url, dest, resume=True, retries=0)
+        state = downloader.ResumeState.load(dest)
+        assert state is not None and 0 < state.downloaded < len(build)
+        missing = {f'bytes={start + done}-{end}' for start, end, done in state.segments if start + done <= end}
+
+        fake.stall_after = None
+        fake.requests.clear()
+        digest = downloader.download(url, dest, resume=True, retries=0)
+        ranged = [headers for method, _, headers in fake.requests if 'Range' in headers]
+
+    assert digest == hashlib.sha256(build).hexdigest()
+    assert (tmp_path / 'build.zip').read_bytes() == build
+    assert {headers['Range'] for headers in ranged} == missing
+    assert len(ranged) == len(missing)
+    assert all(headers.get('If-Range') == fake.etags[fake_github.DOWNLOAD_PREFIX + fake_github.ARTIFACT_NAME]
+               for headers in ranged)
+    assert not os.path.exists(downloader.ResumeState.sidecar_path(dest))
+
+
+class _CountingReader:
+    def __init__(self, file):
+        self.file = file
+        self.reads = []
+
+    def seek(self, position):
+        self.position = self.file.seek(position)
+
+    def read(self, size):
+        data = self.file.read(size)
+        self.reads.append((self.position, len(data)))
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def test_streaming_hash_only_reads_back_what_other_segments_wrote(tmp_path):
+    content = bytes(range(256)) * 4096
+    path = tmp_path / 'download'
+    path.write_bytes(bytes(len(content)))
+    half = len(content) // 2
+    segments = [[0, half - 1, 0], [half, len(content) - 1, 0]]
+    hasher = downloader._StreamingHash(str(path), segments)
+    hasher.file = _CountingReader(hasher.file)
+
+    def write(segment, size):
+        offset = segment[0] + segment[2]
+        data = content[offset:offset + size]
+        with open(path, 'r+b') as file:
+            file.seek(offset)
+            file.write(data)
+        segment[2] += len(data)
+        hasher.written(offset, data)
+
+    # The second segment finishes first, the first one then catches up with it
+    for _ in range(4):
+        write(segments[1], half // 4)
+    for _ in range(4):
+        write(segments[0], half // 4)
+
+    assert hasher.hexdigest() == hashlib.sha256(content).hexdigest()
+    assert hasher.file.reads == [(half, half)]
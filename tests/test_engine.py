@@ -0,0 +1,152 @@
+import os
+import hashlib
+
+import pytest
+
+import cache
+import engine
+import staging
+import fake_github
+
+
+@pytest.fixture
+def artifact_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEMONADE_CACHE_DIR', str(tmp_path / 'cache'))
+    return cache.default_cache()
+
+
+def _cached_download(artifact_cache, tmp_path, data, key):
+    blob = tmp_path / 'blob'
+    blob.write_bytes(data)
+    artifact_cache.store(key, str(blob), hashlib.sha256(data).hexdigest())
+    archive_path = str(tmp_path / 'download.zip')
+    assert artifact_cache.fetch(key, archive_path)
+    return archive_path
+
+
+def test_damaged_download_is_evicted_from_the_cache(tmp_path, artifact_cache):
+    build = fake_github.nightly_artifact(fake_github.synthetic_build(256 * 1024, 10))
+    # Nightly builds publish no digest, only the cache entry would tell it is broken
+    damaged = build[:len(build) // 2] + bytes(len(build) - len(build) // 2)
+    key = engine.Artifact(fake_github.NIGHTLY_PATH, 'etag:size').cache_key
+    archive_path = _cached_download(artifact_cache, tmp_path, damaged, key)
+
+    with pytest.raises(engine.InstallError):
+        engine.extract_artifact(archive_path, str(tmp_path / 'Lemonade'), cache_key=key)
+
+    assert not os.path.exists(archive_path)
+    assert artifact_cache.lookup(key) is None
+    assert not os.listdir(artifact_cache.objects_dir)
+
+
+def test_evict_keeps_a_blob_another_key_uses(tmp_path, artifact_cache):
+    _cached_download(artifact_cache, tmp_path, b'build', 'first')
+    artifact_cache.store('second', str(tmp_path / 'blob'))
+
+    artifact_cache.evict('first')
+
+    assert artifact_cache.lookup('first') is None
+    assert artifact_cache.lookup('second') is not None
+
+
+def _install(tmp_path, target, seed=0):
+    archive_path = tmp_path / 'build.zip'
+    archive_path.write_bytes(fake_github.synthetic_build(256 * 1024, 10, seed))
+    engine.extract_artifact(str(archive_path), str(target))
+
+
+def test_update_carries_user_data_over(tmp_path, artifact_cache):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target)
+    (target / 'user').mkdir()
+    (target / 'user' / 'config.ini').write_text('[UI]')
+
+    _install(tmp_path, target, seed=1)
+
+    assert (target / 'user' / 'config.ini').read_text() == '[UI]'
+    assert not os.path.exists(staging.previous_path(str(target)))
+
+
+def test_failed_swap_leaves_user_data_in_place(tmp_path, artifact_cache, monkeypatch):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target)
+    (target / 'uninstaller.exe').write_bytes(b'MZ')
+
+    def swap(staging_dir, live):
+        raise PermissionError(f"{live} is in use")
+
+    monkeypatch.setattr(staging, 'swap', swap)
+    with pytest.raises(engine.InstallError):
+        _install(tmp_path, target, seed=1)
+
+    assert (target / 'uninstaller.exe').read_bytes() == b'MZ'
+    assert not os.path.exists(staging.staging_path(str(target)))
+
+
+def test_failed_carry_over_is_undone(tmp_path, artifact_cache, monkeypatch):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target)
+    (target / 'a.log').write_text('a')
+    (target / 'b.log').write_text('b')
+    rename = os.rename
+
+    def failing_rename(source, destination):
+        if os.path.basename(source) == 'b.log' and '.staging' in destination:
+            raise PermissionError(f"{source} is open")
+        rename(source, destination)
+
+    monkeypatch.setattr(os, 'rename', failing_rename)
+    with pytest.raises(engine.InstallError):
+        _install(tmp_path, target, seed=1)
+
+    assert (target / 'a.log').read_text() == 'a'
+    assert (target / 'b.log').read_text() == 'b'
+    assert not os.path.exists(staging.previous_path(str(target)))
+
+
+def _open_paths():
+    fd_dir = '/proc/self/fd'
+    paths = set()
+    for fd in os.listdir(fd_dir):
+        try:
+            paths.add(os.readlink(os.path.join(fd_dir, fd)))
+        except OSError:
+            pass
+    return paths
+
+
+def test_damaged_tar_is_closed_before_it_is_removed(tmp_path, artifact_cache, monkeypatch):
+    if not os.path.isdir('/proc/self/fd'):
+        pytest.skip("Open files cannot be listed here")
+    build = fake_github.synthetic_tar(256 * 1024, 10)
+    key = engine.Artifact(fake_github.NIGHTLY_PATH, 'etag:size').cache_key
+    archive_path = _cached_download(artifact_cache, tmp_path, build[:len(build) // 2], key)
+    remove = os.remove
+
+    def windows_remove(path):
+        # Windows refuses to remove a file that is still open
+        if os.path.realpath(path) in _open_paths():
+            raise PermissionError(f"{path} is in use")
+        remove(path)
+
+    monkeypatch.setattr(os, 'remove', windows_remove)
+    with pytest.raises(engine.InstallError):
+        engine.extract_artifact(archive_path, str(tmp_path / 'Lemonade'), cache_key=key)
+
+    assert not os.path.exists(archive_path)
+    assert artifact_cache.lookup(key) is None
+
+
+def test_download_that_cannot_be_removed_is_still_evicted(tmp_path, artifact_cache, monkeypatch):
+    build = fake_github.nightly_artifact(fake_github.synthetic_build(256 * 1024, 10))
+    key = engine.Artifact(fake_github.NIGHTLY_PATH, 'etag:size').cache_key
+    archive_path = _cached_download(artifact_cache, tmp_path, build[:len(build) // 2], key)
+
+    def remove(path):
+        raise PermissionError(f"{path} is in use")
+
+    monkeypatch.setattr(os, 'remove', remove)
+    with pytest.raises(engine.InstallError, match='damaged'):
+        engine.extract_artifact(archive_path, str(tmp_path / 'Lemonade'), cache_key=key)
+
+    assert artifact_cache.lookup(key) is None
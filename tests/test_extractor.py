@@ -0,0 +1,126 @@
+import os
+import zipfile
+
+import pytest
+
+import extractor
+import fake_github
+import manifest
+import streaming
+
+
+def test_compressed_nested_zip_is_extracted_without_scratch(tmp_path, monkeypatch):
+    # Past this the nested zip used to be spooled to a scratch file
+    monkeypatch.setattr(extractor, 'SPOOL_MAX_SIZE', 64 * 1024)
+    monkeypatch.setattr(extractor, 'NESTED_TAIL_SIZE', 16 * 1024)
+    files = fake_github.synthetic_files(4 * 1024 * 1024, 40)
+    archive_path = tmp_path / 'nightly.zip'
+    archive_path.write_bytes(fake_github.nightly_artifact(fake_github.synthetic_build(4 * 1024 * 1024, 40)))
+    scratch_before = streaming.usage()['peak_scratch']
+
+    source = extractor.open_artifact(str(archive_path))
+    assert source.sequential
+    written = extractor.extract_source(source, str(tmp_path / 'build'), workers=3)
+
+    assert written == sum(len(data) for _, data in files)
+    assert streaming.usage()['peak_scratch'] == scratch_before
+    for name, data in files:
+        assert (tmp_path / 'build' / name.split('/', 1)[1]).read_bytes() == data
+
+
+def _write_build(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr('lemonade-windows-msvc/' + name, data)
+    return str(path)
+
+
+def test_update_only_writes_what_changed(tmp_path):
+    target = tmp_path / 'Lemonade'
+    old = {'lemonade-qt.exe': b'exe' * 1000, 'Qt6Core.dll': b'old dll' * 1000, 'plugins/old.dll': b'old' * 100}
+    new = {'lemonade-qt.exe': b'exe' * 1000, 'Qt6Core.dll': b'new dll' * 1000, 'plugins/new.dll': b'new' * 100}
+    extractor.extract_artifact(_write_build(tmp_path / 'old.zip', old), str(target), incremental=True)
+    (target / 'user').mkdir()
+    (target / 'user' / 'config.ini').write_text('[UI]')
+    unchanged = os.stat(target / 'lemonade-qt.exe')
+
+    written = extractor.extract_artifact(_write_build(tmp_path / 'new.zip', new), str(target), incremental=True)
+
+    assert written == len(new['Qt6Core.dll']) + len(new['plugins/new.dll'])
+    status = os.stat(target / 'lemonade-qt.exe')
+    assert (status.st_ino, status.st_mtime_ns) == (unchanged.st_ino, unchanged.st_mtime_ns)
+    for name, data in new.items():
+        assert (target / name).read_bytes() == data
+    assert not (target / 'plugins' / 'old.dll').exists()
+    assert (target / 'user' / 'config.ini').read_text() == '[UI]'
+    assert set(manifest.load(str(target))) == set(new)
+
+
+def test_installed_file_of_another_size_is_written_again(tmp_path):
+    target = tmp_path / 'Lemonade'
+    files = {'lemonade-qt.exe': b'exe' * 1000, 'Qt6Core.dll': b'dll' * 1000}
+    archive_path = _write_build(tmp_path / 'build.zip', files)
+    extractor.extract_artifact(archive_path, str(target), incremental=True)
+    (target / 'Qt6Core.dll').write_bytes(b'truncated')
+
+    written = extractor.extract_artifact(archive_path, str(target), incremental=True)
+
+    assert written == len(files['Qt6Core.dll'])
+    assert (target / 'Qt6Core.dll').read_bytes() == files['Qt6Core.dll']
+
+
+def _nested_source(tmp_path, monkeypatch, build):
+    monkeypatch.setattr(extractor, 'SPOOL_MAX_SIZE', 64 * 1024)
+    monkeypatch.setattr(extractor, 'NESTED_TAIL_SIZE', 16 * 1024)
+    monkeypatch.setattr(extractor, 'CHECKPOINT_INTERVAL', 256 * 1024)
+    archive_path = tmp_path / 'nightly.zip'
+    archive_path.write_bytes(fake_github.nightly_artifact(build))
+    return extractor.open_artifact(str(archive_path))
+
+
+def test_nested_zip_view_reads_from_any_position(tmp_path, monkeypatch):
+    build = fake_github.synthetic_build(4 * 1024 * 1024, 40)
+    source = _nested_source(tmp_path, monkeypatch, build)
+    assert len(source.inflate.checkpoints) > 4
+
+    view = extractor._InflatingView(source.inflate)
+    try:
+        for position in (3 * 1024 * 1024, 1000, len(build) - 20000, 700 * 1024, 0):
+            view.seek(position)
+            assert view.read(100000) == build[position:position + 100000]
+    finally:
+        view.close()
+
+
+def test_workers_inflate_the_nested_zip_about_once(tmp_path, monkeypatch):
+    build = fake_github.synthetic_build(16 * 1024 * 1024, 80)
+    source = _nested_source(tmp_path, monkeypatch, build)
+    monkeypatch.setattr(extractor, 'CHUNK_SIZE', 64 * 1024)
+    inflated = []
+    inflate_more = extractor._InflatingView._inflate_more
+
+    def counting_inflate_more(view):
+        before = len(view.pending)
+        result = inflate_more(view)
+        inflated.append(len(view.pending) - before)
+        return result
+
+    monkeypatch.setattr(extractor._InflatingView, '_inflate_more', counting_inflate_more)
+    workers = 4
+    extractor.extract_source(source, str(tmp_path / 'build'), workers=workers)
+
+    # Starting every worker's stretch from the front would inflate about (1 + workers) / 2 times the size
+    assert sum(inflated) <= len(build) + workers * (extractor.CHECKPOINT_INTERVAL + extractor.CHUNK_SIZE)
+
+
+def test_damaged_nested_zip_is_rejected_when_opened(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractor, 'SPOOL_MAX_SIZE', 64 * 1024)
+    build = fake_github.synthetic_build(1024 * 1024, 10)
+    artifact = bytearray(fake_github.nightly_artifact(build))
+    # A byte in the middle of the deflated build, past the outer local header
+    artifact[len(artifact) // 2] ^= 0xFF
+    archive_path = tmp_path / 'nightly.zip'
+    archive_path.write_bytes(bytes(artifact))
+
+    with pytest.raises(zipfile.BadZipFile):
+        extractor.open_artifact(str(archive_path))
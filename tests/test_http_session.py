@@ -0,0 +1,39 @@
+import pytest
+import requests
+
+import fake_github
+import http_session
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEMONADE_CACHE_DIR', str(tmp_path / 'cache'))
+    with fake_github.FakeGitHub(b'build') as fake:
+        yield fake
+
+
+def test_unchanged_document_is_revalidated(fake):
+    releases = http_session.get_json(fake.releases_url)
+
+    assert http_session.get_json(fake.releases_url) == releases
+
+    _, _, headers = fake.requests[-1]
+    assert fake.responses == [(fake_github.LEMONADE_RELEASES_PATH, 200), (fake_github.LEMONADE_RELEASES_PATH, 304)]
+    assert headers['If-None-Match'] == requests.get(fake.releases_url).headers['ETag']
+    assert headers['If-Modified-Since'] == fake_github.LAST_MODIFIED
+
+
+@pytest.mark.parametrize('status', [403, 429])
+def test_rate_limited_request_falls_back_to_the_cached_copy(fake, status):
+    releases = http_session.get_json(fake.releases_url)
+    fake.api_status = status
+
+    assert http_session.get_json(fake.releases_url) == releases
+    assert fake.responses[-1] == (fake_github.LEMONADE_RELEASES_PATH, status)
+
+
+def test_rate_limited_request_without_a_cached_copy_fails(fake):
+    fake.api_status = 403
+
+    with pytest.raises(requests.HTTPError):
+        http_session.get_json(fake.releases_url)
@@ -0,0 +1,61 @@
+import hashlib
+import contextlib
+
+import downloader
+import fake_github
+import mirrors
+
+
+BUILD = fake_github.synthetic_build(4 * 1024 * 1024, 20)
+PATH = fake_github.DOWNLOAD_PREFIX + fake_github.ARTIFACT_NAME
+
+
+@contextlib.contextmanager
+def _servers(*options):
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(fake_github.FakeGitHub(option.pop('build', BUILD), **option))
+               for option in options]
+
+
+def test_mirrors_are_ranked_fastest_first():
+    with _servers({'rate': 512 * 1024}, {'rate': 8 * 1024 * 1024}, {'rate': 2 * 1024 * 1024}) as (slow, fast, medium):
+        ranked = mirrors.rank(mirrors.candidates(slow.base_url + PATH, [fast.base_url, medium.base_url]))
+
+    assert [source.url for source in ranked] == [fast.base_url + PATH, medium.base_url + PATH,
+                                                  slow.base_url + PATH]
+    assert all(source.size == len(BUILD) and source.ranges for source in ranked)
+
+
+def test_segments_move_to_another_mirror_when_one_stalls(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 256 * 1024)
+    monkeypatch.setattr(downloader, 'STALL_TIMEOUT', 0.5)
+    # The fastest mirror wins the ranking, then hangs half way through every segment
+    with _servers({'rate': 1024 * 1024}, {'rate': 16 * 1024 * 1024, 'stall_after': 512 * 1024}) as (origin, stalling):
+        digest = downloader.download(origin.base_url + PATH, str(tmp_path / 'build.zip'),
+                                     mirror_list=[stalling.base_url])
+        stalled = [headers['Range'] for method, _, headers in stalling.requests if 'Range' in headers]
+        continued = [headers['Range'] for method, _, headers in origin.requests if 'Range' in headers]
+
+    assert digest == hashlib.sha256(BUILD).hexdigest()
+    assert (tmp_path / 'build.zip').read_bytes() == BUILD
+    segment_starts = {f'bytes={start}-{end}' for start, end in
+                      downloader.split_ranges(len(BUILD), downloader.DEFAULT_CONNECTIONS)}
+    # The probe and every segment started on the stalling mirror
+    assert segment_starts <= set(stalled)
+    # The origin picked every segment up where the mirror stopped
+    assert continued and not set(continued) & segment_starts
+
+
+def test_mirror_serving_other_bytes_is_ignored(tmp_path):
+    tampered = bytearray(BUILD)
+    tampered[1024] ^= 0xFF
+    with _servers({'rate': 4 * 1024 * 1024}, {'build': bytes(tampered), 'rate': 16 * 1024 * 1024}) as (origin, other):
+        ranked = mirrors.rank(mirrors.candidates(origin.base_url + PATH, [other.base_url]))
+        digest = downloader.download(origin.base_url + PATH, str(tmp_path / 'build.zip'),
+                                     mirror_list=[other.base_url])
+        # Every request to the other mirror was a probe
+        fetched = {headers.get('Range') for method, _, headers in other.requests if method == 'GET'}
+
+    assert [source.url for source in ranked] == [origin.base_url + PATH]
+    assert digest == hashlib.sha256(BUILD).hexdigest()
+    assert fetched == {f'bytes=0-{mirrors.PROBE_BYTES - 1}'}
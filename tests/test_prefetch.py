@@ -0,0 +1,70 @@
+import pytest
+
+import engine
+import fake_github
+import prefetch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEMONADE_CACHE_DIR', str(tmp_path / 'cache'))
+    with fake_github.FakeGitHub(fake_github.synthetic_build(1024 * 1024, 10)) as fake:
+        monkeypatch.setattr(engine, 'RELEASES_API_URL', fake.releases_url)
+        monkeypatch.setattr(engine, 'NIGHTLY_URL', fake.nightly_url)
+        monkeypatch.setattr(engine, 'MIRRORS', [])
+        yield fake
+
+
+def _downloads(fake):
+    return [path for method, path, _ in fake.requests
+            if method == 'GET' and path.startswith(fake_github.DOWNLOAD_PREFIX)]
+
+
+def test_token_bucket_caps_the_rate():
+    clock = FakeClock()
+    rate = 1024 * 1024
+    bucket = prefetch.TokenBucket(rate, clock=clock, sleep=clock.sleep)
+
+    for _ in range(160):
+        bucket.consume(64 * 1024)
+
+    # Ten seconds worth of tokens, the first second of them from the initial burst
+    assert clock.now == pytest.approx(9.0)
+    clock.sleep(5)
+    # An idle bucket refills only up to its capacity
+    assert bucket.consume(2 * rate) == pytest.approx(1.0)
+
+
+def test_unchanged_release_is_not_downloaded_again(fake):
+    prefetcher = prefetch.Prefetcher(rate=100 * 1024 * 1024)
+    assert prefetcher.prefetch('release') == prefetch.PREFETCHED
+    downloads = len(_downloads(fake))
+    assert downloads
+
+    fake.responses.clear()
+    assert prefetcher.prefetch('release') == prefetch.CACHED
+
+    assert fake.responses == [(fake_github.LEMONADE_RELEASES_PATH, 304)]
+    assert len(_downloads(fake)) == downloads
+
+
+def test_prefetch_yields_to_a_running_installation(fake):
+    lock = engine.install_lock()
+    assert lock.acquire(blocking=False)
+    try:
+        assert prefetch.Prefetcher().prefetch('release') == prefetch.BUSY
+    finally:
+        lock.release()
+
+    assert not fake.requests
@@ -0,0 +1,73 @@
+import pytest
+
+import progress
+
+MIB = 1024 * 1024
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _transfer(clock, report, total, rate, step=16 * 1024):
+    """Reports total bytes arriving at rate bytes/second in step sized reads."""
+    done = 0
+    while done < total:
+        done = min(total, done + step)
+        clock.advance(step / rate)
+        report(done, total)
+
+
+def test_telemetry_bounds_events_for_a_large_transfer():
+    clock = FakeClock()
+    telemetry = progress.Telemetry('download', clock=clock)
+    events = []
+    telemetry.subscribe(events.append)
+
+    # 6400 updates over five seconds
+    _transfer(clock, telemetry.update, 100 * MIB, 20 * MIB)
+
+    assert len(events) <= clock.now / telemetry.min_interval + 2
+    assert len(events) <= 100 / telemetry.min_delta + 2
+    assert events[-1].percent == 100
+    assert events[-1].rate == pytest.approx(20 * MIB, rel=0.01)
+
+
+def test_telemetry_keeps_a_stalled_transfer_fresh():
+    clock = FakeClock()
+    telemetry = progress.Telemetry('download', clock=clock)
+    events = []
+    telemetry.subscribe(events.append)
+
+    # 0.1% per second never reaches min_delta, max_interval still publishes every second
+    _transfer(clock, telemetry.update, 10 * MIB, 10 * 1024, step=1024)
+
+    assert len(events) <= clock.now / telemetry.max_interval + 2
+    assert len(events) >= clock.now / (2 * telemetry.max_interval)
+
+
+@pytest.mark.parametrize('rate, expected', [
+    (2 * MIB, int(2 * MIB * progress.CHUNK_DURATION)),
+    (200 * MIB, progress.MAX_CHUNK_SIZE),
+    (64 * 1024, progress.MIN_CHUNK_SIZE),
+])
+def test_chunk_size_follows_the_measured_throughput(rate, expected):
+    clock = FakeClock()
+    meter = progress.ThroughputMeter(clock)
+    done = 0
+    # A different rate first, the estimate has to move away from it
+    for current in (rate * 10, rate):
+        for _ in range(40):
+            clock.advance(meter.sample_interval)
+            done += int(current * meter.sample_interval)
+            meter.observe(done)
+
+    assert meter.rate == pytest.approx(rate, rel=0.01)
+    assert meter.chunk_size() == pytest.approx(expected, rel=0.01)
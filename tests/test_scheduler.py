@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+import scheduler
+
+
+TIMEOUT = 5
+
+
+def test_stages_run_after_their_dependencies():
+    order = []
+    pipeline = scheduler.Scheduler()
+    pipeline.add('register', lambda stage: order.append(('register', stage.inputs)), depends=('extract',))
+    pipeline.add('extract', lambda stage: order.append('extract') or stage.inputs['download'] + 1,
+                 depends=('download',))
+    pipeline.add('download', lambda stage: order.append('download') or 1)
+
+    results = pipeline.run()
+
+    assert order == ['download', 'extract', ('register', {'extract': 2})]
+    assert results['extract'] == 2
+
+
+def test_independent_stages_overlap():
+    # Each stage only gets past the barrier while the other one is running too
+    barrier = threading.Barrier(2, timeout=TIMEOUT)
+    pipeline = scheduler.Scheduler()
+    pipeline.add('download', lambda stage: barrier.wait())
+    pipeline.add('uninstaller', lambda stage: barrier.wait())
+    pipeline.add('register', lambda stage: sorted(stage.inputs.values()), depends=('download', 'uninstaller'))
+
+    assert pipeline.run()['register'] == [0, 1]
+
+
+def test_first_failure_cancels_the_running_stages():
+    started = threading.Event()
+    seen = {}
+
+    def slow(stage):
+        started.set()
+        try:
+            while True:
+                stage.progress(0, 1)
+                stage.token.event.wait(0.01)
+        except scheduler.Cancelled:
+            seen['cancelled'] = True
+            raise
+
+    def fail(stage):
+        assert started.wait(TIMEOUT)
+        raise RuntimeError("disk full")
+
+    pipeline = scheduler.Scheduler()
+    pipeline.add('download', slow)
+    pipeline.add('uninstaller', fail)
+    pipeline.add('extract', lambda stage: seen.setdefault('extract', True), depends=('download',))
+
+    with pytest.raises(RuntimeError, match='disk full'):
+        pipeline.run()
+    assert seen == {'cancelled': True}
+    assert pipeline.token.cancelled
+
+
+def test_cancel_before_run_raises_cancelled():
+    pipeline = scheduler.Scheduler()
+    pipeline.add('download', lambda stage: None)
+    pipeline.cancel()
+
+    with pytest.raises(scheduler.Cancelled):
+        pipeline.run()
+    assert not pipeline.results
+
+
+def test_circular_dependencies_are_rejected():
+    pipeline = scheduler.Scheduler()
+    pipeline.add('metadata', lambda stage: None)
+    pipeline.add('download', lambda stage: None, depends=('metadata', 'extract'))
+    pipeline.add('extract', lambda stage: None, depends=('download',))
+
+    with pytest.raises(ValueError, match='circular'):
+        pipeline.run()
+    assert list(pipeline.results) == ['metadata']
+
+
+def test_unknown_dependencies_are_rejected():
+    ran = []
+    pipeline = scheduler.Scheduler()
+    pipeline.add('metadata', lambda stage: ran.append('metadata'))
+    pipeline.add('extract', lambda stage: None, depends=('download',))
+
+    with pytest.raises(ValueError, match='unknown stage download'):
+        pipeline.run()
+    assert not ran
+
+
+def test_progress_events_carry_the_stage_name():
+    events = []
+    lock = threading.Lock()
+
+    def report(stage):
+        for done in range(0, 101, 50):
+            stage.progress(done, 100)
+
+    def record(event):
+        with lock:
+            events.append((event.phase, event.done, event.total))
+
+    pipeline = scheduler.Scheduler()
+    pipeline.add('download', report)
+    pipeline.add('extract', report, depends=('download',))
+    pipeline.subscribe(record)
+    pipeline.run()
+
+    for name in ('download', 'extract'):
+        stage_events = [event[1:] for event in events if event[0] == name]
+        # The phase starts at zero and ends complete
+        assert stage_events[0] == (0, 0)
+        assert stage_events[-1] == (100, 100)
+    assert {event[0] for event in events} == {'download', 'extract'}
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+import benchmark
+
+pytest.importorskip('PyQt6')
+# The build step uses Qt itself
+import imagedata
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def image_assets(monkeypatch):
+    """Runs the build step generating image_assets.py, unless a build already did."""
+    monkeypatch.chdir(REPOSITORY)
+    if os.path.exists(imagedata.OUTPUT):
+        yield
+        return
+    imagedata.main()
+    yield
+    for path in (imagedata.OUTPUT, imagedata.SPLASH):
+        os.remove(path)
+
+
+def test_installer_window_starts_within_budget(image_assets):
+    timings = benchmark.run_startup(3)
+
+    assert timings is not None, "The installer did not start, see the warning logged above."
+    assert timings['window_total'] <= benchmark.STARTUP_BUDGET, \
+        f"Importing installer.py and showing its window took {timings['window_total']:.3f}s"
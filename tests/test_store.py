@@ -0,0 +1,81 @@
+import io
+import os
+import zipfile
+
+import engine
+import store
+import uninstaller
+
+
+PREFIX = 'lemonade-windows-msvc/'
+
+
+def _install(tmp_path, target, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(PREFIX + name, data)
+    archive_path = tmp_path / 'build.zip'
+    archive_path.write_bytes(buffer.getvalue())
+    engine.extract_artifact(str(archive_path), str(target))
+
+
+def _objects(directory):
+    return [os.path.join(folder.path, name) for folder in os.scandir(directory / store.OBJECTS_DIR)
+            for name in os.listdir(folder.path)]
+
+
+def test_installed_files_are_links_into_the_store(tmp_path):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target, {'lemonade-qt.exe': b'exe' * 1000, 'Qt6Core.dll': b'dll' * 1000})
+
+    objects = _objects(tmp_path / store.STORE_NAME)
+    assert len(objects) == 2
+    for name in ('lemonade-qt.exe', 'Qt6Core.dll'):
+        assert any(os.path.samefile(target / name, path) for path in objects)
+
+
+def test_other_channel_links_shared_files(tmp_path):
+    release, nightly = tmp_path / 'Lemonade', tmp_path / 'Lemonade Nightly'
+    _install(tmp_path, release, {'lemonade-qt.exe': b'release' * 1000, 'Qt6Core.dll': b'dll' * 1000})
+    _install(tmp_path, nightly, {'lemonade-qt.exe': b'nightly' * 1000, 'Qt6Core.dll': b'dll' * 1000})
+
+    assert os.path.samefile(release / 'Qt6Core.dll', nightly / 'Qt6Core.dll')
+    assert not os.path.samefile(release / 'lemonade-qt.exe', nightly / 'lemonade-qt.exe')
+    assert len(_objects(tmp_path / store.STORE_NAME)) == 3
+
+
+def test_gc_keeps_what_the_remaining_channel_uses(tmp_path):
+    release, nightly = tmp_path / 'Lemonade', tmp_path / 'Lemonade Nightly'
+    _install(tmp_path, release, {'lemonade-qt.exe': b'release' * 1000, 'Qt6Core.dll': b'dll' * 1000})
+    _install(tmp_path, nightly, {'lemonade-qt.exe': b'nightly' * 1000, 'Qt6Core.dll': b'dll' * 1000})
+
+    uninstaller.remove_installation(str(release))
+    freed = uninstaller.collect_garbage(str(release))
+
+    assert freed == len(b'release') * 1000
+    assert (nightly / 'Qt6Core.dll').read_bytes() == b'dll' * 1000
+    assert len(_objects(tmp_path / store.STORE_NAME)) == 2
+
+    uninstaller.remove_installation(str(nightly))
+    uninstaller.collect_garbage(str(nightly))
+
+    assert not os.path.exists(tmp_path / store.STORE_NAME)
+
+
+def test_file_modified_in_place_is_not_linked_into_the_other_channel(tmp_path):
+    release, nightly = tmp_path / 'Lemonade', tmp_path / 'Lemonade Nightly'
+    files = {'lemonade-qt.exe': b'exe' * 1000, 'qt-config.ini': b'[Paths]\nPrefix=.\n'}
+    _install(tmp_path, release, files)
+    # The program rewrites one of its shipped files at the same size, through the store's hard link
+    with open(release / 'qt-config.ini', 'r+b') as file:
+        file.write(b'[PATHS]')
+    status = os.stat(release / 'qt-config.ini')
+    os.utime(release / 'qt-config.ini', ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+
+    _install(tmp_path, nightly, files)
+
+    assert (nightly / 'qt-config.ini').read_bytes() == files['qt-config.ini']
+    assert (release / 'qt-config.ini').read_bytes().startswith(b'[PATHS]')
+    assert os.path.samefile(release / 'lemonade-qt.exe', nightly / 'lemonade-qt.exe')
+    assert not os.path.samefile(release / 'qt-config.ini', nightly / 'qt-config.ini')
@@ -0,0 +1,73 @@
+import os
+import threading
+
+import pytest
+
+import channels
+import engine
+import fake_github
+import progress
+import streaming
+
+KIB = 1024
+
+
+@pytest.fixture
+def usage(monkeypatch):
+    """Starts the peak buffer and scratch counters over for one test."""
+    monkeypatch.setattr(streaming, '_usage', {'buffered': 0, 'peak_buffered': 0, 'scratch': 0, 'peak_scratch': 0})
+
+
+def test_spill_buffer_stays_within_its_caps(usage, tmp_path):
+    data = os.urandom(4 * 1024 * KIB)
+    buffer = streaming.SpillBuffer(memory_cap=64 * KIB, scratch_cap=256 * KIB, directory=str(tmp_path))
+
+    def write():
+        for offset in range(0, len(data), 16 * KIB):
+            buffer.write(data[offset:offset + 16 * KIB])
+        buffer.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    received = []
+    # A reader slower than the writer, so the buffer fills up and spills
+    while chunk := buffer.read(8 * KIB):
+        received.append(chunk)
+    writer.join()
+
+    assert b''.join(received) == data
+    assert streaming.usage()['peak_buffered'] <= 64 * KIB
+    assert 0 < streaming.usage()['peak_scratch'] <= 256 * KIB
+
+
+def test_discarded_buffer_stops_its_writer(usage):
+    buffer = streaming.SpillBuffer(memory_cap=16 * KIB, scratch_cap=0)
+    buffer.write(bytes(16 * KIB))
+    buffer.discard()
+
+    with pytest.raises(streaming.Discarded):
+        buffer.write(bytes(KIB))
+    assert streaming.usage()['peak_scratch'] == 0
+
+
+@pytest.mark.parametrize('channel', channels.CHANNELS)
+def test_streamed_install_stays_within_the_caps(channel, usage, tmp_path, monkeypatch):
+    memory_cap, scratch_cap = 256 * KIB, 1024 * KIB
+    monkeypatch.setenv('LEMONADE_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(engine, 'STREAMING', True)
+    monkeypatch.setattr(engine, 'MEMORY_CAP', memory_cap)
+    monkeypatch.setattr(engine, 'SCRATCH_CAP', scratch_cap)
+    files = fake_github.synthetic_files(16 * 1024 * KIB, 40)
+    # Slower than the extraction, like a real link, so the buffer does not simply fill up
+    with fake_github.FakeGitHub(fake_github.synthetic_build(16 * 1024 * KIB, 40), rate=32 * 1024 * KIB) as fake:
+        monkeypatch.setattr(engine, 'RELEASES_API_URL', fake.releases_url)
+        monkeypatch.setattr(engine, 'NIGHTLY_URL', fake.nightly_url)
+        monkeypatch.setattr(engine, 'INSTALLER_RELEASES_API_URL', fake.installer_releases_url)
+        monkeypatch.setattr(engine, 'MIRRORS', [])
+        target = engine.install(channel, str(tmp_path / 'Lemonade'), False, False)
+
+    for name, data in files:
+        with open(os.path.join(target, *name.split('/')[1:]), 'rb') as file:
+            assert file.read() == data
+    assert streaming.usage()['peak_buffered'] <= max(memory_cap, progress.MAX_CHUNK_SIZE)
+    assert streaming.usage()['peak_scratch'] <= scratch_cap
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import engine
+import fake_github
+import tracing
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    """Enables tracing into a file for one test, without leaving it on or writing it again at exit."""
+    monkeypatch.setattr(tracing, '_tracer', None)
+    monkeypatch.setattr(tracing.atexit, 'register', lambda function: None)
+    return tracing.enable(str(tmp_path / 'trace.json'))
+
+
+def test_install_writes_a_trace_of_its_stages(tracer, tmp_path, monkeypatch):
+    monkeypatch.setenv('LEMONADE_CACHE_DIR', str(tmp_path / 'cache'))
+    build = fake_github.synthetic_build(1024 * 1024, 10)
+    with fake_github.FakeGitHub(build) as fake:
+        monkeypatch.setattr(engine, 'RELEASES_API_URL', fake.releases_url)
+        monkeypatch.setattr(engine, 'INSTALLER_RELEASES_API_URL', fake.installer_releases_url)
+        monkeypatch.setattr(engine, 'MIRRORS', [])
+        engine.install('release', str(tmp_path / 'Lemonade'), False, False)
+    tracing.write()
+
+    with open(tracer.path) as file:
+        trace = json.load(file)
+    events = trace['traceEvents']
+    assert all(event['ph'] in ('X', 'C', 'M') and 'pid' in event and 'tid' in event for event in events)
+    spans = [event for event in events if event['ph'] == 'X']
+    assert all(event['dur'] >= 0 and event['ts'] >= 0 for event in spans)
+    stages = {event['name'] for event in spans if event['cat'] == 'stage'}
+    assert stages == {'metadata', 'uninstaller', 'download', 'extract', 'register', 'shortcuts'}
+    assert [event['name'] for event in spans if event['cat'] == 'pipeline'] == ['install']
+    counters = {}
+    for event in events:
+        if event['ph'] == 'C':
+            counters[event['name']] = event['args'][event['name']]
+    assert counters['downloaded bytes'] == len(build)
+    assert counters['extracted bytes'] == sum(len(data) for _, data in fake_github.synthetic_files(1024 * 1024, 10))
+    assert any(event['ph'] == 'M' and event['name'] == 'thread_name' for event in events)
+
+
+def test_span_records_nothing_while_tracing_is_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, '_tracer', None)
+    monkeypatch.delenv(tracing.TRACE_ENV, raising=False)
+    monkeypatch.chdir(tmp_path)
+    tracing.enable_from_environment()
+
+    with tracing.span('extract', size=1) as span:
+        span.set(status=200)
+    tracing.add('extracted bytes', 1)
+    tracing.write()
+
+    assert span is tracing.span('download')
+    assert not tracing.enabled()
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,66 @@
+import os
+import sys
+import zipfile
+import subprocess
+
+import engine
+import manifest
+import staging
+import store
+import uninstaller
+
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILES = {'lemonade-qt.exe': b'exe' * 1000, 'Qt6Core.dll': b'dll' * 1000, 'plugins/platforms/qwindows.dll': b'qpa'}
+
+
+def _install(tmp_path, target):
+    archive_path = tmp_path / 'build.zip'
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in FILES.items():
+            archive.writestr('lemonade-windows-msvc/' + name, data)
+    engine.extract_artifact(str(archive_path), str(target))
+    (target / 'user' / 'shaders').mkdir(parents=True)
+    (target / 'user' / 'shaders' / 'cache.bin').write_bytes(b'shaders')
+    (target / 'log.txt').write_text('started')
+
+
+def test_keep_user_data_removes_only_installed_files(tmp_path):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target)
+
+    removed = uninstaller.remove_installation(str(target), keep_user_data=True)
+
+    assert removed == len(FILES) + 1
+    assert not os.path.exists(manifest.manifest_path(str(target)))
+    assert not (target / 'plugins').exists()
+    assert (target / 'user' / 'shaders' / 'cache.bin').read_bytes() == b'shaders'
+    assert (target / 'log.txt').read_text() == 'started'
+
+
+def test_removal_takes_staging_and_previous_along(tmp_path):
+    target = tmp_path / 'Lemonade'
+    _install(tmp_path, target)
+    for sibling in (staging.staging_path(str(target)), staging.previous_path(str(target))):
+        os.makedirs(os.path.join(sibling, 'plugins'))
+        with open(os.path.join(sibling, 'plugins', 'old.dll'), 'wb') as file:
+            file.write(b'old')
+
+    uninstaller.remove_installation(str(target))
+
+    # Only the store is left, the uninstaller collects its garbage afterwards
+    assert os.listdir(tmp_path) == [store.STORE_NAME]
+
+
+def test_keep_user_data_without_a_manifest_keeps_everything(tmp_path):
+    target = tmp_path / 'Lemonade'
+    (target / 'user').mkdir(parents=True)
+    (target / 'user' / 'config.ini').write_text('[UI]')
+
+    assert uninstaller.remove_installation(str(target), keep_user_data=True) == 0
+    assert (target / 'user' / 'config.ini').read_text() == '[UI]'
+
+
+def test_uninstaller_does_not_load_requests():
+    script = "import sys, uninstaller; sys.exit('requests' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', script], cwd=REPOSITORY).returncode == 0
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+
+# Path of the trace file to write; tracing is off when unset
+TRACE_ENV = 'LEMONADE_TRACE'
+# '1' also runs cProfile under every traced thread, written next to the trace as .pstats
+PROFILE_ENV = 'LEMONADE_PROFILE'
+# Seconds between two samples of the same counter, downloads and extraction count every chunk
+COUNTER_INTERVAL = 0.01
+
+_tracer = None
+
+
+class _NullSpan:
+    """What span() returns while tracing is off: entering and leaving it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region, recorded as a Chrome trace 'complete' event when it is left."""
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.profiler = None
+        self.start = None
+
+    def set(self, **args):
+        """Adds arguments known only once the span has run, such as a status code or a size."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.profiler = self.tracer.start_profile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        end = time.perf_counter()
+        if self.profiler:
+            self.tracer.stop_profile(self.profiler)
+        if kind is not None:
+            self.args['error'] = kind.__name__
+        self.tracer.complete(self.name, self.category, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans and counters from every thread and writes them in the Chrome
+    trace_event format, which chrome://tracing and https://ui.perfetto.dev open.
+
+    :param path: Trace file to write.
+    :param profile: Profile every thread while it is inside a span; the merged
+                    statistics go to the trace path with a .pstats extension.
+    """
+
+    def __init__(self, path, profile=False):
+        self.path = path
+        self.profile = profile
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        # Counter name: [total, time of the last sample]
+        self.counters = {}
+        self.threads = {}
+        self.profiles = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _timestamp(self, moment):
+        return round((moment - self.origin) * 1000000, 1)
+
+    def _append(self, event):
+        # Called with the lock held
+        thread_id = threading.get_ident()
+        if thread_id not in self.threads:
+            self.threads[thread_id] = threading.current_thread().name
+        event['pid'] = self.pid
+        event['tid'] = thread_id
+        self.events.append(event)
+
+    def complete(self, name, category, start, end, args):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': self._timestamp(start),
+                 'dur': round((end - start) * 1000000, 1)}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self._append(event)
+
+    def add(self, name, count):
+        now = time.perf_counter()
+        with self.lock:
+            counter = self.counters.setdefault(name, [0, None])
+            counter[0] += count
+            if counter[1] is not None and now - counter[1] < COUNTER_INTERVAL:
+                return
+            counter[1] = now
+            self._append({'name': name, 'ph': 'C', 'ts': self._timestamp(now), 'args': {name: counter[0]}})
+
+    def start_profile(self):
+        """Starts profiling the calling thread unless it is profiled already; returns the profiler or None."""
+        if not self.profile or getattr(self.local, 'profiling', False):
+            return None
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active, for example python -m cProfile
+            return None
+        self.local.profiling = True
+        return profiler
+
+    def stop_profile(self, profiler):
+        profiler.disable()
+        self.local.profiling = False
+        with self.lock:
+            self.profiles.append(profiler)
+
+    def profile_path(self):
+        return os.path.splitext(self.path)[0] + '.pstats'
+
+    def write(self):
+        """Writes everything recorded so far; may be called more than once."""
+        now = time.perf_counter()
+        with self.lock:
+            events = list(self.events)
+            # The last sample of a counter may have been skipped by COUNTER_INTERVAL
+            for name, (total, _) in self.counters.items():
+                events.append({'name': name, 'ph': 'C', 'ts': self._timestamp(now), 'pid': self.pid,
+                               'tid': threading.get_ident(), 'args': {name: total}})
+            events += [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread_id, 'args': {'name': name}}
+                       for thread_id, name in self.threads.items()]
+            profiles = list(self.profiles)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        os.replace(temp_path, self.path)
+        logging.info(f"Wrote {len(events)} trace events to {self.path}.")
+        if profiles:
+            import pstats
+
+            stats = pstats.Stats(profiles[0])
+            for profiler in profiles[1:]:
+                stats.add(profiler)
+            stats.dump_stats(self.profile_path())
+            logging.info(f"Wrote profile to {self.profile_path()}.")
+
+
+def enable(path, profile=False):
+    """
+    Starts recording to path; the file is written at exit, or earlier with write().
+
+    :param profile: Also capture cProfile statistics, see Tracer.
+    """
+    global _tracer
+    _tracer = Tracer(path, profile)
+    atexit.register(_tracer.write)
+    return _tracer
+
+
+def enable_from_environment():
+    """Enables tracing when LEMONADE_TRACE names a trace file, with cProfile when LEMONADE_PROFILE is 1."""
+    path = os.environ.get(TRACE_ENV)
+    if path and _tracer is None:
+        enable(path, os.environ.get(PROFILE_ENV) == '1')
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, category='install', **args):
+    """
+    Times a region: `with tracing.span('extract', size=size):`. While tracing is off
+    this returns a shared object whose enter and exit do nothing.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, category, args)
+
+
+def add(name, count):
+    """Adds count to the counter name, e.g. bytes downloaded; a no-op while tracing is off."""
+    if _tracer is not None:
+        _tracer.add(name, count)
+
+
+def write():
+    if _tracer is not None:
+        _tracer.write()
@@ -1,61 +1,242 @@
 import os
-import shutil
-import winreg as reg
 import sys
+import stat
+import shutil
+import logging
+import argparse
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import channels
+import manifest
+import store
+import tracing
+
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Paths handed to a worker at once, so 100k files do not mean 100k futures
+BATCH_SIZE = 256
+# Left next to the installation by interrupted or --keep-previous updates
+SIBLING_SUFFIXES = ('.staging', '.previous')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Remove Lemonade.")
+    parser.add_argument('--channel', choices=channels.CHANNELS, default='release',
+                        help="installation to remove (default: release)")
+    parser.add_argument('--target', default=None,
+                        help="installation directory (default: the channel's folder in %%LOCALAPPDATA%%)")
+    parser.add_argument('--keep-user-data', action='store_true',
+                        help="only remove the files the installer put there, keep shader caches, logs and saves")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="number of files deleted in parallel")
+    return parser.parse_args(argv)
+
+
+def scan_tree(directory, skip=()):
+    """
+    Lists everything below directory with os.scandir, using the entry types the
+    directory listing already returned instead of one stat call per entry.
+    Symlinks are listed as files and never followed.
+
+    :param skip: Normalised paths to leave alone.
+    :return: (file paths, directory paths), directories deepest first.
+    """
+    files = []
+    directories = []
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        directories.append(current)
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if skip and os.path.normpath(entry.path) in skip:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    else:
+                        files.append(entry.path)
+        except OSError as e:
+            logging.error(f'Failed to list {current}. Reason: {e}')
+    # Parents are always found before their children, reversing puts children first
+    directories.reverse()
+    return files, directories
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return False
+    except PermissionError:
+        # Read-only files cannot be deleted on Windows until the attribute is cleared
+        os.chmod(path, stat.S_IWRITE)
+        os.unlink(path)
+    return True
+
+
+def _remove_batch(paths):
+    removed = 0
+    for path in paths:
+        try:
+            removed += _unlink(path)
+        except OSError as e:
+            logging.error(f'Failed to delete {path}. Reason: {e}')
+    return removed
+
 
+def remove_files(paths, workers=DEFAULT_WORKERS):
+    """
+    Deletes files on a bounded thread pool; deletion is mostly waiting on the file system.
 
-# Paths to the shortcuts
-desktop_shortcut = os.path.join(os.environ['USERPROFILE'], 'Desktop', 'Lemonade.lnk')
-start_menu_shortcut = os.path.join(os.environ['APPDATA'], 'Microsoft', 'Windows', 'Start Menu', 'Programs', 'Lemonade.lnk')
+    :return: Number of files removed.
+    """
+    batches = [paths[index:index + BATCH_SIZE] for index in range(0, len(paths), BATCH_SIZE)]
+    if workers <= 1 or len(batches) <= 1:
+        return sum(_remove_batch(batch) for batch in batches)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_remove_batch, batches))
 
-# Remove the desktop shortcut if it exists
-if os.path.exists(desktop_shortcut):
-    os.remove(desktop_shortcut)
 
-# Remove the start menu shortcut if it exists
-if os.path.exists(start_menu_shortcut):
-    os.remove(start_menu_shortcut)
+def remove_empty_directories(directories):
+    """Removes the given directories, deepest first, skipping those that still hold something."""
+    for directory in sorted(set(directories), key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
 
 
-# Construct the path to the application directory dynamically
-application_directory = os.path.join(os.environ['LOCALAPPDATA'], 'Lemonade')
+def _installed_paths(directory, files):
+    # Plain string operations, os.path.join is the slowest part with 100k entries
+    prefix = directory + os.sep
+    paths = [prefix + name.replace('/', os.sep) for name in files]
+    parents = set()
+    for name in files:
+        parent = name.rpartition('/')[0]
+        # Once a folder is known, so are all of its parents
+        while parent and parent not in parents:
+            parents.add(parent)
+            parent = parent.rpartition('/')[0]
+    return paths, [prefix + parent.replace('/', os.sep) for parent in parents]
 
-# Function to delete contents of the application directory except the uninstaller
-def delete_contents(dir_path, skip_file):
-    for item in os.listdir(dir_path):
-        item_path = os.path.join(dir_path, item)
-        if item_path == skip_file:
-            continue  # Skip the uninstaller executable
-        if os.path.isfile(item_path) or os.path.islink(item_path):
-            os.unlink(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
 
-# Remove the application directory contents except the uninstaller
-uninstaller_path = sys.executable
-if os.path.exists(application_directory):
-    delete_contents(application_directory, uninstaller_path)
+def remove_installation(directory, keep_user_data=False, workers=DEFAULT_WORKERS, skip=()):
+    """
+    Removes an installation. The files listed in its install manifest are deleted
+    by name; everything else in the directory is user data (shader caches, logs,
+    saves) and is deleted as well unless keep_user_data is set.
 
+    Without a manifest installed files cannot be told apart from user data, so
+    the whole directory goes, or nothing when keep_user_data is set.
+
+    :param directory: Installation directory.
+    :param keep_user_data: Only delete what the installer put there.
+    :param workers: Number of threads deleting files.
+    :param skip: Paths to leave alone, such as the running uninstaller.
+    :return: Number of files removed.
+    """
+    directory = os.path.normpath(directory)
+    if not os.path.isdir(directory):
+        return 0
+    skip = {os.path.normpath(path) for path in skip}
+    installed = manifest.load(directory)
+    removed = 0
+    if installed is not None:
+        paths, parents = _installed_paths(directory, installed)
+        # The manifest goes last, so an interrupted uninstall can be run again
+        removed += remove_files([path for path in paths if path not in skip], workers)
+        removed += _unlink(manifest.manifest_path(directory))
+        remove_empty_directories(parents)
+    elif keep_user_data:
+        logging.warning(f"No install manifest in {directory}, keeping everything since user data cannot be told apart.")
+        return removed
+
+    if not keep_user_data:
+        for suffix in SIBLING_SUFFIXES:
+            sibling = directory + suffix
+            if os.path.isdir(sibling):
+                files, directories = scan_tree(sibling)
+                remove_files(files, workers)
+                remove_empty_directories(directories)
+        files, directories = scan_tree(directory, skip)
+        removed += remove_files(files, workers)
+        remove_empty_directories(directories)
+    remove_empty_directories([directory])
+    logging.info(f"Removed {removed} files from {directory}.")
+    return removed
+
+
+def collect_garbage(target):
+    """Drops the files of the shared store that no remaining installation links to."""
+    directory = store.store_dir(target)
+    if not os.path.isdir(directory):
+        return 0
+    with store.FileStore(directory) as file_store:
+        freed = file_store.gc()
+        empty = file_store.is_empty()
+    if empty:
+        # The last installation using the store is gone
+        shutil.rmtree(directory, ignore_errors=True)
+    return freed
+
+
+def remove_shortcuts(channel='release'):
+    for shortcut in (channels.desktop_shortcut_path(channel), channels.start_menu_shortcut_path(channel)):
+        if os.path.exists(shortcut):
+            os.remove(shortcut)
+
+
+def remove_registry_entry(channel='release'):
+    import winreg as reg
+
+    try:
+        reg.DeleteKey(reg.HKEY_CURRENT_USER, channels.uninstall_key(channel))
+    except FileNotFoundError:
+        pass
 
-# Remove the registry entry
-key_path = r"Software\Microsoft\Windows\CurrentVersion\Uninstall\Lemonade"
-reg.DeleteKey(reg.HKEY_CURRENT_USER, key_path)
 
 # Function to create a batch script for self-deletion
-def create_self_deletion_script():
+def create_self_deletion_script(remove_directory=True):
     # Temporary file for the batch script
     fd, batch_script = tempfile.mkstemp(suffix='.bat', text=True)
     with os.fdopen(fd, 'w') as batch:
         batch.write(f"@echo off\n")
         batch.write(f"timeout /t 5 /nobreak > NUL\n")  # Wait for 5 seconds to ensure the uninstaller has terminated
         batch.write(f"del /f /q \"{sys.executable}\"\n")  # Delete the uninstaller executable
-        batch.write(f"rmdir /s /q \"{os.path.dirname(sys.executable)}\"\n")  # Delete the uninstaller's directory
+        if remove_directory:
+            batch.write(f"rmdir /s /q \"{os.path.dirname(sys.executable)}\"\n")  # Delete the uninstaller's directory
         batch.write(f"del \"%~f0\"\n")  # Delete the batch script itself
     return batch_script
 
-# Schedule the uninstaller and its directory for deletion
-batch_script = create_self_deletion_script()
-os.system(batch_script)
 
-print("Uninstallation Complete. The system will now clean up.")
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    tracing.enable_from_environment()
+    target = args.target or channels.default_install_dir(args.channel)
+    # Only the bundled uninstaller lives in the installation, a script run would find python.exe here
+    frozen = getattr(sys, 'frozen', False)
+    skip = (sys.executable,) if frozen else ()
+
+    if os.name == 'nt':
+        remove_shortcuts(args.channel)
+    with tracing.span('remove installation', 'uninstall'):
+        remove_installation(target, args.keep_user_data, args.workers, skip)
+    # The other channel may still share files with this one, only unreferenced ones go
+    with tracing.span('store gc', 'uninstall'):
+        collect_garbage(target)
+    if os.name == 'nt':
+        remove_registry_entry(args.channel)
+
+    # Schedule the uninstaller and its directory for deletion, the directory only when nothing is kept in it
+    if frozen and os.name == 'nt':
+        os.system(create_self_deletion_script(remove_directory=not args.keep_user_data))
+
+    print("Uninstallation Complete. The system will now clean up.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())